@@ -21,15 +21,160 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str = os.environ.get("POSTGRES_PASSWORD", "123456")
     POSTGRES_DB: str = os.environ.get("POSTGRES_DB", "ai_report_system")
     DATABASE_URL: str = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_SERVER}/{POSTGRES_DB}"
+    # 接口使用的异步连接串，为空时由 DATABASE_URL 换成异步驱动（PostgreSQL 用 asyncpg，SQLite 用 aiosqlite）
+    ASYNC_DATABASE_URL: Optional[str] = None
+    # 数据库连接池配置，同步、异步引擎各自一个连接池；
+    # 每个进程最多占用 2 × (DB_POOL_SIZE + DB_MAX_OVERFLOW) 个连接，多个 uvicorn worker 时需乘以 worker 数，不能超过 PostgreSQL 的 max_connections
+    DB_POOL_SIZE: int = 5  # 常驻连接数
+    DB_MAX_OVERFLOW: int = 10  # 繁忙时允许额外创建的连接数
+    DB_POOL_TIMEOUT: float = 30  # 连接耗尽时等待空闲连接的秒数，超时抛出异常
+    DB_POOL_RECYCLE: int = 1800  # 连接使用超过该秒数后重建，避免被数据库或中间件断开；-1 表示不回收
+    DB_POOL_PRE_PING: bool = True  # 每次取连接前先探测是否可用，多一次往返；已配置回收且网络稳定时可关闭
+    DB_POOL_WAIT_WARNING_SECONDS: float = 1.0  # 取连接等待超过该秒数时记录警告，提示连接池偏小
     
     # JWT认证配置
     JWT_SECRET: str = os.environ.get("JWT_SECRET", "YOUR_SECRET_KEY_HERE")
     JWT_ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24  # 1 天
+    # 已认证用户缓存：按令牌中的用户名缓存用户记录，省去每个请求查询一次用户表；
+    # 本进程内修改、停用用户时立即失效，其他进程（多个 worker）最迟在 TTL 后生效；TTL 为0表示不缓存
+    AUTH_USER_CACHE_TTL_SECONDS: int = 30
+    AUTH_USER_CACHE_MAX_ENTRIES: int = 10000
+    # 密码哈希：bcrypt 计算在独立的线程池中进行，不阻塞事件循环；修改成本因子后，用户下次登录时自动按新成本重新哈希
+    PASSWORD_BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 4  # 同时进行的哈希计算数，超出的排队等待
+    # 登录限流：同一账号在时间窗口内的失败次数、同一IP在时间窗口内的登录次数超过上限时返回429；为0表示不限制
+    # 机房学生通常共用出口IP，IP上限需按班级规模设置
+    LOGIN_THROTTLE_WINDOW_SECONDS: int = 300
+    LOGIN_THROTTLE_ACCOUNT_FAILURES: int = 5
+    LOGIN_THROTTLE_IP_ATTEMPTS: int = 200
+    # 批量导入学生名单：单次最多行数；密码哈希使用单独的线程池，导入期间不占用登录验证的线程
+    ROSTER_IMPORT_MAX_ROWS: int = 2000
+    ROSTER_IMPORT_HASH_WORKERS: int = os.cpu_count() or 4  # 默认每个CPU核心一个线程，bcrypt 计算时释放GIL，可以并行
     
+    # 模型服务提供方：dashscope 通义千问；local OpenAI兼容的本地服务（Ollama/vLLM/llama.cpp）；
+    # stub 进程内确定性桩模型（压测和CI使用，不访问网络）
+    LLM_PROVIDER: str = "dashscope"
+    LLM_REQUEST_PROVIDERS: list = ["dashscope", "local"]  # 允许请求中指定的提供方
+    LLM_MAX_TOKENS: int = 4000
+    LLM_TEMPERATURE: float = 0.7
+    LLM_TOP_P: float = 0.8
+    LLM_MAX_RETRIES: int = 3  # 429/5xx/连接错误的最大重试次数，读取超时不重试
+    LLM_RETRY_BACKOFF_BASE: float = 1.0  # 指数退避基数（秒）
+    LLM_RETRY_BACKOFF_MAX: float = 30.0  # 单次退避上限（秒）
+
     # 通义千问API配置
     QWEN_API_KEY: str = os.environ.get("QWEN_API_KEY", "sk-68d5ae53963644de917adc922a07e95e")
     QWEN_API_URL: str = "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation"
+    QWEN_MODEL: str = "qwen-max-latest"
+    QWEN_REQUESTS_PER_MINUTE: int = 60  # 每分钟请求数额度，0表示不限制
+    QWEN_TOKENS_PER_MINUTE: int = 200000  # 每分钟令牌数额度，0表示不限制
+
+    # 本地模型服务配置（OpenAI兼容接口）
+    LOCAL_LLM_BASE_URL: str = "http://localhost:11434/v1"
+    LOCAL_LLM_MODEL: str = "qwen2.5:7b"
+    LOCAL_LLM_API_KEY: str = ""
+    LOCAL_LLM_REQUESTS_PER_MINUTE: int = 0
+    LOCAL_LLM_TOKENS_PER_MINUTE: int = 0
+
+    # 熔断：连续失败达到阈值后熔断，冷却期内直接拒绝调用而不等待超时；阈值为0表示不熔断
+    CIRCUIT_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_RECOVERY_SECONDS: float = 30.0  # 熔断后多久放行探测调用
+    CIRCUIT_HALF_OPEN_MAX_CALLS: int = 1  # 半开状态同时放行的探测调用数
+    # 降级：熔断时依次尝试的方案，cache 为相同提示词最近一次成功的生成结果（忽略过期时间和强制重新生成），
+    # 其他值为提供方名称（如 local）；为空时直接返回503
+    LLM_DEGRADED_FALLBACKS: list = []
+
+    # 对冲请求：主提供方超过近期耗时分位数仍无输出时，向备用提供方发送同样的请求，先完成者胜出，另一方取消
+    HEDGE_ROUTES: list = []  # 启用对冲的路由：generate、generate_stream、batch
+    HEDGE_PROVIDER: str = "local"  # 备用提供方，可与主提供方相同（重发到同一服务）
+    HEDGE_PERCENTILE: float = 95  # 对冲延迟取主提供方近期耗时（流式为首个片段耗时）的分位数
+    HEDGE_WINDOW: int = 200  # 参与计算的最近调用数
+    HEDGE_MIN_SAMPLES: int = 20  # 样本不足时使用 HEDGE_DEFAULT_DELAY
+    HEDGE_DEFAULT_DELAY: float = 60.0
+    HEDGE_MIN_DELAY: float = 5.0  # 对冲延迟下限，避免请求量翻倍
+
+    # 桩模型配置
+    STUB_LLM_LATENCY: float = 0.0  # 模拟的生成耗时（秒）
+    STUB_LLM_OUTPUT_CHARS: int = 1500
+
+    # 向量化（Embedding）配置
+    EMBEDDING_PROVIDER: Optional[str] = None  # 为空时与 LLM_PROVIDER 相同
+    EMBEDDING_DIM: int = 1536  # 向量维度，需与向量模型输出一致
+    EMBEDDING_BATCH_SIZE: int = 16  # 单次向量化请求的文本条数（DashScope上限25）
+    QWEN_EMBEDDING_URL: str = "https://dashscope.aliyuncs.com/api/v1/services/embeddings/text-embedding/text-embedding"
+    QWEN_EMBEDDING_MODEL: str = "text-embedding-v2"
+    LOCAL_EMBEDDING_MODEL: str = "nomic-embed-text"
+
+    # 知识库检索（RAG）配置
+    RAG_ENABLED: bool = True
+    RAG_TOP_K: int = 4
+    RAG_MIN_SCORE: float = 0.3  # 余弦相似度下限，低于此值的片段不注入提示词
+    RAG_MAX_TOKENS: int = 1500  # 参考资料在提示词中的令牌预算
+    RAG_CHUNK_TOKENS: int = 400  # 切片长度
+    RAG_CHUNK_OVERLAP: int = 50  # 相邻切片重叠的令牌数
+    VECTOR_BACKEND: str = "auto"  # auto 有pgvector扩展时使用，否则退回NumPy暴力检索；numpy 强制使用NumPy
+    VECTOR_INDEX_TYPE: str = "hnsw"  # hnsw 或 ivfflat
+    VECTOR_HNSW_M: int = 16
+    VECTOR_HNSW_EF_CONSTRUCTION: int = 64
+    VECTOR_HNSW_EF_SEARCH: int = 40
+    VECTOR_IVFFLAT_LISTS: int = 100  # 建议约为 行数/1000
+    VECTOR_IVFFLAT_PROBES: int = 10
+
+    # 知识库后台索引配置
+    KNOWLEDGE_INDEXER_ENABLED: bool = True  # 任务书和范例报告提交后自动增量索引
+    KNOWLEDGE_INDEXER_BATCH_SIZE: int = 32  # 每批最多处理的来源数
+    KNOWLEDGE_INDEXER_FLUSH_SECONDS: float = 2.0  # 合并提交的等待时间
+    KNOWLEDGE_INDEX_ALL_REPORTS: bool = False  # 为真时所有新报告都入库，否则只更新教师认可的范例报告
+
+    # 报告查重配置（MinHash + LSH），修改后需运行 scripts/build_report_signatures.py --all 重建签名
+    DUPLICATE_SHINGLE_SIZE: int = 5  # 字符 n-gram 长度
+    DUPLICATE_NUM_PERM: int = 128  # 签名长度
+    DUPLICATE_LSH_BANDS: int = 16  # 分段数，相似度约高于 (1/段数)^(段数/签名长度) 的报告成为候选
+    DUPLICATE_THRESHOLD: float = 0.7  # 默认相似度阈值
+
+    # 重复请求合并与幂等配置
+    REQUEST_COALESCING_ENABLED: bool = True  # 相同的并发生成请求共享一次模型调用和一份报告
+    IDEMPOTENCY_TTL_SECONDS: int = 3600  # Idempotency-Key 的有效窗口
+    IDEMPOTENCY_MAX_KEYS: int = 10000
+
+    # 报告生成模式：single 一次生成全文；sections 五个部分并发生成；agents 提纲-撰写-审阅-排版多阶段生成
+    REPORT_GENERATION_MODE: str = "single"
+
+    # agents 模式各阶段预算：生成令牌上限和超时秒数，超时或失败时降级
+    AGENT_OUTLINE_MAX_TOKENS: int = 800
+    AGENT_OUTLINE_TIMEOUT: float = 60
+    AGENT_DRAFT_MAX_TOKENS: int = 1500
+    AGENT_DRAFT_TIMEOUT: float = 120
+    AGENT_REVIEW_ENABLED: bool = True
+    AGENT_REVIEW_MAX_TOKENS: int = 1500
+    AGENT_REVIEW_TIMEOUT: float = 90
+
+    # 提示词配置
+    PROMPT_MAX_TOKENS: int = 6000  # 提示词令牌预算，任务描述和模板内容超出时截断
+    PROMPT_TOKENIZER: str = "cl100k_base"  # tiktoken编码名称，未安装tiktoken时按字符估算
+
+    # 生成结果缓存配置
+    GENERATION_CACHE_ENABLED: bool = True
+    GENERATION_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    GENERATION_CACHE_MEMORY_ENTRIES: int = 256  # 进程内LRU条目上限
+    GENERATION_CACHE_DB_ENTRIES: int = 10000  # 数据库缓存表条目上限
+
+    # 模型服务HTTP连接池配置
+    LLM_TIMEOUT: float = 120  # 单次请求超时（秒）
+    LLM_CONNECT_TIMEOUT: float = 10
+    LLM_MAX_CONNECTIONS: int = 20
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    LLM_KEEPALIVE_EXPIRY: float = 60  # 空闲连接保留时间（秒）
+    LLM_HTTP2: bool = True  # 需要安装h2，未安装时自动回退HTTP/1.1
+
+    # 报告生成任务队列配置
+    REPORT_WORKER_COUNT: int = 4  # 并发生成的工作协程数
+    REPORT_QUEUE_MAXSIZE: int = 200  # 排队任务上限，超出返回503
+    REPORT_JOB_TTL_SECONDS: int = 3600  # 已完成任务的保留时间
+    REPORT_JOB_ABANDON_SECONDS: int = 60  # 超过该时间未查询进度的任务视为客户端已离开并取消，0表示不取消
+    REPORT_BATCH_CONCURRENCY: int = 8  # 批量生成默认并发数
+    REPORT_BATCH_MAX_CONCURRENCY: int = 32
     
     # CORS配置
     CORS_ORIGINS: list = ["*"]
@@ -1,22 +1,153 @@
-from sqlalchemy import create_engine, inspect
+from sqlalchemy import create_engine, event, inspect, make_url, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from typing import Any, Callable, Union
+import functools
 import logging
+import time
 
 from .config import settings
+from .utils.metrics import registry
 
 logger = logging.getLogger(__name__)
 
-# 创建数据库引擎
+# 同步驱动对应的异步驱动
+_ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def async_database_url(url: str) -> str:
+    """把同步连接串换成对应的异步驱动，已经是异步驱动时原样返回"""
+    scheme, separator, rest = url.partition("://")
+    dialect = scheme.split("+")[0]
+    if dialect not in _ASYNC_DRIVERS or scheme == _ASYNC_DRIVERS[dialect]:
+        return url
+    return _ASYNC_DRIVERS[dialect] + separator + rest
+
+
+# 连接池指标
+db_pool_checked_out = registry.gauge(
+    "db_pool_checked_out", "已借出的数据库连接数", ("engine",)
+)
+db_pool_overflow = registry.gauge(
+    "db_pool_overflow", "超出常驻连接数额外创建的连接数", ("engine",)
+)
+db_pool_checkout_wait_seconds = registry.histogram(
+    "db_pool_checkout_wait_seconds",
+    "从连接池取得连接的等待时间（秒），包括新建连接的耗时",
+    ("engine",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+
+class _MeteredPool:
+    """在连接池取出、归还连接时更新连接池指标，取连接等待过久时记录警告"""
+    engine_name = ""
+
+    def _update_gauges(self):
+        db_pool_checked_out.set(self.checkedout(), engine=self.engine_name)
+        db_pool_overflow.set(max(0, self.overflow()), engine=self.engine_name)
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            db_pool_checkout_wait_seconds.observe(waited, engine=self.engine_name)
+            self._update_gauges()
+            if waited > settings.DB_POOL_WAIT_WARNING_SECONDS:
+                logger.warning(
+                    f"{self.engine_name}连接池取连接等待{waited:.2f}秒，"
+                    f"已借出{self.checkedout()}个连接，请考虑调大 DB_POOL_SIZE / DB_MAX_OVERFLOW"
+                )
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        self._update_gauges()
+
+
+def _pool_options(url: str, name: str, base: type) -> dict:
+    """按配置生成连接池参数；SQLite 内存库使用单连接池，保持默认"""
+    options = {"pool_pre_ping": settings.DB_POOL_PRE_PING}
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return options
+    options.update(
+        poolclass=type(f"Metered{base.__name__}", (_MeteredPool, base), {"engine_name": name}),
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE
+    )
+    return options
+
+
+# 创建数据库引擎：同步引擎供后台脚本和迁移使用，接口使用异步引擎
+_async_url = settings.ASYNC_DATABASE_URL or async_database_url(settings.DATABASE_URL)
 engine = create_engine(
     settings.DATABASE_URL,
     echo=settings.DEBUG,
-    pool_pre_ping=True  # 自动检测连接是否有效
+    **_pool_options(settings.DATABASE_URL, "sync", QueuePool)
+)
+async_engine = create_async_engine(
+    _async_url,
+    echo=settings.DEBUG,
+    **_pool_options(_async_url, "async", AsyncAdaptedQueuePool)
 )
 
+
+# 数据库耗时指标
+db_query_duration_seconds = registry.histogram(
+    "db_query_duration_seconds",
+    "数据库语句执行耗时（秒）",
+    ("operation",),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+db_errors_total = registry.counter("db_errors_total", "数据库语句执行失败次数", ("operation",))
+
+_OPERATIONS = {"select", "insert", "update", "delete"}
+
+
+def _operation(statement: str) -> str:
+    """语句类型，用作指标标签（限定取值避免标签膨胀）"""
+    words = (statement or "").split(None, 1)
+    operation = words[0].lower() if words else ""
+    return operation if operation in _OPERATIONS else "other"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info["query_start_time"].pop()
+    db_query_duration_seconds.observe(time.perf_counter() - start, operation=_operation(statement))
+
+
+def _handle_error(context):
+    conn = context.connection
+    if conn is not None and conn.info.get("query_start_time"):
+        conn.info["query_start_time"].pop()
+    db_errors_total.inc(operation=_operation(context.statement))
+
+
+# 异步引擎的事件挂在其内部的同步引擎上
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(_engine, "handle_error", _handle_error)
+
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 异步会话工厂：内部同步会话与 SessionLocal 同类，注册在 SessionLocal 上的会话事件（查重签名、知识库索引）同样生效；
+# 提交后不过期对象，避免在事件循环中触发隐式加载
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False, sync_session_class=SessionLocal.class_
+)
+
 # 创建基类
 Base = declarative_base()
 
@@ -28,6 +159,25 @@ def get_db():
     finally:
         db.close()
 
+# 依赖项：获取异步数据库会话，查询期间不阻塞事件循环
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# 在同步或异步会话上执行基于同步会话编写的数据库操作，异步会话通过 run_sync 执行，不阻塞事件循环
+async def run_db(db: Union[Session, AsyncSession], fn: Callable[..., Any], *args) -> Any:
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args)
+    return fn(db, *args)
+
+async def release_connection(db: Union[Session, AsyncSession]):
+    """结束会话当前的只读事务，把连接归还连接池；已加载的对象仍可使用，之后访问数据库时自动开启新事务。
+    在模型调用等耗时操作之前调用，避免连接在整个调用期间处于 idle in transaction 状态占满连接池"""
+    if isinstance(db, AsyncSession):
+        await db.commit()
+    else:
+        db.commit()
+
 # 检查数据库连接
 def check_db_connection():
     try:
@@ -38,3 +188,23 @@ def check_db_connection():
     except Exception as e:
         logger.error(f"数据库连接失败: {str(e)}")
         return False
+
+# 检查pgvector扩展是否可用（结果缓存，决定向量字段类型和检索方式）
+@functools.lru_cache(maxsize=None)
+def vector_extension_available() -> bool:
+    if settings.VECTOR_BACKEND == "numpy" or engine.dialect.name != "postgresql":
+        return False
+    try:
+        import pgvector.sqlalchemy  # noqa: F401
+    except ImportError:
+        logger.warning("未安装pgvector，知识库检索使用NumPy暴力检索")
+        return False
+    try:
+        with engine.begin() as conn:
+            installed = conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'vector'")).first()
+            if not installed:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        return True
+    except Exception as e:
+        logger.warning(f"数据库未启用vector扩展，知识库检索使用NumPy暴力检索: {str(e)}")
+        return False
@@ -1,5 +1,5 @@
 import logging
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import sys
@@ -9,8 +9,15 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from .config import settings
-from .database import Base, engine, check_db_connection
-from .routers import auth, users, tasks, templates, reports
+from .database import Base, async_engine, engine, check_db_connection
+from .routers import auth, users, tasks, templates, reports, knowledge
+from .services.report_jobs import report_job_manager
+from .services.http_client import init_http_client, close_http_client
+from .services.knowledge_base import ensure_vector_index
+from .services.knowledge_indexer import knowledge_indexer
+from .services.llm_providers import circuit_states
+from .utils.metrics import registry
+from .utils.pagination import NEXT_CURSOR_HEADER
 
 # 配置日志
 logging.basicConfig(
@@ -31,6 +38,7 @@ if not check_db_connection():
 
 # 创建表
 Base.metadata.create_all(bind=engine)
+ensure_vector_index()
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -46,6 +54,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 # 注册路由
@@ -54,6 +63,22 @@ app.include_router(users.router)
 app.include_router(tasks.router)
 app.include_router(templates.router)
 app.include_router(reports.router)
+app.include_router(knowledge.router)
+
+@app.on_event("startup")
+async def startup():
+    """创建共享的模型服务客户端，启动报告生成队列和知识库后台索引"""
+    init_http_client()
+    await report_job_manager.start()
+    await knowledge_indexer.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    """停止报告生成队列和知识库后台索引，关闭模型服务客户端和异步数据库连接池"""
+    await knowledge_indexer.stop()
+    await report_job_manager.stop()
+    await close_http_client()
+    await async_engine.dispose()
 
 @app.get("/")
 async def root():
@@ -61,10 +86,18 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """健康检查"""
+    """健康检查，同时返回各模型服务的熔断器状态；熔断时服务仍可用，状态为 degraded"""
     if not check_db_connection():
         raise HTTPException(status_code=500, detail="数据库连接失败")
-    return {"status": "healthy"}
+    circuits = circuit_states()
+    degraded = any(state["state"] != "closed" for state in circuits.values())
+    return {"status": "degraded" if degraded else "healthy", "llm": circuits}
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus指标"""
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/api/config-test")
@@ -2,3 +2,6 @@ from .user import User
 from .task import Task
 from .report import Report
 from .template import Template
+from .generation_cache import GenerationCacheEntry
+from .knowledge import KnowledgeChunk
+from .similarity import ReportSignature, ReportLshBand
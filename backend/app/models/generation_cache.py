@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime
+import datetime
+
+from ..database import Base
+
+class GenerationCacheEntry(Base):
+    __tablename__ = "generation_cache"
+    
+    key = Column(String(64), primary_key=True)  # 提示词与模型参数的SHA-256
+    model = Column(String(100), nullable=False)
+    content = Column(Text, nullable=False)
+    hit_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
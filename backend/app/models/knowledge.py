@@ -0,0 +1,56 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, LargeBinary, Index
+from sqlalchemy.types import TypeDecorator
+import datetime
+import numpy as np
+
+from ..config import settings
+from ..database import Base, vector_extension_available
+
+
+def _use_pgvector(dialect) -> bool:
+    return dialect.name == "postgresql" and vector_extension_available()
+
+
+class EmbeddingType(TypeDecorator):
+    """向量字段：数据库启用pgvector时为vector类型，否则以float32字节存储"""
+    impl = LargeBinary
+    cache_ok = True
+
+    def __init__(self, dim: int):
+        super().__init__()
+        self.dim = dim
+
+    def load_dialect_impl(self, dialect):
+        if _use_pgvector(dialect):
+            from pgvector.sqlalchemy import Vector
+            return dialect.type_descriptor(Vector(self.dim))
+        return dialect.type_descriptor(LargeBinary())
+
+    def process_bind_param(self, value, dialect):
+        if value is None or _use_pgvector(dialect):
+            return value
+        return np.asarray(value, dtype=np.float32).tobytes()
+
+    def process_result_value(self, value, dialect):
+        if value is None or _use_pgvector(dialect):
+            return value
+        return np.frombuffer(value, dtype=np.float32)
+
+
+class KnowledgeChunk(Base):
+    __tablename__ = "knowledge_chunks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source_type = Column(String(20), nullable=False)  # manual 实训手册；task 任务书；report 范例报告
+    source_key = Column(String(255), nullable=False)  # 任务/报告ID或手册文件名
+    title = Column(String(255), nullable=False)
+    chunk_index = Column(Integer, nullable=False, default=0)
+    content = Column(Text, nullable=False)
+    token_count = Column(Integer, nullable=False, default=0)
+    content_hash = Column(String(64), nullable=True, index=True)  # 向量模型+标题+切片内容的SHA-256，相同内容复用已有向量
+    embedding = Column(EmbeddingType(settings.EMBEDDING_DIM), nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_knowledge_chunks_source", "source_type", "source_key"),
+    )
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean, Index
+from sqlalchemy.orm import query_expression, relationship
 import datetime
 
 from ..database import Base
@@ -13,10 +13,21 @@ class Report(Base):
     task_id = Column(Integer, ForeignKey("tasks.id"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     template_id = Column(Integer, ForeignKey("templates.id"), nullable=True)
+    prompt_tokens = Column(Integer, nullable=True)  # 生成时提示词的令牌数
+    prompt_truncated = Column(Boolean, default=False)  # 提示词输入是否因超出预算被截断
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    # 列表接口在查询时计算的字段（with_expression），正文列延迟加载
+    content_length = query_expression()
+    excerpt = query_expression()
     
     # 关系
     task = relationship("Task", back_populates="reports")
     user = relationship("User", back_populates="reports")
     template = relationship("Template", back_populates="reports")
+
+    # 列表接口按用户过滤、按创建时间倒序游标分页
+    __table_args__ = (
+        Index("ix_reports_user_created", user_id, created_at.desc(), id),
+    )
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, SmallInteger, BigInteger, LargeBinary, DateTime, Index
+import datetime
+
+from ..database import Base
+
+class ReportSignature(Base):
+    __tablename__ = "report_signatures"
+    
+    report_id = Column(Integer, primary_key=True)
+    task_id = Column(Integer, nullable=False, index=True)
+    signature = Column(LargeBinary, nullable=False)  # MinHash签名，uint32数组
+    shingle_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+class ReportLshBand(Base):
+    __tablename__ = "report_lsh_bands"
+    
+    report_id = Column(Integer, primary_key=True)
+    band = Column(SmallInteger, primary_key=True)
+    task_id = Column(Integer, nullable=False)
+    bucket = Column(BigInteger, nullable=False)  # 该段签名的64位哈希
+    
+    __table_args__ = (
+        Index("ix_report_lsh_bands_bucket", "task_id", "band", "bucket"),
+    )
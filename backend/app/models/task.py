@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Index
+from sqlalchemy.orm import query_expression, relationship
 import datetime
 
 from ..database import Base
@@ -13,7 +13,16 @@ class Task(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    # 列表接口在查询时计算的字段（with_expression），描述列延迟加载
+    description_length = query_expression()
+    excerpt = query_expression()
     
     # 关系
     user = relationship("User", back_populates="tasks")
     reports = relationship("Report", back_populates="task")
+
+    # 列表接口按用户过滤、按创建时间倒序游标分页
+    __table_args__ = (
+        Index("ix_tasks_user_created", user_id, created_at.desc(), id),
+    )
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean, Index
+from sqlalchemy.orm import query_expression, relationship
 import datetime
 
 
@@ -19,7 +19,16 @@ class Template(Base):
     file_path = Column(String(255), nullable=True)  # 存储文件路径
     original_filename = Column(String(255), nullable=True)  # 原始文件名
     is_docx = Column(Boolean, default=False)  # 是否为DOCX模板
+
+    # 列表接口在查询时计算的字段（with_expression），正文列延迟加载
+    content_length = query_expression()
+    excerpt = query_expression()
     
     # 关系
     user = relationship("User", back_populates="templates")
     reports = relationship("Report", back_populates="template")
+
+    # 列表接口按用户过滤、按创建时间倒序游标分页
+    __table_args__ = (
+        Index("ix_templates_user_created", user_id, created_at.desc(), id),
+    )
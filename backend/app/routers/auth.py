@@ -1,58 +1,76 @@
 from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..database import get_db
+from ..database import get_async_db
 from ..models.user import User
 from ..schemas.user import UserCreate, UserLogin, UserResponse, Token
 from ..services.auth import authenticate_user, create_user
+from ..services.login_throttle import login_throttle
 from ..utils.security import create_access_token
 from ..config import settings
 
 router = APIRouter(prefix=f"{settings.API_V1_STR}/auth", tags=["认证"])
 
 @router.post("/register", response_model=UserResponse)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """注册新用户"""
     # 检查用户名是否已存在
-    db_user = db.query(User).filter(User.username == user_data.username).first()
+    db_user = await db.scalar(select(User).where(User.username == user_data.username))
     if db_user:
         raise HTTPException(status_code=400, detail="用户名已被注册")
     
     # 检查邮箱是否已存在
-    db_email = db.query(User).filter(User.email == user_data.email).first()
+    db_email = await db.scalar(select(User).where(User.email == user_data.email))
     if db_email:
         raise HTTPException(status_code=400, detail="邮箱已被注册")
     
     # 如果是学生，验证学号是否已存在
     if user_data.role == "student" and user_data.student_id:
-        db_student = db.query(User).filter(
+        db_student = await db.scalar(select(User).where(
             User.student_id == user_data.student_id,
             User.school == user_data.school
-        ).first()
+        ))
         if db_student:
             raise HTTPException(status_code=400, detail="该学号已被注册")
     
     # 创建新用户
-    user = create_user(
+    user = await create_user(
         db=db,
         user_data=user_data.dict()
     )
     
     return user
 @router.post("/login", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(
+    request: Request,
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_async_db)
+):
     """用户登录"""
+    # 限流检查在密码验证之前，被拒绝的请求不占用哈希线程池
+    retry_after = login_throttle.check(form_data.username, request.client.host if request.client else None)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="登录尝试过于频繁，请稍后再试",
+            headers={"Retry-After": str(retry_after)},
+        )
+
     # 验证用户
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
+        login_throttle.record_failure(form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户名或密码错误",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    login_throttle.record_success(form_data.username)
+
     # 创建访问令牌
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
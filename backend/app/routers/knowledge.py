@@ -0,0 +1,119 @@
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+import logging
+import os
+
+from ..database import get_async_db, run_db
+from ..models.user import User
+from ..models.task import Task
+from ..models.report import Report
+from ..models.knowledge import KnowledgeChunk
+from ..schemas.knowledge import KnowledgeIngestResponse, KnowledgeSourceResponse, KnowledgeSearchResult
+from ..services.knowledge_base import SOURCE_TYPES, ingest, ingest_task, ingest_report, delete_source, extract_text, retrieve
+from ..services.llm_providers import GenerationError
+from ..utils.security import get_current_active_teacher
+from ..config import settings
+
+router = APIRouter(prefix=f"{settings.API_V1_STR}/knowledge", tags=["知识库"])
+
+logger = logging.getLogger(__name__)
+
+@router.post("/documents", response_model=KnowledgeIngestResponse, status_code=status.HTTP_201_CREATED)
+async def upload_document(
+    file: UploadFile = File(...),
+    title: Optional[str] = Form(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_teacher)
+):
+    """上传实训手册并入库，同名文件重新上传时替换原有内容（仅教师可用）"""
+    try:
+        content = extract_text(file.filename, await file.read())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"解析知识库文档失败: {str(e)}")
+        raise HTTPException(status_code=400, detail="文件解析失败")
+
+    title = title or os.path.splitext(file.filename)[0]
+    try:
+        chunks = await ingest(db, "manual", file.filename, title, content)
+    except GenerationError:
+        raise HTTPException(status_code=502, detail="向量化服务调用失败")
+    return KnowledgeIngestResponse(source_type="manual", source_key=file.filename, title=title, chunks=chunks)
+
+@router.post("/tasks/{task_id}", response_model=KnowledgeIngestResponse, status_code=status.HTTP_201_CREATED)
+async def add_task(
+    task_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_teacher)
+):
+    """任务书入库（仅教师可用）"""
+    task = await db.scalar(select(Task).where(Task.id == task_id, Task.user_id == current_user.id))
+    if task is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    try:
+        chunks = await ingest_task(db, task)
+    except GenerationError:
+        raise HTTPException(status_code=502, detail="向量化服务调用失败")
+    return KnowledgeIngestResponse(source_type="task", source_key=str(task.id), title=task.title, chunks=chunks)
+
+@router.post("/reports/{report_id}", response_model=KnowledgeIngestResponse, status_code=status.HTTP_201_CREATED)
+async def add_exemplar_report(
+    report_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_teacher)
+):
+    """把学生报告认可为范例并入库，仅限本人布置的任务下的报告（仅教师可用）"""
+    report = await db.scalar(select(Report).join(Task, Report.task_id == Task.id).where(
+        Report.id == report_id, Task.user_id == current_user.id
+    ))
+    if report is None:
+        raise HTTPException(status_code=404, detail="报告不存在")
+    try:
+        chunks = await ingest_report(db, report)
+    except GenerationError:
+        raise HTTPException(status_code=502, detail="向量化服务调用失败")
+    return KnowledgeIngestResponse(source_type="report", source_key=str(report.id), title=report.title, chunks=chunks)
+
+@router.get("/sources", response_model=List[KnowledgeSourceResponse])
+async def read_sources(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_teacher)
+):
+    """知识库来源列表及切片数（仅教师可用）"""
+    rows = (await db.execute(select(
+        KnowledgeChunk.source_type,
+        KnowledgeChunk.source_key,
+        func.min(KnowledgeChunk.title).label("title"),
+        func.count(KnowledgeChunk.id).label("chunks")
+    ).group_by(KnowledgeChunk.source_type, KnowledgeChunk.source_key).order_by(
+        KnowledgeChunk.source_type, KnowledgeChunk.source_key
+    ))).all()
+    return [KnowledgeSourceResponse(**row._asdict()) for row in rows]
+
+@router.delete("/sources/{source_type}/{source_key}", status_code=status.HTTP_204_NO_CONTENT)
+async def remove_source(
+    source_type: str,
+    source_key: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_teacher)
+):
+    """删除某一来源的全部切片（仅教师可用）"""
+    if source_type not in SOURCE_TYPES or not await run_db(db, delete_source, source_type, source_key):
+        raise HTTPException(status_code=404, detail="知识来源不存在")
+    return None
+
+@router.get("/search", response_model=List[KnowledgeSearchResult])
+async def search_knowledge(
+    q: str,
+    k: int = 5,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_teacher)
+):
+    """检索知识库，用于检查入库效果（仅教师可用）"""
+    try:
+        return await retrieve(db, q, k=max(1, min(k, 50)))
+    except GenerationError:
+        raise HTTPException(status_code=502, detail="向量化服务调用失败")
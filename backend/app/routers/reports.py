@@ -236,21 +236,46 @@
 #         raise HTTPException(status_code=500, detail="HTML导出失败")
 
 
-from fastapi import APIRouter, Depends, HTTPException, status, Response
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
+import asyncio
+import functools
 import io
+import math
 import time
 import logging
 from datetime import datetime
 from fastapi.responses import StreamingResponse, HTMLResponse
 
-from ..database import get_db
+from ..database import get_async_db, release_connection, run_db, AsyncSessionLocal
 from ..models.user import User
 from ..models.report import Report
-from ..schemas.report import ReportCreate, ReportUpdate, ReportResponse
-from ..utils.security import get_current_user
-from ..services.ai_service import generate_report_with_qwen
+from ..models.task import Task
+from ..schemas.report import (
+    ReportCreate, ReportBatchCreate, ReportUpdate, ReportResponse, ReportSummary, ReportJobResponse,
+    ReportDuplicateResponse, ReportDuplicatePairResponse
+)
+from ..utils.security import get_current_user, get_current_active_teacher
+from ..utils.pagination import MAX_EXCERPT_LENGTH, MAX_PAGE_SIZE, keyset_page, summary_options
+from ..services.report_jobs import report_job_manager, QueueFullError
+from ..services.ai_service import (
+    load_generation_context, save_report, stream_report_content, record_generation, failure_cause,
+    report_generation_cancelled_total, generation_retry_after
+)
+from ..services.llm_providers import CircuitOpenError
+from ..services.prompt_builder import build_prompts
+from ..services.knowledge_base import retrieve_for_task
+from ..services.report_batch import generate_reports_for_users
+from ..services.hedging import set_route
+from ..services.duplicate_detection import find_report_duplicates, find_task_duplicates
+from ..services.request_coalescing import (
+    IDEMPOTENCY_KEY_MAX_LENGTH, IdempotencyConflictError, StreamFlight, StreamFlightGroup,
+    idempotency_store, request_fingerprint
+)
+from ..utils.sse import format_sse, SSE_HEADERS
+from ..utils.metrics import registry
 from ..config import settings
 
 router = APIRouter(prefix=f"{settings.API_V1_STR}/reports", tags=["报告"])
@@ -258,44 +283,315 @@ router = APIRouter(prefix=f"{settings.API_V1_STR}/reports", tags=["报告"])
 # 配置日志
 logger = logging.getLogger(__name__)
 
-@router.post("/generate", response_model=ReportResponse)
+report_export_duration_seconds = registry.histogram(
+    "report_export_duration_seconds",
+    "报告导出渲染耗时（秒）",
+    ("format",),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+report_export_failures_total = registry.counter(
+    "report_export_failures_total", "报告导出失败次数", ("format", "cause")
+)
+
+def timed_export(export_format: str):
+    """记录导出接口的渲染耗时和失败次数"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                response = await func(*args, **kwargs)
+            except HTTPException as e:
+                cause = "not_found" if e.status_code == 404 else "render"
+                report_export_failures_total.inc(format=export_format, cause=cause)
+                raise
+            report_export_duration_seconds.observe(time.perf_counter() - start, format=export_format)
+            return response
+        return wrapper
+    return decorator
+
+# 进行中的流式生成，同一用户的相同请求共享一次生成
+stream_flights = StreamFlightGroup("stream")
+
+def ensure_generation_available(provider: Optional[str] = None):
+    """模型服务熔断且没有降级方案时直接返回503，不让请求排队等待超时"""
+    retry_after = generation_retry_after(provider)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="模型服务暂不可用，请稍后再试",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+def check_idempotency_key(idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")) -> Optional[str]:
+    """校验可选的 Idempotency-Key 请求头"""
+    if idempotency_key is not None and not 0 < len(idempotency_key) <= IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key 长度必须为1到{IDEMPOTENCY_KEY_MAX_LENGTH}个字符")
+    return idempotency_key
+
+def replay_idempotent(scope: str, user_id: int, key: Optional[str], fingerprint: str):
+    """返回相同 Idempotency-Key 的原结果，没有时返回None"""
+    if key is None:
+        return None
+    try:
+        return idempotency_store.get(scope, user_id, key, fingerprint)
+    except IdempotencyConflictError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+@router.post("/generate", response_model=ReportJobResponse, status_code=status.HTTP_202_ACCEPTED)
 async def create_report(
     report_data: ReportCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Depends(check_idempotency_key)
 ):
-    """生成新报告"""
-    report = await generate_report_with_qwen(
-        db=db, 
-        task_id=report_data.task_id, 
-        user_id=current_user.id,
-        template_id=report_data.template_id
-    )
+    """提交报告生成任务，立即返回任务ID，通过 /jobs/{job_id} 查询进度；
+    相同参数的任务未完成时返回已有任务，带相同 Idempotency-Key 的重试返回原任务"""
+    fingerprint = request_fingerprint(report_data.dict())
+    job = replay_idempotent("generate", current_user.id, idempotency_key, fingerprint)
+    if job is not None:
+        response.headers["Location"] = f"{router.prefix}/jobs/{job.id}"
+        return job
     
-    if not report:
-        raise HTTPException(status_code=500, detail="报告生成失败")
+    ensure_generation_available(report_data.provider)
+    try:
+        job = report_job_manager.submit(
+            user_id=current_user.id,
+            task_id=report_data.task_id,
+            template_id=report_data.template_id,
+            force_regenerate=report_data.force_regenerate,
+            mode=report_data.mode,
+            provider=report_data.provider
+        )
+    except QueueFullError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="报告生成队列已满，请稍后再试",
+            headers={"Retry-After": "30"},
+        )
     
-    return report
+    if idempotency_key is not None:
+        idempotency_store.put("generate", current_user.id, idempotency_key, fingerprint, job)
+    response.headers["Location"] = f"{router.prefix}/jobs/{job.id}"
+    return job
+
+async def stream_generation(flight: StreamFlight, report_data: ReportCreate, user_id: int):
+    """流式生成报告并把输出发布给所有订阅的请求，生成结束后保存报告"""
+    # 生成可能比发起请求的连接存活更久，使用独立的数据库会话
+    db = AsyncSessionLocal()
+    chunks = []
+    started = time.perf_counter()
+    set_route("generate_stream")
+    try:
+        task, template = await load_generation_context(db, report_data.task_id, report_data.template_id)
+        references = await retrieve_for_task(db, task)
+        # 读取完成，流式生成期间不占用数据库连接，保存报告时再重新获取
+        await release_connection(db)
+        prompts = build_prompts(task, template, report_data.mode, references)
+        agent_runs = []
+        async for text in stream_report_content(
+            prompts, report_data.force_regenerate, report_data.provider, report_data.mode, agent_runs.append, user_id
+        ):
+            chunks.append(text)
+            await flight.publish("delta", {"text": text})
+        
+        content = "".join(chunks)
+        if not content:
+            logger.error("通义千问返回内容为空")
+            record_generation(report_data.mode, started, "empty_content")
+            await flight.publish("error", {"detail": "报告生成失败"})
+            return
+        
+        report = await save_report(
+            db, task, user_id, report_data.template_id, content, prompts, agent_runs[0] if agent_runs else None
+        )
+        record_generation(report_data.mode, started)
+        await flight.publish("done", {"report_id": report.id})
+    except asyncio.CancelledError:
+        # 所有订阅的客户端都已断开，中断模型调用且不保存报告
+        logger.info(f"客户端已断开，取消流式生成: 任务ID={report_data.task_id}")
+        record_generation(report_data.mode, started, "cancelled")
+        report_generation_cancelled_total.inc(reason="client_disconnect")
+        raise
+    except CircuitOpenError:
+        logger.warning(f"模型服务已熔断，流式生成失败: 任务ID={report_data.task_id}")
+        record_generation(report_data.mode, started, "circuit_open")
+        await flight.publish("error", {"detail": "模型服务暂不可用，请稍后再试"})
+    except Exception as e:
+        logger.error(f"流式生成报告时发生错误: {str(e)}")
+        record_generation(report_data.mode, started, failure_cause(e))
+        await flight.publish("error", {"detail": "报告生成失败"})
+    finally:
+        await db.close()
+
+@router.post("/generate/stream")
+async def create_report_stream(
+    report_data: ReportCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Depends(check_idempotency_key)
+):
+    """流式生成报告：以SSE逐段推送模型输出，生成结束后保存报告；
+    同一用户相同参数的并发请求共享一次生成，带相同 Idempotency-Key 的重试重放原输出"""
+    task, _ = await load_generation_context(db, report_data.task_id, report_data.template_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    
+    fingerprint = request_fingerprint(report_data.dict())
+    flight = replay_idempotent("generate_stream", current_user.id, idempotency_key, fingerprint)
+    if flight is None:
+        ensure_generation_available(report_data.provider)
+        producer = functools.partial(stream_generation, report_data=report_data, user_id=current_user.id)
+        if settings.REQUEST_COALESCING_ENABLED:
+            flight = stream_flights.join(f"{current_user.id}:{fingerprint}", producer)
+        else:
+            flight = StreamFlight(fingerprint)
+            flight.start(producer)
+        if idempotency_key is not None:
+            idempotency_store.put("generate_stream", current_user.id, idempotency_key, fingerprint, flight)
+    
+    # 请求的数据库会话要到流式响应结束才关闭，先结束读事务归还连接
+    await release_connection(db)
+    
+    async def event_stream():
+        async for event, payload in flight.subscribe():
+            yield format_sse(event, payload)
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
 
-@router.get("/", response_model=List[ReportResponse])
+@router.post("/batch")
+async def create_reports_batch(
+    batch_data: ReportBatchCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_teacher)
+):
+    """为整个班级或指定学生批量生成报告，以SSE推送每名学生的进度和最终汇总（仅教师可用）"""
+    task = await db.scalar(select(Task).where(Task.id == batch_data.task_id, Task.user_id == current_user.id))
+    if task is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    
+    # 确定目标学生
+    query = select(User.id).where(User.role == "student", User.is_active == True)
+    if batch_data.user_ids and batch_data.class_name:
+        query = query.where((User.id.in_(batch_data.user_ids)) | (User.class_name == batch_data.class_name))
+    elif batch_data.user_ids:
+        query = query.where(User.id.in_(batch_data.user_ids))
+    else:
+        query = query.where(User.class_name == batch_data.class_name)
+    user_ids = list((await db.scalars(query.order_by(User.id))).all())
+    if not user_ids:
+        raise HTTPException(status_code=404, detail="没有符合条件的学生")
+    
+    ensure_generation_available(batch_data.provider)
+    concurrency = batch_data.concurrency or settings.REPORT_BATCH_CONCURRENCY
+    concurrency = max(1, min(concurrency, settings.REPORT_BATCH_MAX_CONCURRENCY))
+    # 请求的数据库会话要到流式响应结束才关闭，先结束读事务归还连接
+    await release_connection(db)
+    
+    async def event_stream():
+        results = []
+        async for result in generate_reports_for_users(
+            task_id=task.id,
+            user_ids=user_ids,
+            template_id=batch_data.template_id,
+            concurrency=concurrency,
+            force_regenerate=batch_data.force_regenerate,
+            mode=batch_data.mode,
+            provider=batch_data.provider
+        ):
+            results.append(result)
+            yield format_sse("progress", {**result, "completed": len(results), "total": len(user_ids)})
+        
+        succeeded = sum(1 for r in results if r["status"] == "done")
+        yield format_sse("summary", {
+            "total": len(user_ids),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "results": results
+        })
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.get("/jobs/{job_id}", response_model=ReportJobResponse)
+async def read_report_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """查询报告生成任务状态"""
+    job = report_job_manager.get(job_id)
+    if job is None or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="生成任务不存在")
+    return job
+
+@router.delete("/jobs/{job_id}", response_model=ReportJobResponse)
+async def cancel_report_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """取消报告生成任务，正在进行的模型调用随之中断，已结束的任务原样返回"""
+    job = report_job_manager.get(job_id)
+    if job is None or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="生成任务不存在")
+    report_job_manager.cancel(job)
+    return job
+
+@router.get("/tasks/{task_id}/duplicates", response_model=List[ReportDuplicatePairResponse])
+async def read_task_duplicates(
+    task_id: int,
+    threshold: Optional[float] = Query(None, ge=0, le=1),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_teacher)
+):
+    """任务下不同学生之间疑似重复的报告对，仅限本人布置的任务（仅教师可用）"""
+    task = await db.scalar(select(Task).where(Task.id == task_id, Task.user_id == current_user.id))
+    if task is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return [
+        ReportDuplicatePairResponse(first=first, second=second, similarity=round(score, 4))
+        for first, second, score in await run_db(db, find_task_duplicates, task.id, threshold)
+    ]
+
+@router.get("/{report_id}/duplicates", response_model=List[ReportDuplicateResponse])
+async def read_report_duplicates(
+    report_id: int,
+    threshold: Optional[float] = Query(None, ge=0, le=1),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_teacher)
+):
+    """同一任务下与指定报告相似的其他学生报告，仅限本人布置的任务下的报告（仅教师可用）"""
+    report = await db.scalar(select(Report).join(Task, Report.task_id == Task.id).where(
+        Report.id == report_id, Task.user_id == current_user.id
+    ))
+    if report is None:
+        raise HTTPException(status_code=404, detail="报告不存在")
+    return [
+        ReportDuplicateResponse(report=brief, similarity=round(score, 4))
+        for brief, score in await run_db(db, find_report_duplicates, report, threshold)
+    ]
+
+@router.get("/", response_model=List[ReportSummary])
 async def read_reports(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    excerpt: int = Query(0, ge=0, le=MAX_EXCERPT_LENGTH),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    """获取当前用户的报告列表"""
-    reports = db.query(Report).filter(Report.user_id == current_user.id).offset(skip).limit(limit).all()
-    return reports
+    """获取当前用户的报告列表（不含正文），按创建时间倒序；还有下一页时在 X-Next-Cursor 响应头返回游标"""
+    query = select(Report).where(Report.user_id == current_user.id).options(
+        *summary_options(Report.content, Report.content_length, Report.excerpt, excerpt)
+    )
+    return await keyset_page(db, query, Report, cursor, limit, response)
 
 @router.get("/{report_id}", response_model=ReportResponse)
 async def read_report(
     report_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取指定报告详情"""
-    report = db.query(Report).filter(Report.id == report_id, Report.user_id == current_user.id).first()
+    report = await db.scalar(select(Report).where(Report.id == report_id, Report.user_id == current_user.id))
     if report is None:
         raise HTTPException(status_code=404, detail="报告不存在")
     return report
@@ -304,44 +600,45 @@ async def read_report(
 async def update_report(
     report_id: int,
     report_data: ReportUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """更新报告内容"""
-    report = db.query(Report).filter(Report.id == report_id, Report.user_id == current_user.id).first()
+    report = await db.scalar(select(Report).where(Report.id == report_id, Report.user_id == current_user.id))
     if report is None:
         raise HTTPException(status_code=404, detail="报告不存在")
     
     report.content = report_data.content
-    db.commit()
-    db.refresh(report)
+    await db.commit()
+    await db.refresh(report)
     
     return report
 
 @router.delete("/{report_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_report(
     report_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """删除报告"""
-    report = db.query(Report).filter(Report.id == report_id, Report.user_id == current_user.id).first()
+    report = await db.scalar(select(Report).where(Report.id == report_id, Report.user_id == current_user.id))
     if report is None:
         raise HTTPException(status_code=404, detail="报告不存在")
     
-    db.delete(report)
-    db.commit()
+    await db.delete(report)
+    await db.commit()
     return None
 
 @router.get("/{report_id}/export/docx")
+@timed_export("docx")
 async def export_report_docx(
     report_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """导出报告为Word格式"""
     try:
         # 查找报告
-        report = db.query(Report).filter(Report.id == report_id).first()
+        report = await db.scalar(select(Report).where(Report.id == report_id))
         if report is None:
             raise HTTPException(status_code=404, detail="报告不存在")
         
@@ -386,19 +683,22 @@ async def export_report_docx(
             media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
             headers={"Content-Disposition": f"attachment; filename={safe_filename}"}
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Word导出错误: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Word文档生成失败: {str(e)}")
 
 @router.get("/{report_id}/export/pdf")
+@timed_export("pdf")
 async def export_report_pdf(
     report_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """导出报告为PDF格式"""
     try:
         # 查找报告
-        report = db.query(Report).filter(Report.id == report_id).first()
+        report = await db.scalar(select(Report).where(Report.id == report_id))
         if report is None:
             raise HTTPException(status_code=404, detail="报告不存在")
         
@@ -490,6 +790,8 @@ async def export_report_pdf(
                 headers={"Content-Disposition": f"attachment; filename=report_{report_id}.pdf"}
             )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"PDF生成错误: {str(e)}", exc_info=True)
         # 尝试提供友好的错误信息
@@ -499,14 +801,15 @@ async def export_report_pdf(
         )
 
 @router.get("/{report_id}/export/html")
+@timed_export("html")
 async def export_report_html(
     report_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """导出报告为HTML格式(可在浏览器中打印为PDF)"""
     try:
         # 查找报告
-        report = db.query(Report).filter(Report.id == report_id).first()
+        report = await db.scalar(select(Report).where(Report.id == report_id))
         if report is None:
             raise HTTPException(status_code=404, detail="报告不存在")
         
@@ -631,19 +934,22 @@ async def export_report_html(
         # 返回HTML响应，直接在浏览器中显示
         return HTMLResponse(content=html_content)
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"HTML生成错误: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"HTML导出失败: {str(e)}")
 
 @router.get("/{report_id}/export/txt")
+@timed_export("txt")
 async def export_report_txt(
     report_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """导出报告为纯文本格式"""
     try:
         # 查找报告
-        report = db.query(Report).filter(Report.id == report_id).first()
+        report = await db.scalar(select(Report).where(Report.id == report_id))
         if report is None:
             raise HTTPException(status_code=404, detail="报告不存在")
         
@@ -668,6 +974,8 @@ async def export_report_txt(
             headers={"Content-Disposition": f"attachment; filename={safe_filename}"}
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"文本导出错误: {str(e)}")
         raise HTTPException(status_code=500, detail=f"文本导出失败: {str(e)}")
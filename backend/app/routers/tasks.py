@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 
-from ..database import get_db
+from ..database import get_async_db
 from ..models.user import User
 from ..models.task import Task
-from ..schemas.task import TaskCreate, TaskResponse
+from ..schemas.task import TaskCreate, TaskResponse, TaskSummary
 from ..utils.security import get_current_user
+from ..utils.pagination import MAX_EXCERPT_LENGTH, MAX_PAGE_SIZE, keyset_page, summary_options
 from ..config import settings
 
 router = APIRouter(prefix=f"{settings.API_V1_STR}/tasks", tags=["任务"])
@@ -14,7 +16,7 @@ router = APIRouter(prefix=f"{settings.API_V1_STR}/tasks", tags=["任务"])
 @router.post("/", response_model=TaskResponse, status_code=status.HTTP_201_CREATED)
 async def create_task(
     task_data: TaskCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """创建新任务"""
@@ -25,30 +27,34 @@ async def create_task(
     )
     
     db.add(new_task)
-    db.commit()
-    db.refresh(new_task)
+    await db.commit()
+    await db.refresh(new_task)
     
     return new_task
 
-@router.get("/", response_model=List[TaskResponse])
+@router.get("/", response_model=List[TaskSummary])
 async def read_tasks(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    excerpt: int = Query(0, ge=0, le=MAX_EXCERPT_LENGTH),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    """获取当前用户的任务列表"""
-    tasks = db.query(Task).filter(Task.user_id == current_user.id).offset(skip).limit(limit).all()
-    return tasks
+    """获取当前用户的任务列表（不含描述全文），按创建时间倒序；还有下一页时在 X-Next-Cursor 响应头返回游标"""
+    query = select(Task).where(Task.user_id == current_user.id).options(
+        *summary_options(Task.description, Task.description_length, Task.excerpt, excerpt)
+    )
+    return await keyset_page(db, query, Task, cursor, limit, response)
 
 @router.get("/{task_id}", response_model=TaskResponse)
 async def read_task(
     task_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取指定任务详情"""
-    task = db.query(Task).filter(Task.id == task_id, Task.user_id == current_user.id).first()
+    task = await db.scalar(select(Task).where(Task.id == task_id, Task.user_id == current_user.id))
     if task is None:
         raise HTTPException(status_code=404, detail="任务不存在")
     return task
@@ -56,14 +62,14 @@ async def read_task(
 @router.delete("/{task_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_task(
     task_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """删除任务"""
-    task = db.query(Task).filter(Task.id == task_id, Task.user_id == current_user.id).first()
+    task = await db.scalar(select(Task).where(Task.id == task_id, Task.user_id == current_user.id))
     if task is None:
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    db.delete(task)
-    db.commit()
+    await db.delete(task)
+    await db.commit()
     return None
@@ -4,8 +4,9 @@ import uuid
 import shutil
 import logging
 from typing import List, Dict, Optional
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, UploadFile, File, Form, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 from fastapi.responses import StreamingResponse
 from docx import Document
@@ -13,11 +14,12 @@ import io
 import re
 
 from ..config import settings
-from ..database import get_db
+from ..database import get_async_db
 from ..models.user import User
 from ..models.template import Template
-from ..schemas.template import TemplateCreate, TemplateResponse
+from ..schemas.template import TemplateCreate, TemplateResponse, TemplateSummary
 from ..utils.security import get_current_user
+from ..utils.pagination import MAX_EXCERPT_LENGTH, MAX_PAGE_SIZE, keyset_page, summary_options
 
 TEMPLATE_DIR = "/home/ai_report_system/templates/docx"
 
@@ -27,7 +29,7 @@ logger = logging.getLogger(__name__)
 @router.post("/", response_model=TemplateResponse, status_code=status.HTTP_201_CREATED)
 async def create_template(
     template_data: TemplateCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """创建新模板"""
@@ -38,8 +40,8 @@ async def create_template(
     )
     
     db.add(new_template)
-    db.commit()
-    db.refresh(new_template)
+    await db.commit()
+    await db.refresh(new_template)
     
     return new_template
 
@@ -48,7 +50,7 @@ async def upload_docx_template(
     file: UploadFile = File(...),
     name: str = Form(...),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """上传Word格式的报告模板"""
     try:
@@ -96,8 +98,8 @@ async def upload_docx_template(
             )
             
             db.add(new_template)
-            db.commit()
-            db.refresh(new_template)
+            await db.commit()
+            await db.refresh(new_template)
             logger.info(f"模板记录创建成功: ID={new_template.id}")
         except Exception as db_error:
             # 如果数据库操作失败，删除已保存的文件
@@ -106,7 +108,7 @@ async def upload_docx_template(
                 logger.info(f"由于数据库错误，已删除文件: {file_path}")
             
             logger.error(f"数据库操作失败: {str(db_error)}", exc_info=True)
-            db.rollback()
+            await db.rollback()
             raise HTTPException(status_code=500, detail=f"数据库操作失败: {str(db_error)}")
         
         return {
@@ -125,25 +127,29 @@ async def upload_docx_template(
         raise HTTPException(status_code=500, detail=f"模板上传失败: {str(e)}")
 
 
-@router.get("/", response_model=List[TemplateResponse])
+@router.get("/", response_model=List[TemplateSummary])
 async def read_templates(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    excerpt: int = Query(0, ge=0, le=MAX_EXCERPT_LENGTH),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    """获取当前用户的模板列表"""
-    templates = db.query(Template).filter(Template.user_id == current_user.id).offset(skip).limit(limit).all()
-    return templates
+    """获取当前用户的模板列表（不含模板内容），按创建时间倒序；还有下一页时在 X-Next-Cursor 响应头返回游标"""
+    query = select(Template).where(Template.user_id == current_user.id).options(
+        *summary_options(Template.content, Template.content_length, Template.excerpt, excerpt)
+    )
+    return await keyset_page(db, query, Template, cursor, limit, response)
 
 @router.get("/{template_id}", response_model=TemplateResponse)
 async def read_template(
     template_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取指定模板详情"""
-    template = db.query(Template).filter(Template.id == template_id, Template.user_id == current_user.id).first()
+    template = await db.scalar(select(Template).where(Template.id == template_id, Template.user_id == current_user.id))
     if template is None:
         raise HTTPException(status_code=404, detail="模板不存在")
     return template
@@ -153,13 +159,13 @@ async def apply_template(
     template_id: int,
     report_content: Dict[str, str],
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """将报告内容套用到DOCX模板中"""
     try:
         # 获取模板
-        template = db.query(Template).filter(Template.id == template_id, 
-                                           Template.user_id == current_user.id).first()
+        template = await db.scalar(select(Template).where(Template.id == template_id,
+                                                          Template.user_id == current_user.id))
         if template is None:
             raise HTTPException(status_code=404, detail="模板不存在")
         
@@ -262,11 +268,11 @@ async def apply_template(
 async def delete_template(
     template_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """删除模板，如果是DOCX模板同时删除文件"""
-    template = db.query(Template).filter(Template.id == template_id, 
-                                        Template.user_id == current_user.id).first()
+    template = await db.scalar(select(Template).where(Template.id == template_id,
+                                                      Template.user_id == current_user.id))
     if template is None:
         raise HTTPException(status_code=404, detail="模板不存在")
     
@@ -282,8 +288,8 @@ async def delete_template(
                 # 即使文件删除失败，也继续删除数据库记录
     
     # 删除数据库记录
-    db.delete(template)
-    db.commit()
+    await db.delete(template)
+    await db.commit()
     logger.info(f"已删除模板记录: ID={template_id}")
     
     return None
\ No newline at end of file
@@ -1,10 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
+import csv
 
-from ..database import get_db
+from ..database import get_async_db
 from ..models.user import User
-from ..schemas.user import UserResponse
+from ..schemas.user import UserResponse, RosterImportResponse
+from ..services.roster_import import RosterConflictError, parse_roster, import_roster
 from ..utils.security import get_current_user, get_current_active_teacher
 from ..config import settings
 
@@ -19,9 +22,32 @@ async def read_users_me(current_user: User = Depends(get_current_user)):
 async def read_users(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_teacher)
 ):
     """获取所有用户列表（仅教师可用）"""
-    users = db.query(User).offset(skip).limit(limit).all()
+    users = (await db.scalars(select(User).offset(skip).limit(limit))).all()
     return users
+
+@router.post("/import", response_model=RosterImportResponse)
+async def import_users(
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_teacher)
+):
+    """批量导入学生名单，支持CSV和JSON，逐行返回处理结果；已注册或校验未通过的行跳过，其余行一次写入（仅教师可用）"""
+    try:
+        records = parse_roster(file.filename, await file.read())
+    except (ValueError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"名单解析失败: {str(e)}")
+
+    try:
+        results = await import_roster(db, records)
+    except RosterConflictError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="导入期间有用户同时注册，请重新导入")
+    return RosterImportResponse(
+        created=sum(result.status == "created" for result in results),
+        duplicate=sum(result.status == "duplicate" for result in results),
+        invalid=sum(result.status == "invalid" for result in results),
+        results=results
+    )
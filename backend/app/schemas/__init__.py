@@ -1,4 +1,4 @@
 from .user import UserCreate, UserLogin, UserResponse, Token
 from .task import TaskCreate, TaskResponse
-from .report import ReportCreate, ReportUpdate, ReportResponse
+from .report import ReportCreate, ReportUpdate, ReportResponse, ReportJobResponse
 from .template import TemplateCreate, TemplateResponse
@@ -0,0 +1,27 @@
+from pydantic import BaseModel
+
+# 知识库入库结果
+class KnowledgeIngestResponse(BaseModel):
+    source_type: str
+    source_key: str
+    title: str
+    chunks: int
+
+# 知识来源
+class KnowledgeSourceResponse(BaseModel):
+    source_type: str
+    source_key: str
+    title: str
+    chunks: int
+
+# 检索结果
+class KnowledgeSearchResult(BaseModel):
+    id: int
+    source_type: str
+    source_key: str
+    title: str
+    content: str
+    score: float
+
+    class Config:
+        orm_mode = True
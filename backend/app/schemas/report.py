@@ -1,11 +1,51 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, root_validator, validator
+from typing import List, Optional
 from datetime import datetime
 
+from ..config import settings
+
+GENERATION_MODES = ("single", "sections", "agents")
+
+def _validate_mode(v):
+    if v is not None and v not in GENERATION_MODES:
+        raise ValueError(f"生成模式必须是{'、'.join(GENERATION_MODES)}之一")
+    return v
+
+def _validate_provider(v):
+    if v is not None and v not in settings.LLM_REQUEST_PROVIDERS:
+        raise ValueError(f"模型服务提供方必须是{'、'.join(settings.LLM_REQUEST_PROVIDERS)}之一")
+    return v
+
 # 创建报告
 class ReportCreate(BaseModel):
     task_id: int
     template_id: Optional[int] = None
+    force_regenerate: bool = False  # 忽略缓存，强制调用模型重新生成
+    mode: Optional[str] = None  # 生成模式，默认使用 REPORT_GENERATION_MODE
+    provider: Optional[str] = None  # 模型服务提供方，默认使用 LLM_PROVIDER
+    
+    _check_mode = validator('mode', allow_reuse=True)(_validate_mode)
+    _check_provider = validator('provider', allow_reuse=True)(_validate_provider)
+
+# 批量生成报告
+class ReportBatchCreate(BaseModel):
+    task_id: int
+    template_id: Optional[int] = None
+    user_ids: Optional[List[int]] = None
+    class_name: Optional[str] = None
+    concurrency: Optional[int] = None  # 默认使用 REPORT_BATCH_CONCURRENCY
+    force_regenerate: bool = True  # 每名学生默认独立生成，不复用缓存内容
+    mode: Optional[str] = None
+    provider: Optional[str] = None
+    
+    _check_mode = validator('mode', allow_reuse=True)(_validate_mode)
+    _check_provider = validator('provider', allow_reuse=True)(_validate_provider)
+    
+    @root_validator
+    def check_targets(cls, values):
+        if not values.get("user_ids") and not values.get("class_name"):
+            raise ValueError("必须提供user_ids或class_name")
+        return values
 
 # 更新报告
 class ReportUpdate(BaseModel):
@@ -19,7 +59,61 @@ class ReportResponse(BaseModel):
     task_id: int
     user_id: int
     template_id: Optional[int]
+    prompt_tokens: Optional[int]
+    prompt_truncated: Optional[bool]
     created_at: datetime
     
     class Config:
         orm_mode = True
+
+# 报告列表项：不含正文，正文通过 GET /reports/{id} 获取
+class ReportSummary(BaseModel):
+    id: int
+    title: str
+    task_id: int
+    user_id: int
+    template_id: Optional[int]
+    created_at: datetime
+    content_length: int  # 正文字符数
+    excerpt: Optional[str]  # 正文开头，请求时指定 excerpt 才返回
+    
+    class Config:
+        orm_mode = True
+
+# 报告生成任务响应
+class ReportJobResponse(BaseModel):
+    id: str
+    status: str  # queued / running / done / failed / cancelled
+    task_id: int
+    template_id: Optional[int]
+    report_id: Optional[int]
+    error: Optional[str]
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+    
+    class Config:
+        orm_mode = True
+
+# 查重结果中的报告概要
+class DuplicateReportBrief(BaseModel):
+    id: int
+    title: str
+    user_id: int
+    username: str
+    full_name: Optional[str]
+    created_at: datetime
+    
+    class Config:
+        orm_mode = True
+
+# 与指定报告相似的报告
+class ReportDuplicateResponse(BaseModel):
+    report: DuplicateReportBrief
+    similarity: float  # 估计的Jaccard相似度
+
+# 任务下疑似重复的报告对
+class ReportDuplicatePairResponse(BaseModel):
+    first: DuplicateReportBrief
+    second: DuplicateReportBrief
+    similarity: float
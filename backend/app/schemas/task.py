@@ -17,3 +17,15 @@ class TaskResponse(BaseModel):
     
     class Config:
         orm_mode = True
+
+# 任务列表项：不含描述全文，全文通过 GET /tasks/{id} 获取
+class TaskSummary(BaseModel):
+    id: int
+    title: str
+    user_id: int
+    created_at: datetime
+    description_length: int  # 描述字符数
+    excerpt: Optional[str]  # 描述开头，请求时指定 excerpt 才返回
+    
+    class Config:
+        orm_mode = True
@@ -17,3 +17,15 @@ class TemplateResponse(BaseModel):
     
     class Config:
         orm_mode = True
+
+# 模板列表项：不含模板内容，内容通过 GET /templates/{id} 获取
+class TemplateSummary(BaseModel):
+    id: int
+    name: str
+    user_id: int
+    created_at: datetime
+    content_length: int  # 内容字符数
+    excerpt: Optional[str]  # 内容开头，请求时指定 excerpt 才返回
+    
+    class Config:
+        orm_mode = True
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, validator
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 # 基础用户模式
@@ -66,3 +66,21 @@ class Token(BaseModel):
     access_token: str
     token_type: str
     role: str
+
+# 名单导入中的一行，角色默认为学生
+class RosterRow(UserCreate):
+    role: str = "student"
+
+# 名单导入中每一行的结果：created 已创建；duplicate 与已有用户或文件中前面的行重复；invalid 字段校验未通过
+class RosterRowResult(BaseModel):
+    row: int
+    username: Optional[str] = None
+    status: str
+    detail: Optional[str] = None
+
+# 名单导入结果
+class RosterImportResponse(BaseModel):
+    created: int
+    duplicate: int
+    invalid: int
+    results: List[RosterRowResult]
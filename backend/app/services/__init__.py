@@ -1,2 +1,3 @@
 from .auth import authenticate_user, create_user
 from .ai_service import generate_report_with_qwen
+from .report_jobs import report_job_manager
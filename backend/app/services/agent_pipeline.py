@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import re
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from ..config import settings
+from .dag_executor import DagExecutor, DagRun, Node, StageBudget
+from .llm_providers import GenerationError
+from .prompt_builder import REPORT_SECTIONS, SECTION_FAILED_TEXT, Prompt, build_review_prompt, with_outline
+
+logger = logging.getLogger(__name__)
+
+# 生成函数：complete(提示词, 生成令牌上限) -> 文本，由 ai_service 注入以复用缓存和请求合并
+CompleteFunc = Callable[[str, int], Awaitable[str]]
+
+_FENCE = re.compile(r"^\s*```.*$", re.MULTILINE)
+_HEADING = re.compile(r"^\s*#{1,6}\s*", re.MULTILINE)
+
+
+def _placeholder(index: int) -> str:
+    return f"{REPORT_SECTIONS[index][0]}\n\n{SECTION_FAILED_TEXT}"
+
+
+def _is_placeholder(text: str) -> bool:
+    return text.rstrip().endswith(SECTION_FAILED_TEXT)
+
+
+def normalize_section(index: int, text: str) -> str:
+    """排版：去掉 Markdown 标题符号和代码块标记，保证以部分标题开头"""
+    title = REPORT_SECTIONS[index][0]
+    text = _HEADING.sub("", _FENCE.sub("", text)).strip()
+    if not text.startswith(title):
+        text = f"{title}\n\n{text}"
+    return text
+
+
+def _format(sections: List[str]) -> str:
+    texts = [normalize_section(i, text) for i, text in enumerate(sections)]
+    if all(_is_placeholder(text) for text in texts):
+        raise GenerationError("所有部分均生成失败")
+    return "\n\n".join(texts)
+
+
+def build_pipeline(prompts: List[Prompt], complete: CompleteFunc) -> Tuple[DagExecutor, Dict[str, int]]:
+    """构建提纲-撰写-审阅-排版的DAG，五个部分的撰写和审阅各自并发；
+    prompts 为 build_agent_prompts 的结果，不会被修改，实际发送的提示词令牌数记录在各节点的执行记录中。
+    返回执行器和各部分最终节点名到部分序号的映射"""
+    outline_prompt = prompts[0]
+
+    async def outline(inputs, trace):
+        trace.prompt_tokens = outline_prompt.tokens
+        return (await complete(outline_prompt.text, trace.budget.max_tokens)).strip()
+
+    def drafter(index: int):
+        async def draft(inputs, trace):
+            prompt = with_outline(prompts[index + 1], inputs["outline"])
+            trace.prompt_tokens = prompt.tokens
+            return (await complete(prompt.text, trace.budget.max_tokens)).strip()
+        return draft
+
+    def reviewer(index: int):
+        async def review(inputs, trace):
+            draft = inputs[f"draft_{index}"]
+            if _is_placeholder(draft):
+                return draft
+            prompt = build_review_prompt(index, draft, inputs["outline"])
+            trace.prompt_tokens = prompt.tokens
+            revised = (await complete(prompt.text, trace.budget.max_tokens)).strip()
+            return revised or draft
+        return review
+
+    async def format_report(inputs, trace):
+        return _format([inputs[name] for name in section_nodes])
+
+    nodes = [Node(
+        "outline", outline, stage="outline",
+        budget=StageBudget(settings.AGENT_OUTLINE_MAX_TOKENS, settings.AGENT_OUTLINE_TIMEOUT),
+        fallback=lambda inputs: ""
+    )]
+    section_nodes: Dict[str, int] = {}
+    for i in range(len(REPORT_SECTIONS)):
+        nodes.append(Node(
+            f"draft_{i}", drafter(i), ("outline",), stage="draft",
+            budget=StageBudget(settings.AGENT_DRAFT_MAX_TOKENS, settings.AGENT_DRAFT_TIMEOUT),
+            fallback=lambda inputs, i=i: _placeholder(i)
+        ))
+        if settings.AGENT_REVIEW_ENABLED:
+            # 审阅失败或超时时保留初稿
+            nodes.append(Node(
+                f"review_{i}", reviewer(i), (f"draft_{i}", "outline"), stage="review",
+                budget=StageBudget(settings.AGENT_REVIEW_MAX_TOKENS, settings.AGENT_REVIEW_TIMEOUT),
+                fallback=lambda inputs, i=i: inputs[f"draft_{i}"]
+            ))
+            section_nodes[f"review_{i}"] = i
+        else:
+            section_nodes[f"draft_{i}"] = i
+    nodes.append(Node("format", format_report, tuple(section_nodes), stage="format"))
+    return DagExecutor(nodes), section_nodes
+
+
+def _log_run(run: DagRun):
+    logger.info(f"多阶段生成完成，{run.summary()}")
+
+
+async def generate_with_agents(prompts: List[Prompt], complete: CompleteFunc) -> DagRun:
+    """多阶段生成完整报告，报告正文为 run.outputs["format"]"""
+    executor, _ = build_pipeline(prompts, complete)
+    run = await executor.run({})
+    _log_run(run)
+    return run
+
+
+async def stream_agent_report(
+    prompts: List[Prompt],
+    complete: CompleteFunc,
+    on_finished: Optional[Callable[[DagRun], None]] = None
+) -> AsyncIterator[str]:
+    """多阶段生成，按规范顺序在每个部分审阅完成时输出；全部完成后以执行结果回调 on_finished"""
+    executor, section_nodes = build_pipeline(prompts, complete)
+    finished: asyncio.Queue = asyncio.Queue()
+    run = asyncio.create_task(executor.run({}, lambda name, value: finished.put_nowait((name, value))))
+    run.add_done_callback(lambda _: finished.put_nowait(None))
+    ready: Dict[int, str] = {}
+    next_index = 0
+    try:
+        while next_index < len(REPORT_SECTIONS):
+            item = await finished.get()
+            if item is None:
+                break
+            name, value = item
+            if name in section_nodes:
+                ready[section_nodes[name]] = value
+            while next_index in ready:
+                text = normalize_section(next_index, ready.pop(next_index))
+                yield text if next_index == 0 else "\n\n" + text
+                next_index += 1
+        # 排版节点负责判断是否全部失败，失败时在这里抛出
+        result = await run
+        _log_run(result)
+        if on_finished is not None:
+            on_finished(result)
+    finally:
+        if not run.done():
+            run.cancel()
+            await asyncio.gather(run, return_exceptions=True)
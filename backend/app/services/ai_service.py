@@ -1,126 +1,373 @@
-import httpx
+import asyncio
 import logging
-from typing import Optional
-from sqlalchemy.orm import Session
+import time
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..config import settings
+from ..database import release_connection
 from ..models.task import Task
 from ..models.template import Template
 from ..models.report import Report
 from ..models.user import User
+from ..utils.metrics import registry
+from .agent_pipeline import generate_with_agents, stream_agent_report
+from .dag_executor import DagRun
+from .generation_cache import generation_cache, make_cache_key
+from .hedging import hedge_provider, hedged_complete, hedged_stream
+from .llm_providers import CircuitOpenError, GenerationError, LLMProvider, get_provider
+from .knowledge_base import retrieve_for_task
+from .prompt_builder import REPORT_SECTIONS, SECTION_FAILED_TEXT, Prompt, build_prompts
+from .request_coalescing import SingleFlight
 
 logger = logging.getLogger(__name__)
 
-async def generate_report_with_qwen(
-    db: Session, task_id: int, user_id: int, template_id: Optional[int] = None
-) -> Optional[Report]:
-    """使用通义千问API生成报告"""
-    # 获取任务
-    task = db.query(Task).filter(Task.id == task_id).first()
+report_generation_duration_seconds = registry.histogram(
+    "report_generation_duration_seconds",
+    "单份报告从开始生成到保存的耗时（秒）",
+    ("mode", "outcome"),
+    buckets=(1, 2, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300, 600)
+)
+report_generation_failures_total = registry.counter(
+    "report_generation_failures_total", "报告生成失败次数", ("cause",)
+)
+
+
+report_generation_cancelled_total = registry.counter(
+    "report_generation_cancelled_total", "因客户端断开、取消或放弃而中止的报告生成次数", ("reason",)
+)
+llm_degraded_responses_total = registry.counter(
+    "llm_degraded_responses_total", "模型服务熔断时使用降级方案返回的生成次数", ("fallback",)
+)
+
+
+def failure_cause(exc: BaseException) -> str:
+    """生成失败原因分类，用作指标标签"""
+    if isinstance(exc, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(exc, GenerationError):
+        return "provider"
+    if isinstance(exc, SQLAlchemyError):
+        return "database"
+    return "internal"
+
+
+def record_generation(mode: Optional[str], started: float, cause: Optional[str] = None):
+    """记录一次报告生成的耗时和结果，cause 为失败原因"""
+    mode = mode or settings.REPORT_GENERATION_MODE
+    outcome = ("cancelled" if cause == "cancelled" else "error") if cause else "success"
+    report_generation_duration_seconds.observe(time.perf_counter() - started, mode=mode, outcome=outcome)
+    if cause:
+        report_generation_failures_total.inc(cause=cause)
+
+
+async def load_generation_context(
+    db: AsyncSession, task_id: int, template_id: Optional[int] = None
+) -> Tuple[Optional[Task], Optional[Template]]:
+    """获取生成报告所需的任务和模板"""
+    task = await db.scalar(select(Task).where(Task.id == task_id))
     if not task:
         logger.error(f"无法找到任务ID: {task_id}")
-        return None
+        report_generation_failures_total.inc(cause="task_not_found")
+        return None, None
     
     # 获取模板（如果提供）
     template = None
     if template_id:
-        template = db.query(Template).filter(Template.id == template_id).first()
+        template = await db.scalar(select(Template).where(Template.id == template_id))
         if not template:
             logger.warning(f"无法找到模板ID: {template_id}")
     
-    # 构建提示词
-    prompt = f"""
-    你是一位专业的实训报告撰写专家，具备跨学科的写作能力，能够根据实训任务信息生成符合高等职业教育或应用型本科教学要求的标准化实训报告。
+    return task, template
+
+
+async def save_report(
+    db: AsyncSession,
+    task: Task,
+    user_id: int,
+    template_id: Optional[int],
+    content: str,
+    prompts: Optional[List[Prompt]] = None,
+    agent_run: Optional[DagRun] = None
+) -> Report:
+    """保存生成的报告，同时记录提示词大小；多阶段生成时按各节点实际发送的提示词统计"""
+    new_report = Report(
+        title=f"{task.title} - 实训报告",
+        content=content,
+        task_id=task.id,
+        user_id=user_id,
+        template_id=template_id
+    )
+    if prompts:
+        if agent_run is not None:
+            new_report.prompt_tokens = sum(trace.prompt_tokens for trace in agent_run.traces)
+        else:
+            new_report.prompt_tokens = sum(prompt.tokens for prompt in prompts)
+        new_report.prompt_truncated = any(prompt.truncated for prompt in prompts)
+    
+    db.add(new_report)
+    await db.commit()
+    await db.refresh(new_report)
+    
+    logger.info(f"成功生成报告ID: {new_report.id}")
+    return new_report
 
-    请根据以下实验任务信息，撰写一份完整、逻辑清晰、语言书面化、结构规范的实训报告。
 
-    【实训项目名称】
-    {task.title}
+# 相同提示词和模型参数的并发调用共享一次模型请求
+_inflight_completions = SingleFlight("llm")
 
-    【实训任务描述】
-    {task.description}
 
-    {"【撰写模板】" + template.content if template else ""}
+async def _call_model(llm: LLMProvider, prompt: str, max_tokens: Optional[int]) -> Tuple[str, LLMProvider]:
+    """调用模型，当前路由启用对冲时同时使用备用提供方；返回生成文本和实际生成的提供方"""
+    secondary = hedge_provider(llm)
+    if secondary is None:
+        return await llm.complete(prompt, max_tokens), llm
+    return await hedged_complete(llm, secondary, prompt, max_tokens)
 
-    请严格按照以下五个部分进行撰写，每个部分不少于规定的字数，内容应具体真实、有条理，语言规范：
 
-    ---
+def _generation_params(llm: LLMProvider, max_tokens: Optional[int]) -> dict:
+    params = llm.params()
+    if max_tokens:
+        params["max_tokens"] = max_tokens
+    return params
 
-    一、实训目标（不少于 150 字）
-    - 明确本次实训的教学目标和专业能力目标；  
-    - 描述学生通过实训应掌握的知识点、操作技能或综合素养（如设备使用、流程掌握、职业习惯等）；  
-    - 强调与课程标准、职业岗位能力之间的关系。
 
-    二、实训内容（不少于 300 字）
-    - 总结实训所涉及的主要知识模块、技术工具、实验材料或场景设置；  
-    - 可以包括：仪器设备、软件平台、工作流程、标准规范等；  
-    - 适当补充理论支撑内容，使报告更系统。
+def generation_retry_after(provider: Optional[str] = None) -> Optional[float]:
+    """提供方已熔断且未配置降级方案时返回建议的重试等待秒数，可以生成时返回None"""
+    if settings.LLM_DEGRADED_FALLBACKS:
+        return None
+    breaker = get_provider(provider).breaker
+    if breaker.allow():
+        return None
+    return max(1.0, breaker.retry_after())
 
-    三、实验/实训步骤（不少于 500 字，若适用请加入关键操作或技术过程描述）
-    - 按照实际操作过程，分步骤描述实验/实训的详细过程；  
-    - 包括前期准备、操作流程、关键参数设定、注意事项等；  
-    - 如涉及仪器设置、软件使用、绘图建模、数据采集、护理流程等，需说明关键点或配图/代码段：
 
-    四、结果记录与分析（不少于 200 字）
-    - 准确描述实训中产生的关键结果、测量数据、图纸、作品、成品、护理记录等；
-    - 分析结果是否达标、存在的问题或改进空间；
-    - 若出现问题，需结合原理或规范进行原因分析。
+async def _degraded_complete(
+    llm: LLMProvider, prompt: str, max_tokens: Optional[int], key: str, error: CircuitOpenError
+) -> Tuple[str, Optional[LLMProvider]]:
+    """主提供方熔断时按 LLM_DEGRADED_FALLBACKS 依次尝试降级方案，返回生成文本和实际生成的提供方
+    （使用缓存结果时为None）；都不可用时抛出原熔断异常"""
+    for fallback in settings.LLM_DEGRADED_FALLBACKS:
+        if fallback == "cache":
+            content = await generation_cache.get(key, allow_stale=True)
+            if content is None:
+                continue
+            logger.warning(f"{llm.name}已熔断，降级返回缓存的生成结果: {key[:12]}")
+            llm_degraded_responses_total.inc(fallback="cache")
+            return content, None
+        if fallback == llm.name:
+            continue
+        try:
+            backup = get_provider(fallback)
+            content = await backup.complete(prompt, max_tokens)
+        except (GenerationError, ValueError) as e:
+            logger.warning(f"降级方案{fallback}不可用: {str(e)}")
+            continue
+        logger.warning(f"{llm.name}已熔断，降级使用{fallback}生成")
+        llm_degraded_responses_total.inc(fallback=fallback)
+        return content, backup
+    raise error
 
-    五、个人心得与体会（不少于 200 字）
 
-    - 总结本次实训对知识、技能、职业素养等方面的提升；
-    - 可谈学习过程中的困难、反思与收获；
-    - 也可对课程内容、教学组织或实训条件提出建议，体现批判性和专业成长。
-"""
-        
+async def complete_prompt(
+    prompt: str,
+    force_regenerate: bool = False,
+    provider: Optional[str] = None,
+    max_tokens: Optional[int] = None,
+    user_id: Optional[int] = None
+) -> str:
+    """生成完整文本，同一用户相同提示词和模型参数优先复用缓存结果或进行中的调用；max_tokens 覆盖默认生成上限"""
+    llm = get_provider(provider)
+    params = _generation_params(llm, max_tokens)
+    # 缓存和进行中调用的合并都按用户隔离
+    key = make_cache_key(prompt, params, user_id)
+    if settings.GENERATION_CACHE_ENABLED and not force_regenerate:
+        cached = await generation_cache.get(key)
+        if cached is not None:
+            logger.info(f"命中生成结果缓存: {key[:12]}")
+            return cached
+    
+    try:
+        # 强制重新生成时每次调用独立生成，不与其他请求共享结果
+        if force_regenerate or not settings.REQUEST_COALESCING_ENABLED:
+            content, used = await _call_model(llm, prompt, max_tokens)
+        else:
+            content, used = await _inflight_completions.do(key, lambda: _call_model(llm, prompt, max_tokens))
+    except CircuitOpenError as e:
+        content, used = await _degraded_complete(llm, prompt, max_tokens, key, e)
+        if used is None:
+            return content
+    if settings.GENERATION_CACHE_ENABLED:
+        # 对冲请求由备用提供方胜出时，结果按备用提供方的参数缓存
+        if used is not llm:
+            params = _generation_params(used, max_tokens)
+            key = make_cache_key(prompt, params, user_id)
+        await generation_cache.set(key, params["model"], content)
+    return content
+
+
+async def stream_prompt(
+    prompt: str, force_regenerate: bool = False, provider: Optional[str] = None, user_id: Optional[int] = None
+) -> AsyncIterator[str]:
+    """流式生成文本，命中缓存时一次性返回缓存结果"""
+    llm = get_provider(provider)
+    params = llm.params()
+    key = make_cache_key(prompt, params, user_id)
+    if settings.GENERATION_CACHE_ENABLED and not force_regenerate:
+        cached = await generation_cache.get(key)
+        if cached is not None:
+            logger.info(f"命中生成结果缓存: {key[:12]}")
+            yield cached
+            return
+    
+    chunks = []
+    secondary = hedge_provider(llm)
+    info = {"provider": llm}
+    stream = llm.stream(prompt) if secondary is None else hedged_stream(llm, secondary, prompt, info)
     try:
-        # 调用通义千问API
-        async with httpx.AsyncClient(timeout=120) as client:
-            response = await client.post(
-                settings.QWEN_API_URL,
-                headers={
-                    "Authorization": f"Bearer {settings.QWEN_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "qwen-max-latest",
-                    "input": {"prompt": prompt},
-                    "parameters": {
-                        "max_tokens": 4000,
-                        "temperature": 0.7,
-                        "top_p": 0.8
-                    }
-                }
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"通义千问API错误: {response.text}")
-                return None
-            
-            # 解析响应
-            result = response.json()
-            report_content = result.get("output", {}).get("text", "")
-            if not report_content:
-                logger.error("通义千问返回内容为空")
-                return None
-            
-            # 创建报告
-            report_title = f"{task.title} - 实训报告"
-            new_report = Report(
-                title=report_title,
-                content=report_content,
-                task_id=task_id,
-                user_id=user_id,
-                template_id=template_id
-            )
-            
-            db.add(new_report)
-            db.commit()
-            db.refresh(new_report)
-            
-            logger.info(f"成功生成报告ID: {new_report.id}")
-            return new_report
-            
+        async for text in stream:
+            chunks.append(text)
+            yield text
+    except CircuitOpenError as e:
+        # 熔断发生在输出任何内容之前，降级结果一次性返回
+        if chunks:
+            raise
+        content, used = await _degraded_complete(llm, prompt, None, key, e)
+        yield content
+        if used is None:
+            return
+        info["provider"] = used
+        chunks.append(content)
+    
+    content = "".join(chunks)
+    if content and settings.GENERATION_CACHE_ENABLED:
+        if info["provider"] is not llm:
+            params = info["provider"].params()
+            key = make_cache_key(prompt, params, user_id)
+        await generation_cache.set(key, params["model"], content)
+
+
+def _section_result(index: int, result) -> Tuple[str, bool]:
+    """返回部分内容及是否失败，失败时以占位文字代替"""
+    title = REPORT_SECTIONS[index][0]
+    if isinstance(result, BaseException):
+        if not isinstance(result, Exception):
+            raise result
+        logger.error(f"生成报告部分失败: {title}, {str(result)}")
+        return f"{title}\n\n{SECTION_FAILED_TEXT}", True
+    return result.strip(), False
+
+
+async def generate_sections(
+    prompts: List[Prompt],
+    force_regenerate: bool = False,
+    provider: Optional[str] = None,
+    user_id: Optional[int] = None
+) -> str:
+    """并发生成五个部分并按规范顺序拼接，单个部分失败不影响其他部分"""
+    results = await asyncio.gather(
+        *(complete_prompt(prompt.text, force_regenerate, provider, user_id=user_id) for prompt in prompts),
+        return_exceptions=True
+    )
+    
+    sections = [_section_result(i, result) for i, result in enumerate(results)]
+    if all(failed for _, failed in sections):
+        raise GenerationError("所有部分均生成失败")
+    return "\n\n".join(text for text, _ in sections)
+
+
+async def stream_sections(
+    prompts: List[Prompt],
+    force_regenerate: bool = False,
+    provider: Optional[str] = None,
+    user_id: Optional[int] = None
+) -> AsyncIterator[str]:
+    """并发生成五个部分，按规范顺序在每个部分完成时输出"""
+    pending = [
+        asyncio.create_task(complete_prompt(prompt.text, force_regenerate, provider, user_id=user_id))
+        for prompt in prompts
+    ]
+    failures = 0
+    try:
+        for i, future in enumerate(pending):
+            try:
+                result = await future
+            except Exception as e:
+                result = e
+            text, failed = _section_result(i, result)
+            failures += failed
+            yield text if i == 0 else "\n\n" + text
+    finally:
+        for future in pending:
+            future.cancel()
+    
+    if failures == len(REPORT_SECTIONS):
+        raise GenerationError("所有部分均生成失败")
+
+
+def _agent_complete(force_regenerate: bool, provider: Optional[str], user_id: Optional[int]):
+    """多阶段生成使用的模型调用，按阶段限制生成长度"""
+    return lambda text, max_tokens: complete_prompt(text, force_regenerate, provider, max_tokens, user_id)
+
+
+def stream_report_content(
+    prompts: List[Prompt],
+    force_regenerate: bool = False,
+    provider: Optional[str] = None,
+    mode: Optional[str] = None,
+    on_agent_run: Optional[Callable[[DagRun], None]] = None,
+    user_id: Optional[int] = None
+) -> AsyncIterator[str]:
+    """流式输出报告内容：agents 模式多阶段生成，完成后以执行结果回调 on_agent_run；
+    多条提示词时按部分并发生成"""
+    if (mode or settings.REPORT_GENERATION_MODE) == "agents":
+        return stream_agent_report(prompts, _agent_complete(force_regenerate, provider, user_id), on_agent_run)
+    if len(prompts) > 1:
+        return stream_sections(prompts, force_regenerate, provider, user_id)
+    return stream_prompt(prompts[0].text, force_regenerate, provider, user_id)
+
+
+async def generate_report_with_qwen(
+    db: AsyncSession,
+    task_id: int,
+    user_id: int,
+    template_id: Optional[int] = None,
+    force_regenerate: bool = False,
+    mode: Optional[str] = None,
+    provider: Optional[str] = None
+) -> Optional[Report]:
+    """调用大模型生成报告（默认使用通义千问，可通过 provider 切换本地模型）"""
+    task, template = await load_generation_context(db, task_id, template_id)
+    if not task:
+        return None
+    
+    started = time.perf_counter()
+    try:
+        references = await retrieve_for_task(db, task)
+        # 读取完成，模型调用期间不占用数据库连接，保存报告时再重新获取
+        await release_connection(db)
+        prompts = build_prompts(task, template, mode, references)
+        agent_run = None
+        if (mode or settings.REPORT_GENERATION_MODE) == "agents":
+            agent_run = await generate_with_agents(prompts, _agent_complete(force_regenerate, provider, user_id))
+            report_content = agent_run.outputs["format"]
+        elif len(prompts) > 1:
+            report_content = await generate_sections(prompts, force_regenerate, provider, user_id)
+        else:
+            report_content = await complete_prompt(prompts[0].text, force_regenerate, provider, user_id=user_id)
+        
+        # 取消只会发生在上面的 await 处，走到这里说明调用方仍在等待，才保存报告
+        report = await save_report(db, task, user_id, template_id, report_content, prompts, agent_run)
+        record_generation(mode, started)
+        return report
+    
+    except asyncio.CancelledError:
+        logger.info(f"报告生成已取消: 任务ID={task_id}, 用户ID={user_id}")
+        record_generation(mode, started, "cancelled")
+        raise
     except Exception as e:
         logger.error(f"生成报告时发生错误: {str(e)}")
+        record_generation(mode, started, failure_cause(e))
         return None
@@ -1,19 +1,32 @@
 from typing import Optional
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from ..database import release_connection
 from ..models.user import User
-from ..utils.security import verify_password, get_password_hash
+from ..utils.security import hash_password, verify_and_update_password
 
-def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
+async def authenticate_user(db: AsyncSession, username: str, password: str) -> Optional[User]:
     """验证用户"""
-    user = db.query(User).filter(User.username == username).first()
-    if not user or not verify_password(password, user.hashed_password):
+    user = await db.scalar(select(User).where(User.username == username))
+    if not user:
         return None
+    # 哈希在线程池中排队、计算期间不占用数据库连接，需要保存新哈希时再重新获取
+    await release_connection(db)
+    valid, new_hash = await verify_and_update_password(password, user.hashed_password)
+    if not valid:
+        return None
+    if new_hash:
+        # 哈希成本与当前配置不一致，借本次登录按新成本保存
+        user.hashed_password = new_hash
+        await db.commit()
     return user
 
-def create_user(db: Session, user_data: dict) -> User:
+async def create_user(db: AsyncSession, user_data: dict) -> User:
     """创建用户"""
-    hashed_password = get_password_hash(user_data["password"])
+    # 注册接口的查重查询已开启事务，哈希期间先归还连接
+    await release_connection(db)
+    hashed_password = await hash_password(user_data["password"])
     
     # 创建用户对象，包含所有提交的字段
     user = User(
@@ -30,7 +43,7 @@ def create_user(db: Session, user_data: dict) -> User:
     )
     
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
 
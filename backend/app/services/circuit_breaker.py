@@ -0,0 +1,172 @@
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from ..config import settings
+from ..utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# 熔断器状态
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+_STATE_VALUES = {CIRCUIT_CLOSED: 0, CIRCUIT_HALF_OPEN: 1, CIRCUIT_OPEN: 2}
+
+llm_circuit_state = registry.gauge(
+    "llm_circuit_state", "模型服务熔断器状态：0关闭，1半开，2打开", ("provider",)
+)
+llm_circuit_transitions_total = registry.counter(
+    "llm_circuit_transitions_total", "熔断器状态切换次数", ("provider", "state")
+)
+llm_circuit_rejected_total = registry.counter(
+    "llm_circuit_rejected_total", "熔断期间被直接拒绝的模型调用次数", ("provider",)
+)
+
+
+@dataclass(frozen=True)
+class CircuitPermit:
+    """acquire 放行时发放的凭证：放行时的状态代数，以及是否为半开状态下的探测调用"""
+    generation: int
+    probe: bool = False
+
+
+class CircuitBreaker:
+    """模型服务熔断器：连续失败达到阈值后打开，期间直接拒绝调用；
+    冷却时间过后进入半开状态放行少量探测调用，探测成功则关闭，失败则重新打开"""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int,
+        recovery_timeout: float,
+        half_open_max_calls: int = 1
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probes = 0
+        # 每次状态切换加一，结果只对放行时所在代数的状态生效，切换之前放行的调用结果一律忽略
+        self.generation = 0
+        # 同步调用方（如线程池中的向量化）也可能使用，状态修改加锁
+        self._lock = threading.Lock()
+        llm_circuit_state.set(0, provider=name)
+
+    @property
+    def enabled(self) -> bool:
+        return self.failure_threshold > 0
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        logger.warning(f"{self.name}熔断器状态: {self.state} -> {state}")
+        self.state = state
+        self.generation += 1
+        llm_circuit_state.set(_STATE_VALUES[state], provider=self.name)
+        llm_circuit_transitions_total.inc(provider=self.name, state=state)
+
+    def retry_after(self) -> float:
+        """距离允许探测调用还有多少秒"""
+        if self.state != CIRCUIT_OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.recovery_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        """当前是否允许发起调用，不占用半开状态的探测名额"""
+        if not self.enabled or self.state == CIRCUIT_CLOSED:
+            return True
+        if self.state == CIRCUIT_OPEN:
+            return self.retry_after() <= 0
+        return self._probes < self.half_open_max_calls
+
+    def acquire(self) -> Optional[CircuitPermit]:
+        """调用前检查，返回None表示熔断中应直接拒绝；半开状态下占用一个探测名额。
+        调用结束后把返回的凭证交给 record_success / record_failure / release"""
+        if not self.enabled:
+            return CircuitPermit(self.generation)
+        with self._lock:
+            if self.state == CIRCUIT_OPEN and self.retry_after() <= 0:
+                self._transition(CIRCUIT_HALF_OPEN)
+                self._probes = 0
+            if self.state == CIRCUIT_OPEN or (
+                self.state == CIRCUIT_HALF_OPEN and self._probes >= self.half_open_max_calls
+            ):
+                llm_circuit_rejected_total.inc(provider=self.name)
+                return None
+            if self.state == CIRCUIT_HALF_OPEN:
+                self._probes += 1
+                return CircuitPermit(self.generation, probe=True)
+            return CircuitPermit(self.generation)
+
+    def _current(self, permit: CircuitPermit) -> bool:
+        # 放行之后状态已经切换过（如关闭状态放行的慢调用返回时熔断器已打开），结果已过时
+        return permit.generation == self.generation
+
+    def record_success(self, permit: CircuitPermit):
+        if not self.enabled:
+            return
+        with self._lock:
+            if not self._current(permit):
+                return
+            if permit.probe:
+                # 只有探测调用决定半开状态的去向
+                self._probes = max(0, self._probes - 1)
+                self.failures = 0
+                self._transition(CIRCUIT_CLOSED)
+            else:
+                self.failures = 0
+
+    def record_failure(self, permit: CircuitPermit, count: int = 1):
+        """记录失败，count 为本次调用中失败的请求次数（连接阶段的错误每次重试都计入）"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if not self._current(permit):
+                return
+            if permit.probe:
+                self._open()
+                return
+            self.failures += count
+            if self.failures >= self.failure_threshold:
+                self._open()
+
+    def _open(self):
+        self.opened_at = time.monotonic()
+        self._probes = 0
+        self._transition(CIRCUIT_OPEN)
+
+    def release(self, permit: CircuitPermit):
+        """调用被取消，既不算成功也不算失败，归还半开状态的探测名额"""
+        if not self.enabled or not permit.probe:
+            return
+        with self._lock:
+            if self._current(permit):
+                self._probes = max(0, self._probes - 1)
+
+    def snapshot(self) -> dict:
+        """健康检查展示的状态，冷却期已过、等待探测调用时显示为半开"""
+        state = self.state
+        if state == CIRCUIT_OPEN and self.retry_after() <= 0:
+            state = CIRCUIT_HALF_OPEN
+        return {
+            "state": state,
+            "failures": self.failures,
+            "retry_after": math.ceil(self.retry_after())
+        }
+
+
+def create_breaker(name: str) -> CircuitBreaker:
+    return CircuitBreaker(
+        name,
+        failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+        recovery_timeout=settings.CIRCUIT_RECOVERY_SECONDS,
+        half_open_max_calls=settings.CIRCUIT_HALF_OPEN_MAX_CALLS
+    )
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from ..utils.metrics import registry
+from ..utils.tokenizer import count_tokens
+from .llm_providers import GenerationError
+
+logger = logging.getLogger(__name__)
+
+dag_stage_duration_seconds = registry.histogram(
+    "dag_stage_duration_seconds",
+    "DAG各阶段节点的耗时（秒）",
+    ("stage", "outcome"),
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 90, 120, 180)
+)
+dag_stage_budget_exceeded_total = registry.counter(
+    "dag_stage_budget_exceeded_total", "DAG节点超出预算的次数", ("stage", "budget")
+)
+
+# 节点状态
+NODE_OK = "ok"
+NODE_FAILED = "failed"
+NODE_TIMEOUT = "timeout"
+NODE_CANCELLED = "cancelled"
+
+
+class DagError(GenerationError):
+    """DAG定义错误，或没有降级方案的节点执行失败"""
+
+
+@dataclass
+class StageBudget:
+    """单个节点的预算：生成令牌上限和超时秒数，0表示不限制；
+    令牌上限由节点传给模型（trace.budget.max_tokens），执行器按输出的令牌数统计超出次数"""
+    max_tokens: int = 0
+    timeout: float = 0
+
+
+@dataclass
+class NodeTrace:
+    """节点执行记录"""
+    name: str
+    stage: str
+    budget: StageBudget
+    status: str = ""
+    fallback: bool = False  # 是否使用了降级结果
+    started_at: float = 0.0  # 相对整个DAG开始的秒数
+    duration: float = 0.0
+    prompt_tokens: int = 0  # 由节点自行记录
+    output_tokens: int = 0
+    error: Optional[str] = None
+
+
+# 节点函数：run(输入, 执行记录) -> 输出；降级函数：fallback(输入) -> 输出
+NodeFunc = Callable[[Dict[str, Any], NodeTrace], Awaitable[Any]]
+FallbackFunc = Callable[[Dict[str, Any]], Any]
+
+
+@dataclass
+class Node:
+    """DAG节点：inputs 中的值全部就绪后运行，结果以节点名写入上下文"""
+    name: str
+    run: NodeFunc
+    inputs: Tuple[str, ...] = ()
+    stage: str = ""  # 指标标签，同类节点共用，默认为节点名
+    budget: StageBudget = field(default_factory=StageBudget)
+    fallback: Optional[FallbackFunc] = None  # 失败或超时时的降级结果，为None时整个DAG失败
+
+
+@dataclass
+class DagRun:
+    """一次DAG执行的结果和各节点记录"""
+    outputs: Dict[str, Any]
+    traces: List[NodeTrace]
+    duration: float
+
+    def summary(self) -> str:
+        parts = [
+            f"{t.name}@{t.started_at:.1f}s+{t.duration:.1f}s {t.status}{'(降级)' if t.fallback else ''}"
+            for t in sorted(self.traces, key=lambda t: t.started_at)
+        ]
+        return f"总耗时{self.duration:.1f}s: " + ", ".join(parts)
+
+
+class DagExecutor:
+    """小型DAG执行器：输入就绪的节点立即并发运行，只有存在依赖的节点才串行"""
+
+    def __init__(self, nodes: Sequence[Node]):
+        names = [node.name for node in nodes]
+        if len(set(names)) != len(names):
+            raise DagError("DAG节点名称重复")
+        self.nodes = list(nodes)
+        self._check_acyclic()
+
+    def _check_acyclic(self):
+        produced = {node.name for node in self.nodes}
+        remaining = {node.name: {i for i in node.inputs if i in produced} for node in self.nodes}
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                raise DagError(f"DAG存在循环依赖: {', '.join(sorted(remaining))}")
+            for name in ready:
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+
+    async def run(
+        self,
+        context: Dict[str, Any],
+        on_result: Optional[Callable[[str, Any], None]] = None
+    ) -> DagRun:
+        """执行DAG，context 为初始输入；on_result 在每个节点完成时回调"""
+        produced = {node.name for node in self.nodes}
+        missing = {i for node in self.nodes for i in node.inputs if i not in produced and i not in context}
+        if missing:
+            raise DagError(f"DAG缺少输入: {', '.join(sorted(missing))}")
+
+        outputs = dict(context)
+        traces: List[NodeTrace] = []
+        pending = list(self.nodes)
+        running: Dict[asyncio.Task, Node] = {}
+        started = time.perf_counter()
+        try:
+            while pending or running:
+                for node in [n for n in pending if all(i in outputs for i in n.inputs)]:
+                    pending.remove(node)
+                    trace = NodeTrace(node.name, node.stage or node.name, node.budget)
+                    traces.append(trace)
+                    inputs = {i: outputs[i] for i in node.inputs}
+                    running[asyncio.create_task(self._run_node(node, inputs, trace, started))] = node
+
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    node = running.pop(task)
+                    outputs[node.name] = task.result()
+                    if on_result is not None:
+                        on_result(node.name, outputs[node.name])
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        return DagRun(outputs, traces, time.perf_counter() - started)
+
+    @staticmethod
+    async def _run_node(node: Node, inputs: Dict[str, Any], trace: NodeTrace, dag_started: float) -> Any:
+        start = time.perf_counter()
+        trace.started_at = start - dag_started
+        error = None
+        try:
+            if node.budget.timeout > 0:
+                value = await asyncio.wait_for(node.run(inputs, trace), node.budget.timeout)
+            else:
+                value = await node.run(inputs, trace)
+            trace.status = NODE_OK
+        except asyncio.TimeoutError as e:
+            trace.status = NODE_TIMEOUT
+            dag_stage_budget_exceeded_total.inc(stage=trace.stage, budget="time")
+            error = e
+        except asyncio.CancelledError:
+            trace.status = NODE_CANCELLED
+            raise
+        except Exception as e:
+            trace.status = NODE_FAILED
+            error = e
+        finally:
+            trace.duration = time.perf_counter() - start
+            dag_stage_duration_seconds.observe(trace.duration, stage=trace.stage, outcome=trace.status or NODE_FAILED)
+
+        if error is not None:
+            trace.error = str(error) or type(error).__name__
+            logger.warning(f"DAG节点{node.name}{'超时' if trace.status == NODE_TIMEOUT else '失败'}: {trace.error}")
+            if node.fallback is None:
+                raise DagError(f"{node.name}阶段失败") from error
+            trace.fallback = True
+            value = node.fallback(inputs)
+        if isinstance(value, str):
+            trace.output_tokens = count_tokens(value)
+            # 令牌上限同时作为生成参数传给模型，超出说明模型未遵守或本地估算偏大，只记录不中断
+            if not trace.fallback and 0 < node.budget.max_tokens < trace.output_tokens:
+                dag_stage_budget_exceeded_total.inc(stage=trace.stage, budget="tokens")
+                logger.warning(
+                    f"DAG节点{node.name}输出{trace.output_tokens}令牌，超出预算{node.budget.max_tokens}"
+                )
+        return value
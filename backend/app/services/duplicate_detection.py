@@ -0,0 +1,256 @@
+import hashlib
+import logging
+import re
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import and_, delete, event, insert, inspect, select, update
+from sqlalchemy.orm import Session, aliased
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models.report import Report
+from ..models.similarity import ReportLshBand, ReportSignature
+from ..models.user import User
+from ..utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+duplicate_search_duration_seconds = registry.histogram(
+    "report_duplicate_search_duration_seconds",
+    "报告查重检索耗时（秒）",
+    ("scope",),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+report_signatures_total = registry.counter(
+    "report_signatures_computed_total", "计算的报告MinHash签名数", ("operation",)
+)
+
+# 大于 2^32 的素数，哈希族 h(x) = (a*x + b) mod p 在 uint64 内不会溢出
+_PRIME = np.uint64(4294967311)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+# 只保留文字和数字，忽略空白、标点和大小写差异
+_NOISE = re.compile(r"[\W_]+")
+
+if settings.DUPLICATE_NUM_PERM % settings.DUPLICATE_LSH_BANDS:
+    raise ValueError("DUPLICATE_NUM_PERM 必须是 DUPLICATE_LSH_BANDS 的整数倍")
+_ROWS_PER_BAND = settings.DUPLICATE_NUM_PERM // settings.DUPLICATE_LSH_BANDS
+
+# 固定种子，保证不同进程、重启前后的签名可以互相比较
+_rng = np.random.RandomState(20240601)
+_PERM_A = _rng.randint(1, 2 ** 32 - 1, size=settings.DUPLICATE_NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, 2 ** 32 - 1, size=settings.DUPLICATE_NUM_PERM, dtype=np.uint64)
+
+
+@dataclass
+class ReportBrief:
+    """查重结果中的报告概要"""
+    id: int
+    title: str
+    user_id: int
+    username: str
+    full_name: Optional[str]
+    created_at: object
+
+
+def shingles(content: str, size: Optional[int] = None) -> np.ndarray:
+    """规范化文本后按字符 n-gram 切分，返回去重后的32位哈希"""
+    size = size or settings.DUPLICATE_SHINGLE_SIZE
+    normalized = _NOISE.sub("", (content or "").lower())
+    if not normalized:
+        return np.empty(0, dtype=np.uint64)
+    if len(normalized) <= size:
+        grams = [normalized]
+    else:
+        grams = [normalized[i:i + size] for i in range(len(normalized) - size + 1)]
+    return np.unique(np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams)))
+
+
+def minhash(hashes: np.ndarray) -> np.ndarray:
+    """计算MinHash签名，分块计算以控制内存占用"""
+    signature = np.full(settings.DUPLICATE_NUM_PERM, _MAX_HASH, dtype=np.uint64)
+    for i in range(0, len(hashes), 4096):
+        block = hashes[i:i + 4096, None]
+        values = (block * _PERM_A + _PERM_B) % _PRIME & _MAX_HASH
+        np.minimum(signature, values.min(axis=0), out=signature)
+    return signature.astype(np.uint32)
+
+
+def band_buckets(signature: np.ndarray) -> List[int]:
+    """LSH分段：每段签名哈希成一个64位桶号"""
+    buckets = []
+    for band in range(settings.DUPLICATE_LSH_BANDS):
+        rows = signature[band * _ROWS_PER_BAND:(band + 1) * _ROWS_PER_BAND].tobytes()
+        digest = hashlib.blake2b(rows, digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, "big", signed=True))
+    return buckets
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """由签名估计Jaccard相似度"""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+def _load_signature(value: bytes) -> np.ndarray:
+    return np.frombuffer(value, dtype=np.uint32)
+
+
+def update_signature(conn, report_id: int, task_id: int, content: str):
+    """计算并保存报告签名，只改写桶号发生变化的分段"""
+    hashes = shingles(content)
+    if len(hashes) == 0:
+        remove_signature(conn, report_id)
+        return
+    signature = minhash(hashes)
+    buckets = band_buckets(signature)
+
+    previous = conn.execute(
+        select(ReportSignature.task_id).where(ReportSignature.report_id == report_id)
+    ).first()
+    exists = previous is not None
+    values = dict(task_id=task_id, signature=signature.tobytes(), shingle_count=len(hashes))
+    if exists:
+        conn.execute(update(ReportSignature).where(ReportSignature.report_id == report_id).values(**values))
+    else:
+        conn.execute(insert(ReportSignature).values(report_id=report_id, **values))
+
+    if exists and previous.task_id != task_id:
+        conn.execute(update(ReportLshBand).where(ReportLshBand.report_id == report_id).values(task_id=task_id))
+    current = dict(conn.execute(
+        select(ReportLshBand.band, ReportLshBand.bucket).where(ReportLshBand.report_id == report_id)
+    ).all())
+    for band, bucket in enumerate(buckets):
+        if band not in current:
+            conn.execute(insert(ReportLshBand).values(report_id=report_id, band=band, task_id=task_id, bucket=bucket))
+        elif current[band] != bucket:
+            conn.execute(update(ReportLshBand).where(
+                ReportLshBand.report_id == report_id, ReportLshBand.band == band
+            ).values(bucket=bucket))
+    report_signatures_total.inc(operation="update" if exists else "create")
+
+
+def remove_signature(conn, report_id: int):
+    """删除报告签名"""
+    conn.execute(delete(ReportLshBand).where(ReportLshBand.report_id == report_id))
+    conn.execute(delete(ReportSignature).where(ReportSignature.report_id == report_id))
+
+
+def _content_changed(report: Report) -> bool:
+    state = inspect(report)
+    return state.attrs.content.history.has_changes() or state.attrs.task_id.history.has_changes()
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _sync_signatures(session: Session, flush_context):
+    """报告新增、内容修改或删除时在同一事务内维护签名"""
+    conn = None
+    for obj in session.new:
+        if isinstance(obj, Report):
+            conn = conn or session.connection()
+            update_signature(conn, obj.id, obj.task_id, obj.content)
+    for obj in session.dirty:
+        if isinstance(obj, Report) and _content_changed(obj):
+            conn = conn or session.connection()
+            update_signature(conn, obj.id, obj.task_id, obj.content)
+    for obj in session.deleted:
+        if isinstance(obj, Report):
+            conn = conn or session.connection()
+            remove_signature(conn, obj.id)
+
+
+def _report_briefs(db: Session, report_ids: Iterable[int]) -> Dict[int, ReportBrief]:
+    rows = db.query(
+        Report.id, Report.title, Report.user_id, User.username, User.full_name, Report.created_at
+    ).join(User, Report.user_id == User.id).filter(Report.id.in_(list(report_ids))).all()
+    return {row.id: ReportBrief(*row) for row in rows}
+
+
+def _signatures(db: Session, report_ids: Iterable[int]) -> Dict[int, np.ndarray]:
+    rows = db.query(ReportSignature.report_id, ReportSignature.signature).filter(
+        ReportSignature.report_id.in_(list(report_ids))
+    ).all()
+    return {row.report_id: _load_signature(row.signature) for row in rows}
+
+
+def find_report_duplicates(
+    db: Session, report: Report, threshold: Optional[float] = None
+) -> List[Tuple[ReportBrief, float]]:
+    """同一任务下与指定报告相似的其他学生报告，按相似度降序"""
+    threshold = settings.DUPLICATE_THRESHOLD if threshold is None else threshold
+    with duplicate_search_duration_seconds.time(scope="report"):
+        own = aliased(ReportLshBand)
+        other = aliased(ReportLshBand)
+        candidates = {row[0] for row in db.query(other.report_id).join(own, and_(
+            own.task_id == other.task_id, own.band == other.band, own.bucket == other.bucket
+        )).filter(own.report_id == report.id, other.report_id != report.id).distinct().all()}
+        if not candidates:
+            return []
+
+        signatures = _signatures(db, candidates | {report.id})
+        if report.id not in signatures:
+            return []
+        briefs = _report_briefs(db, candidates)
+        results = []
+        for report_id in candidates:
+            brief = briefs.get(report_id)
+            if brief is None or report_id not in signatures or brief.user_id == report.user_id:
+                continue
+            score = similarity(signatures[report.id], signatures[report_id])
+            if score >= threshold:
+                results.append((brief, score))
+    return sorted(results, key=lambda item: item[1], reverse=True)
+
+
+def find_task_duplicates(
+    db: Session, task_id: int, threshold: Optional[float] = None
+) -> List[Tuple[ReportBrief, ReportBrief, float]]:
+    """任务下所有疑似重复的报告对（不同学生之间），按相似度降序"""
+    threshold = settings.DUPLICATE_THRESHOLD if threshold is None else threshold
+    with duplicate_search_duration_seconds.time(scope="task"):
+        first = aliased(ReportLshBand)
+        second = aliased(ReportLshBand)
+        pairs = db.query(first.report_id, second.report_id).join(second, and_(
+            second.task_id == first.task_id,
+            second.band == first.band,
+            second.bucket == first.bucket,
+            second.report_id > first.report_id
+        )).filter(first.task_id == task_id).distinct().all()
+        if not pairs:
+            return []
+
+        ids = {report_id for pair in pairs for report_id in pair}
+        signatures = _signatures(db, ids)
+        briefs = _report_briefs(db, ids)
+        results = []
+        for a, b in pairs:
+            if a not in briefs or b not in briefs or briefs[a].user_id == briefs[b].user_id:
+                continue
+            score = similarity(signatures[a], signatures[b])
+            if score >= threshold:
+                results.append((briefs[a], briefs[b], score))
+    return sorted(results, key=lambda item: item[2], reverse=True)
+
+
+def rebuild_signatures(db: Session, only_missing: bool = True, batch_size: int = 200) -> int:
+    """为已有报告补算签名，返回处理的报告数"""
+    query = db.query(Report.id, Report.task_id, Report.content)
+    if only_missing:
+        query = query.filter(~Report.id.in_(select(ReportSignature.report_id)))
+    total = 0
+    started = time.perf_counter()
+    last_id = 0
+    while True:
+        rows = query.filter(Report.id > last_id).order_by(Report.id).limit(batch_size).all()
+        if not rows:
+            break
+        conn = db.connection()
+        for row in rows:
+            update_signature(conn, row.id, row.task_id, row.content)
+        db.commit()
+        total += len(rows)
+        last_id = rows[-1].id
+    logger.info(f"报告签名重建完成: {total} 份, 耗时 {time.perf_counter() - started:.1f}s")
+    return total
@@ -0,0 +1,110 @@
+import datetime
+import hashlib
+import json
+import logging
+from typing import Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..models.generation_cache import GenerationCacheEntry
+from ..utils.lru import TTLCache
+from ..utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+cache_hits_total = registry.counter(
+    "generation_cache_hits_total", "生成结果缓存命中次数", ("tier",)
+)
+cache_misses_total = registry.counter(
+    "generation_cache_misses_total", "生成结果缓存未命中次数"
+)
+
+
+def make_cache_key(prompt: str, params: dict, user_id: Optional[int] = None) -> str:
+    """按提示词、模型参数和用户计算内容地址；按用户隔离，任务和模板相同的不同学生不会拿到同一份文本，
+    否则会被查重误判为抄袭"""
+    raw = json.dumps({"prompt": prompt, "params": params, "user_id": user_id}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """两级生成结果缓存：进程内LRU + 数据库表"""
+
+    def __init__(self, memory_entries: int, db_entries: int, ttl: int):
+        self.db_entries = db_entries
+        self.ttl = ttl
+        self._memory = TTLCache(memory_entries, ttl)
+
+    async def get(self, key: str, allow_stale: bool = False) -> Optional[str]:
+        """allow_stale 为True时也返回已过期但尚未清理的条目，供模型服务熔断时降级使用"""
+        content = self._memory.get(key)
+        if content is not None:
+            cache_hits_total.inc(tier="memory")
+            return content
+
+        # 各部分并发查询缓存，每次使用独立的短会话，不与请求会话共享
+        async with AsyncSessionLocal() as db:
+            query = select(GenerationCacheEntry).where(GenerationCacheEntry.key == key)
+            if not allow_stale:
+                query = query.where(GenerationCacheEntry.expires_at > datetime.datetime.utcnow())
+            entry = await db.scalar(query)
+            if entry is None:
+                cache_misses_total.inc()
+                return None
+
+            entry.hit_count += 1
+            await db.commit()
+        self._memory.set(key, entry.content)
+        cache_hits_total.inc(tier="db")
+        return entry.content
+
+    async def set(self, key: str, model: str, content: str):
+        self._memory.set(key, content)
+
+        now = datetime.datetime.utcnow()
+        entry = GenerationCacheEntry(
+            key=key,
+            model=model,
+            content=content,
+            hit_count=0,
+            created_at=now,
+            expires_at=now + datetime.timedelta(seconds=self.ttl)
+        )
+        async with AsyncSessionLocal() as db:
+            try:
+                await db.merge(entry)
+                await db.commit()
+                await self._evict(db)
+            except IntegrityError:
+                # 共享同一次模型调用的并发请求会写入相同的键，已有其他请求写入
+                await db.rollback()
+            except Exception as e:
+                await db.rollback()
+                logger.warning(f"写入生成结果缓存失败: {str(e)}")
+
+    async def _evict(self, db: AsyncSession):
+        """删除过期条目，并按创建时间淘汰超出容量的条目"""
+        now = datetime.datetime.utcnow()
+        await db.execute(delete(GenerationCacheEntry).where(
+            GenerationCacheEntry.expires_at <= now
+        ).execution_options(synchronize_session=False))
+
+        overflow = await db.scalar(select(func.count()).select_from(GenerationCacheEntry)) - self.db_entries
+        if overflow > 0:
+            oldest = select(GenerationCacheEntry.key).order_by(
+                GenerationCacheEntry.created_at.asc()
+            ).limit(overflow).subquery()
+            await db.execute(delete(GenerationCacheEntry).where(
+                GenerationCacheEntry.key.in_(select(oldest.c.key))
+            ).execution_options(synchronize_session=False))
+        await db.commit()
+
+generation_cache = GenerationCache(
+    memory_entries=settings.GENERATION_CACHE_MEMORY_ENTRIES,
+    db_entries=settings.GENERATION_CACHE_DB_ENTRIES,
+    ttl=settings.GENERATION_CACHE_TTL_SECONDS
+)
@@ -0,0 +1,175 @@
+import asyncio
+import contextvars
+import logging
+import math
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Optional, Tuple
+
+from ..config import settings
+from ..utils.metrics import registry
+from .llm_providers import LLMProvider, get_provider
+
+logger = logging.getLogger(__name__)
+
+llm_hedged_requests_total = registry.counter(
+    "llm_hedged_requests_total", "主提供方超过对冲延迟仍无输出、向备用提供方发出的请求数", ("route", "provider")
+)
+llm_hedge_wins_total = registry.counter(
+    "llm_hedge_wins_total", "对冲请求中先完成的一方", ("route", "winner")
+)
+
+# 当前生成请求所属的路由，由生成入口设置，并发子任务会继承
+_current_route: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("hedge_route", default=None)
+
+
+def set_route(route: str):
+    """标记当前任务内的模型调用来自哪个路由，只有 HEDGE_ROUTES 中的路由启用对冲"""
+    _current_route.set(route)
+
+
+class LatencyTracker:
+    """按提供方记录最近的调用耗时，计算对冲延迟使用的分位数"""
+
+    def __init__(self, window: int):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def observe(self, key: str, seconds: float):
+        self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, key: str, percent: float) -> Optional[float]:
+        """样本不足 HEDGE_MIN_SAMPLES 时返回None"""
+        samples = self._samples.get(key)
+        if not samples or len(samples) < settings.HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, max(0, math.ceil(percent / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+
+latency_tracker = LatencyTracker(settings.HEDGE_WINDOW)
+
+
+def _tracker_key(provider: LLMProvider, stream: bool) -> str:
+    return f"{provider.name}:{'first_token' if stream else 'complete'}"
+
+
+def hedge_delay(provider: LLMProvider, stream: bool = False) -> float:
+    """主提供方等待多久仍无输出时发出对冲请求：近期耗时的 HEDGE_PERCENTILE 分位数，样本不足时用默认值"""
+    delay = latency_tracker.percentile(_tracker_key(provider, stream), settings.HEDGE_PERCENTILE)
+    if delay is None:
+        delay = settings.HEDGE_DEFAULT_DELAY
+    return max(settings.HEDGE_MIN_DELAY, delay)
+
+
+def hedge_provider(primary: LLMProvider) -> Optional[LLMProvider]:
+    """当前路由启用对冲时返回备用提供方，否则返回None"""
+    route = _current_route.get()
+    if not settings.HEDGE_PROVIDER or route is None or route not in settings.HEDGE_ROUTES:
+        return None
+    return get_provider(settings.HEDGE_PROVIDER)
+
+
+def _record(primary: LLMProvider, stream: bool, started: float, task: asyncio.Task):
+    """记录主请求的耗时样本：成功时为实际耗时，仍未完成（落败将被取消）时为已耗时；
+    主请求出错时不记录，否则熔断、4xx等快速失败会拉低分位数，使对冲在服务异常时更频繁"""
+    if task.done() and (task.cancelled() or task.exception() is not None):
+        return
+    latency_tracker.observe(_tracker_key(primary, stream), time.perf_counter() - started)
+
+
+async def _cancel(task: asyncio.Task):
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+async def _race(
+    primary: asyncio.Task, start_secondary, delay: float, route: str
+) -> Tuple[asyncio.Task, Optional[asyncio.Task]]:
+    """等待主请求 delay 秒，仍未完成时发出备用请求；返回先成功的任务和另一个任务，都失败时返回主任务"""
+    done, _ = await asyncio.wait({primary}, timeout=delay)
+    if done:
+        return primary, None
+    secondary = start_secondary()
+    pending = {primary, secondary}
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is None:
+                llm_hedge_wins_total.inc(route=route, winner="primary" if task is primary else "secondary")
+                return task, secondary if task is primary else primary
+    # 两个请求都失败，按主请求的结果抛出
+    return primary, None
+
+
+async def hedged_complete(
+    primary: LLMProvider, secondary: LLMProvider, prompt: str, max_tokens: Optional[int] = None
+) -> Tuple[str, LLMProvider]:
+    """对冲调用：主提供方超过对冲延迟仍未返回时，同样的请求发给备用提供方，先完成者胜出，另一方取消；
+    返回生成文本和实际生成的提供方"""
+    route = _current_route.get()
+    started = time.perf_counter()
+    first = asyncio.create_task(primary.complete(prompt, max_tokens))
+
+    def start_secondary():
+        llm_hedged_requests_total.inc(route=route, provider=secondary.name)
+        logger.info(f"{primary.name}超过对冲延迟仍未返回，向{secondary.name}发送对冲请求")
+        return asyncio.create_task(secondary.complete(prompt, max_tokens))
+
+    loser = None
+    try:
+        winner, loser = await _race(first, start_secondary, hedge_delay(primary), route)
+        # 主请求落败被取消时按已耗时计入，避免慢请求从样本中消失导致分位数偏低
+        _record(primary, False, started, first)
+        return winner.result(), primary if winner is first else secondary
+    finally:
+        for task in (first, loser):
+            if task is not None and not task.done():
+                await _cancel(task)
+
+
+async def hedged_stream(
+    primary: LLMProvider, secondary: LLMProvider, prompt: str, info: dict
+) -> AsyncIterator[str]:
+    """流式对冲：主提供方超过对冲延迟仍未输出首个片段时，向备用提供方发起同样的请求，
+    先输出首个片段的一方继续输出，另一方取消；实际生成的提供方写入 info["provider"]"""
+    route = _current_route.get()
+    started = time.perf_counter()
+    streams = {}
+
+    def open_stream(provider: LLMProvider) -> asyncio.Task:
+        stream = provider.stream(prompt)
+        task = asyncio.create_task(stream.__anext__())
+        streams[task] = (provider, stream)
+        return task
+
+    def start_secondary():
+        llm_hedged_requests_total.inc(route=route, provider=secondary.name)
+        logger.info(f"{primary.name}超过对冲延迟仍无输出，向{secondary.name}发送对冲请求")
+        return open_stream(secondary)
+
+    first = open_stream(primary)
+    try:
+        winner, _ = await _race(first, start_secondary, hedge_delay(primary, stream=True), route)
+        _record(primary, True, started, first)
+        for task in streams:
+            if task is not winner and not task.done():
+                await _cancel(task)
+        for task, (_, stream) in streams.items():
+            if task is not winner:
+                await stream.aclose()
+
+        provider, stream = streams[winner]
+        info["provider"] = provider
+        try:
+            yield winner.result()
+        except StopAsyncIteration:
+            return
+        async for text in stream:
+            yield text
+    finally:
+        for task, (_, stream) in streams.items():
+            if not task.done():
+                await _cancel(task)
+            await stream.aclose()
@@ -0,0 +1,91 @@
+import logging
+from typing import Any, Dict, Optional
+
+import httpx
+
+from ..config import settings
+from ..utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# 进程内共享的模型服务HTTP客户端，复用TCP/TLS连接
+_client: Optional[httpx.AsyncClient] = None
+
+llm_requests_total = registry.counter(
+    "llm_http_requests_total", "发往模型服务的HTTP请求数"
+)
+llm_connections_opened_total = registry.counter(
+    "llm_http_connections_opened_total", "与模型服务新建的TCP连接数"
+)
+
+
+def _connection_reuse_ratio() -> float:
+    requests = llm_requests_total.value()
+    if not requests:
+        return 0.0
+    return max(0.0, 1 - llm_connections_opened_total.value() / requests)
+
+
+registry.gauge(
+    "llm_http_connection_reuse_ratio",
+    "复用已有连接的请求占比",
+    func=_connection_reuse_ratio
+)
+
+
+async def _trace(event_name: str, info: Dict[str, Any]):
+    """httpcore跟踪回调：统计新建连接"""
+    if event_name == "connection.connect_tcp.complete":
+        llm_connections_opened_total.inc()
+
+
+def request_extensions() -> Dict[str, Any]:
+    """每个请求附带的扩展参数，同时计入请求数"""
+    llm_requests_total.inc()
+    return {"trace": _trace}
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _create_client(http2: bool) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(settings.LLM_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+        ),
+        http2=http2,
+    )
+
+
+def init_http_client() -> httpx.AsyncClient:
+    """应用启动时创建共享客户端"""
+    global _client
+    if _client is None:
+        http2 = settings.LLM_HTTP2 and _http2_available()
+        if settings.LLM_HTTP2 and not http2:
+            logger.warning("未安装h2，模型服务客户端回退到HTTP/1.1")
+        _client = _create_client(http2)
+        logger.info(f"模型服务HTTP客户端已创建, 最大连接数: {settings.LLM_MAX_CONNECTIONS}, HTTP/2: {http2}")
+    return _client
+
+
+async def close_http_client():
+    """应用关闭时释放连接"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        logger.info("模型服务HTTP客户端已关闭")
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """获取共享客户端（脚本等未经过应用启动的场景下按需创建）"""
+    return _client if _client is not None else init_http_client()
@@ -0,0 +1,519 @@
+import hashlib
+import io
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from sqlalchemy import and_, func, or_, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database import engine, release_connection, run_db, vector_extension_available
+from ..models.knowledge import KnowledgeChunk
+from ..models.report import Report
+from ..models.task import Task
+from ..utils.lru import TTLCache
+from ..utils.metrics import registry
+from ..utils.tokenizer import count_tokens, snap_to_boundary, truncate_tokens
+from .llm_providers import get_embedding_provider
+
+logger = logging.getLogger(__name__)
+
+# 知识来源：manual 实训手册；task 任务书；report 教师认可的范例报告
+SOURCE_TYPES = ("manual", "task", "report")
+
+rag_search_duration_seconds = registry.histogram(
+    "rag_search_duration_seconds",
+    "知识库向量检索耗时（秒，不含查询向量化）",
+    ("backend",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+)
+rag_retrieval_failures_total = registry.counter("rag_retrieval_failures_total", "知识库检索失败次数")
+knowledge_chunks_ingested_total = registry.counter(
+    "knowledge_chunks_ingested_total", "写入知识库的切片数", ("source_type",)
+)
+embedding_cache_total = registry.counter(
+    "knowledge_embedding_cache_total", "入库切片未变化（unchanged）、按内容哈希复用向量（hit）或重新向量化（miss）的条数", ("result",)
+)
+
+# 查询向量缓存：批量生成时同一任务的查询只向量化一次
+_query_vectors = TTLCache(max_entries=1024, ttl=3600)
+
+
+@dataclass
+class KnowledgeDocument:
+    """待入库的知识来源"""
+    source_type: str
+    source_key: str
+    title: str
+    content: str
+
+
+@dataclass
+class RetrievedChunk:
+    """检索到的知识库切片"""
+    id: int
+    source_type: str
+    source_key: str
+    title: str
+    content: str
+    score: float
+
+
+def _split_long(paragraph: str, max_tokens: int) -> List[str]:
+    """把超长段落按句子边界切成不超过 max_tokens 的片段"""
+    pieces = []
+    rest = paragraph
+    while count_tokens(rest) > max_tokens:
+        head = snap_to_boundary(truncate_tokens(rest, max_tokens))
+        if not head:
+            head = truncate_tokens(rest, max_tokens) or rest[:1]
+        pieces.append(head)
+        rest = rest[len(head):].lstrip()
+    if rest:
+        pieces.append(rest)
+    return pieces
+
+
+def chunk_text(content: str, max_tokens: Optional[int] = None, overlap: Optional[int] = None) -> List[str]:
+    """按段落切片，相邻切片之间保留少量重叠以免上下文断裂"""
+    max_tokens = max_tokens or settings.RAG_CHUNK_TOKENS
+    overlap = settings.RAG_CHUNK_OVERLAP if overlap is None else overlap
+
+    paragraphs = []
+    for paragraph in content.splitlines():
+        paragraph = paragraph.strip()
+        if paragraph:
+            paragraphs.extend(_split_long(paragraph, max_tokens))
+
+    chunks = []
+    current: List[Tuple[str, int]] = []
+    current_tokens = 0
+    for paragraph in paragraphs:
+        tokens = count_tokens(paragraph)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("\n".join(p for p, _ in current))
+            # 从上一切片末尾带入不超过 overlap 令牌的段落
+            carried = []
+            carried_tokens = 0
+            for p, t in reversed(current):
+                if carried_tokens + t > overlap or carried_tokens + t + tokens > max_tokens:
+                    break
+                carried.insert(0, (p, t))
+                carried_tokens += t
+            current, current_tokens = carried, carried_tokens
+        current.append((paragraph, tokens))
+        current_tokens += tokens
+    if current:
+        chunks.append("\n".join(p for p, _ in current))
+    return chunks
+
+
+def extract_text(filename: str, data: bytes) -> str:
+    """从上传的文件中提取纯文本，支持 .docx/.txt/.md"""
+    name = filename.lower()
+    if name.endswith(".docx"):
+        from docx import Document
+        doc = Document(io.BytesIO(data))
+        return "\n".join(p.text for p in doc.paragraphs)
+    if name.endswith((".txt", ".md")):
+        return data.decode("utf-8", errors="replace")
+    raise ValueError("只支持.docx、.txt、.md格式文件")
+
+
+def _content_hash(provider, title: str, chunk: str) -> str:
+    """向量缓存键：向量模型、标题和切片内容相同即可复用已有向量"""
+    raw = f"{provider.name}:{provider.embedding_model}:{settings.EMBEDDING_DIM}\n{title}\n{chunk}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def delete_source(db: Session, source_type: str, source_key: str, commit: bool = True) -> int:
+    """删除某一来源的全部切片"""
+    ids = [row.id for row in db.query(KnowledgeChunk.id).filter(
+        KnowledgeChunk.source_type == source_type,
+        KnowledgeChunk.source_key == source_key
+    ).all()]
+    if ids:
+        db.query(KnowledgeChunk).filter(KnowledgeChunk.id.in_(ids)).delete(synchronize_session=False)
+    if commit:
+        db.commit()
+        vector_index.discard(ids)
+    return len(ids)
+
+
+# 接口使用异步会话，后台脚本使用同步会话，数据库操作都通过 run_db 执行
+DbSession = Union[Session, AsyncSession]
+
+
+def _plan_ingest(db: Session, planned: list):
+    """比对来源现有切片，返回 (待删除ID, 序号变化的切片, 新切片, 可复用的向量)"""
+    # 这些来源现有的切片（不加载向量）
+    existing_rows = db.query(
+        KnowledgeChunk.id, KnowledgeChunk.source_type, KnowledgeChunk.source_key,
+        KnowledgeChunk.content_hash, KnowledgeChunk.chunk_index
+    ).filter(or_(*(
+        and_(KnowledgeChunk.source_type == doc.source_type, KnowledgeChunk.source_key == doc.source_key)
+        for doc, _, _ in planned
+    ))).all()
+    existing: Dict[Tuple[str, str], list] = {}
+    for row in existing_rows:
+        existing.setdefault((row.source_type, row.source_key), []).append(row)
+
+    removed_ids = []
+    reindexed = []
+    new_items = []
+    unchanged = 0
+    for doc, title, items in planned:
+        unmatched = {}
+        for row in existing.get((doc.source_type, doc.source_key), []):
+            unmatched.setdefault(row.content_hash, []).append(row)
+        for index, chunk, content_hash in items:
+            rows = unmatched.get(content_hash)
+            if rows:
+                row = rows.pop()
+                unchanged += 1
+                if row.chunk_index != index:
+                    reindexed.append({"id": row.id, "chunk_index": index})
+            else:
+                new_items.append((doc, title, index, chunk, content_hash))
+        removed_ids.extend(row.id for rows in unmatched.values() for row in rows)
+    embedding_cache_total.inc(unchanged, result="unchanged")
+
+    # 其他来源中已有相同内容的向量直接复用
+    needed = list({content_hash for *_, content_hash in new_items})
+    vectors = {}
+    for i in range(0, len(needed), 500):
+        for row in db.query(KnowledgeChunk.content_hash, KnowledgeChunk.embedding).filter(
+            KnowledgeChunk.content_hash.in_(needed[i:i + 500])
+        ).all():
+            vectors.setdefault(row.content_hash, row.embedding)
+    embedding_cache_total.inc(len(vectors), result="hit")
+    return removed_ids, reindexed, new_items, vectors
+
+
+def _apply_ingest(db: Session, removed_ids: List[int], reindexed: List[dict], new_items: list, vectors: dict):
+    if removed_ids:
+        db.query(KnowledgeChunk).filter(KnowledgeChunk.id.in_(removed_ids)).delete(synchronize_session=False)
+    if reindexed:
+        db.bulk_update_mappings(KnowledgeChunk, reindexed)
+    db.add_all([
+        KnowledgeChunk(
+            source_type=doc.source_type,
+            source_key=doc.source_key,
+            title=title,
+            chunk_index=index,
+            content=chunk,
+            token_count=count_tokens(chunk),
+            content_hash=content_hash,
+            embedding=vectors[content_hash]
+        )
+        for doc, title, index, chunk, content_hash in new_items
+    ])
+    db.commit()
+
+
+async def ingest_many(db: DbSession, documents: List[KnowledgeDocument]) -> int:
+    """增量入库：按内容哈希比对，未变化的切片保持不动，新增或修改的切片优先复用已有向量，
+    其余合并成批调用向量化；返回新写入的切片数"""
+    provider = get_embedding_provider()
+    planned = []
+    for doc in documents:
+        if doc.source_type not in SOURCE_TYPES:
+            raise ValueError(f"未知的知识来源类型: {doc.source_type}")
+        title = doc.title[:255]
+        items = [(i, chunk, _content_hash(provider, title, chunk)) for i, chunk in enumerate(chunk_text(doc.content))]
+        planned.append((doc, title, items))
+    if not planned:
+        return 0
+
+    removed_ids, reindexed, new_items, vectors = await run_db(db, _plan_ingest, planned)
+
+    # 向量化时带上标题，检索时能匹配到文档主题
+    to_embed = {}
+    for doc, title, index, chunk, content_hash in new_items:
+        if content_hash not in vectors:
+            to_embed.setdefault(content_hash, f"{title}\n{chunk}")
+    if to_embed:
+        embedding_cache_total.inc(len(to_embed), result="miss")
+        embedded = await provider.embed(list(to_embed.values()))
+        vectors.update(zip(to_embed.keys(), embedded))
+
+    await run_db(db, _apply_ingest, removed_ids, reindexed, new_items, vectors)
+    vector_index.discard(removed_ids)
+
+    for doc, _, _ in planned:
+        knowledge_chunks_ingested_total.inc(
+            sum(1 for item in new_items if item[0] is doc), source_type=doc.source_type
+        )
+    logger.info(
+        f"知识库增量入库: 来源{len(planned)}个, 新增切片{len(new_items)}, 删除{len(removed_ids)}, "
+        f"调用向量化{len(to_embed)}条"
+    )
+    return len(new_items)
+
+
+def _source_chunk_count(db: Session, source_type: str, source_key: str) -> int:
+    return db.query(func.count(KnowledgeChunk.id)).filter(
+        KnowledgeChunk.source_type == source_type,
+        KnowledgeChunk.source_key == source_key
+    ).scalar()
+
+
+async def ingest_document(db: DbSession, doc: KnowledgeDocument) -> int:
+    """单个来源入库；返回该来源现有的切片数"""
+    await ingest_many(db, [doc])
+    return await run_db(db, _source_chunk_count, doc.source_type, doc.source_key)
+
+
+async def ingest(db: DbSession, source_type: str, source_key: str, title: str, content: str) -> int:
+    """单个来源入库；返回该来源现有的切片数"""
+    return await ingest_document(db, KnowledgeDocument(source_type, source_key, title, content))
+
+
+def task_document(task: Task) -> KnowledgeDocument:
+    return KnowledgeDocument("task", str(task.id), task.title, task.description or "")
+
+
+def report_document(report: Report) -> KnowledgeDocument:
+    return KnowledgeDocument("report", str(report.id), report.title, report.content or "")
+
+
+async def ingest_task(db: DbSession, task: Task) -> int:
+    """任务书入库"""
+    return await ingest_document(db, task_document(task))
+
+
+async def ingest_report(db: DbSession, report: Report) -> int:
+    """范例报告入库"""
+    return await ingest_document(db, report_document(report))
+
+
+class NumpyVectorIndex:
+    """未启用pgvector时的暴力检索：向量常驻内存，归一化后用矩阵乘法计算余弦相似度。
+    新增切片只追加加载（按ID递增），删除只做标记，刷新开销与变更量成正比"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._size = 0
+        self._max_id = 0
+        self._ids = np.empty(0, dtype=np.int64)
+        self._sources = np.empty(0, dtype=object)
+        self._alive = np.empty(0, dtype=bool)
+        self._matrix = np.empty((0, settings.EMBEDDING_DIM), dtype=np.float32)
+
+    def invalidate(self):
+        """下次检索时全量重新加载"""
+        self._loaded = False
+
+    def discard(self, ids: List[int]):
+        """标记已删除的切片"""
+        if not ids or not self._size:
+            return
+        with self._lock:
+            self._alive[:self._size][np.isin(self._ids[:self._size], ids)] = False
+
+    def _reserve(self, extra: int):
+        """按倍数扩容，追加时不必每次复制整个矩阵"""
+        needed = self._size + extra
+        capacity = len(self._ids)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 1024)
+        matrix = np.empty((capacity, settings.EMBEDDING_DIM), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        ids = np.empty(capacity, dtype=np.int64)
+        ids[:self._size] = self._ids[:self._size]
+        sources = np.empty(capacity, dtype=object)
+        sources[:self._size] = self._sources[:self._size]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        self._matrix, self._ids, self._sources, self._alive = matrix, ids, sources, alive
+
+    @staticmethod
+    def _fetch(db: Session, after_id: int) -> list:
+        return db.query(
+            KnowledgeChunk.id, KnowledgeChunk.source_type, KnowledgeChunk.source_key, KnowledgeChunk.embedding
+        ).filter(KnowledgeChunk.id > after_id).order_by(KnowledgeChunk.id).all()
+
+    def _append(self, rows: list):
+        """追加已按ID递增排好的切片，调用方持有锁"""
+        if not rows:
+            return
+        self._reserve(len(rows))
+        start, end = self._size, self._size + len(rows)
+        block = np.asarray([row.embedding for row in rows], dtype=np.float32)
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        self._matrix[start:end] = block / np.where(norms == 0, 1, norms)
+        self._ids[start:end] = [row.id for row in rows]
+        self._sources[start:end] = [f"{row.source_type}/{row.source_key}" for row in rows]
+        self._alive[start:end] = True
+        self._size = end
+        self._max_id = rows[-1].id
+
+    def _apply(self, rows: list, after_id: int, count: int) -> bool:
+        """把查询到的切片合并进索引；after_id 为0时全量替换。
+        增量合并时索引已被其他请求重置，或存活切片数与数据库不一致时返回False，需要全量加载"""
+        with self._lock:
+            if after_id == 0:
+                self._size = 0
+                self._max_id = 0
+            elif not self._loaded or self._max_id < after_id:
+                return False
+            # 并发的检索可能已经追加过同一批切片
+            self._append([row for row in rows if row.id > self._max_id])
+            if after_id and int(self._alive[:self._size].sum()) != count:
+                # 其他进程删除了切片，无法得知具体ID
+                return False
+            self._loaded = True
+            return True
+
+    def _sync(self, db: Session):
+        """数据库查询都在持有锁之前完成：异步会话的 run_sync 中查询时会切回事件循环，
+        期间持有线程锁会让同一事件循环上的其他检索阻塞在锁上，导致死锁"""
+        count, max_id = db.query(func.count(KnowledgeChunk.id), func.max(KnowledgeChunk.id)).one()
+        max_id = max_id or 0
+        with self._lock:
+            if self._loaded and max_id < self._max_id:
+                self._loaded = False
+            after_id = self._max_id if self._loaded else 0
+        rows = self._fetch(db, after_id) if max_id > after_id else []
+        if not self._apply(rows, after_id, count):
+            self._apply(self._fetch(db, 0), 0, count)
+            logger.info(f"NumPy向量索引已全量加载, 切片数: {self._size}")
+
+    def search(
+        self, db: Session, query_vector: List[float], k: int, exclude: Optional[Tuple[str, str]] = None
+    ) -> List[Tuple[int, float]]:
+        self._sync(db)
+        with self._lock:
+            size = self._size
+            # 释放锁后其他请求可能原地改写这些数组，复制一份
+            ids, sources, alive = self._ids[:size].copy(), self._sources[:size].copy(), self._alive[:size].copy()
+            matrix = self._matrix[:size]
+            scores = None
+            if size:
+                query = np.asarray(query_vector, dtype=np.float32)
+                query = query / (np.linalg.norm(query) or 1)
+                scores = matrix @ query
+
+        if scores is None:
+            return []
+        scores[~alive] = -np.inf
+        if exclude is not None:
+            scores[sources == f"{exclude[0]}/{exclude[1]}"] = -np.inf
+
+        k = min(k, size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+
+vector_index = NumpyVectorIndex()
+
+
+def _pgvector_search(
+    db: Session, query_vector: List[float], k: int, exclude: Optional[Tuple[str, str]] = None
+) -> List[Tuple[int, float]]:
+    if settings.VECTOR_INDEX_TYPE == "ivfflat":
+        db.execute(text(f"SET LOCAL ivfflat.probes = {int(settings.VECTOR_IVFFLAT_PROBES)}"))
+    else:
+        db.execute(text(f"SET LOCAL hnsw.ef_search = {int(settings.VECTOR_HNSW_EF_SEARCH)}"))
+    exclude_type, exclude_key = exclude or ("", "")
+    rows = db.execute(
+        text(
+            "SELECT id, 1 - (embedding <=> CAST(:query AS vector)) AS score FROM knowledge_chunks "
+            "WHERE NOT (source_type = :exclude_type AND source_key = :exclude_key) "
+            "ORDER BY embedding <=> CAST(:query AS vector) LIMIT :k"
+        ),
+        {
+            "query": "[" + ",".join(f"{v:.7g}" for v in query_vector) + "]",
+            "exclude_type": exclude_type,
+            "exclude_key": exclude_key,
+            "k": k
+        }
+    ).all()
+    return [(row.id, float(row.score)) for row in rows]
+
+
+def _has_chunks(db: Session) -> bool:
+    return db.query(KnowledgeChunk.id).first() is not None
+
+
+def _search(
+    db: Session, query_vector: List[float], k: int, exclude: Optional[Tuple[str, str]]
+) -> List[RetrievedChunk]:
+    backend = "pgvector" if vector_extension_available() else "numpy"
+    with rag_search_duration_seconds.time(backend=backend):
+        if backend == "pgvector":
+            hits = _pgvector_search(db, query_vector, k, exclude)
+        else:
+            hits = vector_index.search(db, query_vector, k, exclude)
+
+    scores = {chunk_id: score for chunk_id, score in hits if score >= settings.RAG_MIN_SCORE}
+    if not scores:
+        return []
+    rows = db.query(
+        KnowledgeChunk.id, KnowledgeChunk.source_type, KnowledgeChunk.source_key,
+        KnowledgeChunk.title, KnowledgeChunk.content
+    ).filter(KnowledgeChunk.id.in_(list(scores))).all()
+    chunks = [RetrievedChunk(*row, score=scores[row.id]) for row in rows]
+    return sorted(chunks, key=lambda chunk: chunk.score, reverse=True)
+
+
+async def retrieve(
+    db: DbSession, query: str, k: Optional[int] = None, exclude: Optional[Tuple[str, str]] = None
+) -> List[RetrievedChunk]:
+    """检索与查询最相关的切片，按相似度降序返回；exclude 为要排除的 (来源类型, 来源标识)"""
+    k = k or settings.RAG_TOP_K
+    if not await run_db(db, _has_chunks):
+        return []
+
+    provider = get_embedding_provider()
+    cache_key = _content_hash(provider, "query", query)
+    query_vector = _query_vectors.get(cache_key)
+    if query_vector is None:
+        await release_connection(db)
+        query_vector = (await provider.embed([query], text_type="query"))[0]
+        _query_vectors.set(cache_key, query_vector)
+
+    return await run_db(db, _search, query_vector, k, exclude)
+
+
+async def retrieve_for_task(db: DbSession, task: Task) -> List[RetrievedChunk]:
+    """为生成报告检索参考资料，失败时不影响生成"""
+    if not settings.RAG_ENABLED:
+        return []
+    query = f"{task.title}\n{truncate_tokens(task.description or '', settings.RAG_CHUNK_TOKENS)}"
+    try:
+        # 任务书本身已在提示词中，检索时排除
+        return await retrieve(db, query, exclude=("task", str(task.id)))
+    except Exception as e:
+        rag_retrieval_failures_total.inc()
+        logger.warning(f"知识库检索失败，本次不使用参考资料: {str(e)}")
+        return []
+
+
+def ensure_vector_index():
+    """数据库启用pgvector时创建向量索引（HNSW或IVFFlat）"""
+    if not vector_extension_available():
+        return
+    if settings.VECTOR_INDEX_TYPE == "ivfflat":
+        ddl = (
+            "CREATE INDEX IF NOT EXISTS ix_knowledge_chunks_embedding_ivfflat ON knowledge_chunks "
+            f"USING ivfflat (embedding vector_cosine_ops) WITH (lists = {int(settings.VECTOR_IVFFLAT_LISTS)})"
+        )
+    else:
+        ddl = (
+            "CREATE INDEX IF NOT EXISTS ix_knowledge_chunks_embedding_hnsw ON knowledge_chunks "
+            f"USING hnsw (embedding vector_cosine_ops) "
+            f"WITH (m = {int(settings.VECTOR_HNSW_M)}, ef_construction = {int(settings.VECTOR_HNSW_EF_CONSTRUCTION)})"
+        )
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(ddl))
+    except Exception as e:
+        logger.warning(f"创建向量索引失败，检索将退化为顺序扫描: {str(e)}")
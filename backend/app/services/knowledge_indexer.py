@@ -0,0 +1,158 @@
+import asyncio
+import logging
+from typing import Optional, Set, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database import AsyncSessionLocal, SessionLocal, run_db
+from ..models.knowledge import KnowledgeChunk
+from ..models.report import Report
+from ..models.task import Task
+from ..utils.metrics import registry
+from .knowledge_base import delete_source, ingest_many, report_document, task_document
+
+logger = logging.getLogger(__name__)
+
+knowledge_indexer_batches_total = registry.counter(
+    "knowledge_indexer_batches_total", "后台索引处理的批次数", ("outcome",)
+)
+
+# 影响知识库内容的字段，只有这些字段变化时才重新索引
+_INDEXED_FIELDS = {Task: ("title", "description"), Report: ("title", "content")}
+_SOURCE_TYPES = {Task: "task", Report: "report"}
+
+
+def _changed(obj) -> bool:
+    state = inspect(obj)
+    return any(state.attrs[name].history.has_changes() for name in _INDEXED_FIELDS[type(obj)])
+
+
+class KnowledgeIndexer:
+    """后台增量索引：事务提交后把新增、修改或删除的任务书和报告加入队列，合并成批后增量入库"""
+
+    def __init__(self, batch_size: int, flush_interval: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """启动后台索引协程"""
+        if self._worker is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run(), name="knowledge-indexer")
+        logger.info("知识库后台索引已启动")
+
+    async def stop(self):
+        """停止后台索引协程，队列中未处理的变更可用 scripts/ingest_knowledge.py 补录"""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        await asyncio.gather(self._worker, return_exceptions=True)
+        pending = self._queue.qsize()
+        self._worker = self._queue = self._loop = None
+        logger.info(f"知识库后台索引已停止, 未处理变更: {pending}")
+
+    def enqueue(self, keys: Set[Tuple[str, int]]):
+        """提交待索引的 (来源类型, ID)，可在任意线程调用"""
+        if self._queue is None or self._loop is None:
+            return
+        for key in keys:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, key)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = {await self._queue.get()}
+            # 短暂等待，把同一时段内的多次提交合并成一批向量化
+            deadline = loop.time() + self.flush_interval
+            while len(pending) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.add(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._index(pending)
+                knowledge_indexer_batches_total.inc(outcome="success")
+            except Exception as e:
+                knowledge_indexer_batches_total.inc(outcome="error")
+                logger.error(f"知识库后台索引失败: {str(e)}", exc_info=True)
+
+    @staticmethod
+    def _collect(db: Session, task_ids: list, report_ids: list):
+        """返回需要重新入库的文档和已删除的来源"""
+        documents = []
+        removed = []
+        tasks = {task.id: task for task in db.query(Task).filter(Task.id.in_(task_ids)).all()} if task_ids else {}
+        for task_id in task_ids:
+            if task_id in tasks:
+                documents.append(task_document(tasks[task_id]))
+            else:
+                removed.append(("task", str(task_id)))
+
+        if report_ids:
+            reports = {report.id: report for report in db.query(Report).filter(Report.id.in_(report_ids)).all()}
+            indexed = {row.source_key for row in db.query(KnowledgeChunk.source_key).filter(
+                KnowledgeChunk.source_type == "report",
+                KnowledgeChunk.source_key.in_([str(i) for i in report_ids])
+            ).distinct().all()}
+            for report_id in report_ids:
+                if report_id not in reports:
+                    removed.append(("report", str(report_id)))
+                elif settings.KNOWLEDGE_INDEX_ALL_REPORTS or str(report_id) in indexed:
+                    # 默认只更新已被教师认可为范例的报告
+                    documents.append(report_document(reports[report_id]))
+
+        for source_type, source_key in removed:
+            delete_source(db, source_type, source_key)
+        return documents
+
+    async def _index(self, keys: Set[Tuple[str, int]]):
+        task_ids = [source_id for source_type, source_id in keys if source_type == "task"]
+        report_ids = [source_id for source_type, source_id in keys if source_type == "report"]
+
+        async with AsyncSessionLocal() as db:
+            documents = await run_db(db, self._collect, task_ids, report_ids)
+            if documents:
+                await ingest_many(db, documents)
+
+
+knowledge_indexer = KnowledgeIndexer(
+    batch_size=settings.KNOWLEDGE_INDEXER_BATCH_SIZE,
+    flush_interval=settings.KNOWLEDGE_INDEXER_FLUSH_SECONDS
+)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_changes(session: Session, flush_context):
+    """记录本次事务中需要重新索引的任务书和报告，提交后再入队"""
+    pending = session.info.setdefault("knowledge_pending", set())
+    for obj in session.new:
+        if isinstance(obj, Task) or (isinstance(obj, Report) and settings.KNOWLEDGE_INDEX_ALL_REPORTS):
+            pending.add((_SOURCE_TYPES[type(obj)], obj.id))
+    for obj in session.dirty:
+        if type(obj) in _INDEXED_FIELDS and _changed(obj):
+            pending.add((_SOURCE_TYPES[type(obj)], obj.id))
+    for obj in session.deleted:
+        if type(obj) in _INDEXED_FIELDS:
+            pending.add((_SOURCE_TYPES[type(obj)], obj.id))
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _enqueue_changes(session: Session):
+    pending = session.info.pop("knowledge_pending", None)
+    if pending and settings.KNOWLEDGE_INDEXER_ENABLED:
+        knowledge_indexer.enqueue(pending)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_changes(session: Session):
+    session.info.pop("knowledge_pending", None)
@@ -0,0 +1,567 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import time
+import zlib
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from ..config import settings
+from ..utils.metrics import registry
+from ..utils.tokenizer import count_tokens
+from .circuit_breaker import CircuitBreaker, CircuitPermit, create_breaker
+from .http_client import get_http_client, request_extensions
+from .rate_limiter import RateLimiter, backoff_delay, parse_retry_after, llm_throttled_total
+
+logger = logging.getLogger(__name__)
+
+# 可用的模型服务提供方
+PROVIDER_NAMES = ("dashscope", "local", "stub")
+
+# 需要重试的HTTP状态码：限流和服务端错误
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# 需要重试的网络错误：只限连接阶段的错误（连接失败、连接超时、复用的空闲连接已被服务端关闭）；
+# 读取超时说明服务端已在处理但没有响应，重试只会成倍延长等待，直接失败
+_RETRYABLE_TRANSPORT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+llm_retries_total = registry.counter(
+    "llm_retries_total", "模型调用重试次数", ("provider", "reason")
+)
+llm_failed_calls_total = registry.counter(
+    "llm_failed_calls_total", "模型调用最终失败次数", ("provider", "reason")
+)
+llm_cancelled_calls_total = registry.counter(
+    "llm_cancelled_calls_total", "调用方取消（如客户端断开）而中止的模型调用次数", ("provider",)
+)
+llm_request_duration_seconds = registry.histogram(
+    "llm_request_duration_seconds",
+    "模型调用耗时（秒，含限流等待和重试）",
+    ("provider", "model", "outcome"),
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300)
+)
+llm_first_token_seconds = registry.histogram(
+    "llm_first_token_seconds",
+    "流式调用收到首个片段的耗时（秒）",
+    ("provider", "model"),
+    buckets=(0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 20, 30)
+)
+llm_embedding_duration_seconds = registry.histogram(
+    "llm_embedding_duration_seconds",
+    "单批文本向量化耗时（秒）",
+    ("provider", "outcome"),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+_TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 16000)
+llm_prompt_tokens = registry.histogram(
+    "llm_prompt_tokens", "单次调用的提示词令牌数", ("provider", "model"), buckets=_TOKEN_BUCKETS
+)
+llm_completion_tokens = registry.histogram(
+    "llm_completion_tokens", "单次调用的生成令牌数", ("provider", "model"), buckets=_TOKEN_BUCKETS
+)
+
+# 令牌用量：(提示词令牌数, 生成令牌数)
+Usage = Tuple[int, int]
+
+
+class GenerationError(Exception):
+    """模型生成失败"""
+
+    # 本次调用中失败的请求次数，连接阶段的错误重试后仍失败时大于1，熔断器按此计数
+    failed_attempts = 1
+
+
+class CircuitOpenError(GenerationError):
+    """提供方已熔断，调用被直接拒绝"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"{provider}模型服务暂不可用")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+def estimate_tokens(text: str) -> int:
+    """本地估算令牌数，用于限流预占额度和服务端未返回用量时的统计"""
+    return count_tokens(text)
+
+
+class LLMProvider:
+    """模型服务提供方基类：统一参数、限流和重试，子类实现具体的请求格式"""
+
+    name = ""
+
+    def __init__(
+        self,
+        model: str,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        embedding_model: str = ""
+    ):
+        self.model = model
+        self.embedding_model = embedding_model
+        self.max_tokens = settings.LLM_MAX_TOKENS
+        self.temperature = settings.LLM_TEMPERATURE
+        self.top_p = settings.LLM_TOP_P
+        self.rate_limiter = RateLimiter(self.name, requests_per_minute, tokens_per_minute)
+        # 生成和向量化接口分别熔断，向量模型配置错误不影响报告生成
+        self.breaker = create_breaker(self.name)
+        self.embedding_breaker = create_breaker(f"{self.name}_embedding")
+
+    def params(self) -> dict:
+        """当前使用的模型参数，同时参与缓存键计算"""
+        return {
+            "provider": self.name,
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "top_p": self.top_p
+        }
+
+    async def _admit(self, reserved: int, breaker: CircuitBreaker) -> CircuitPermit:
+        """熔断检查后按限流额度等待，熔断中直接抛出 CircuitOpenError 而不等待超时；返回熔断器的放行凭证"""
+        permit = breaker.acquire()
+        if permit is None:
+            raise CircuitOpenError(breaker.name, breaker.retry_after())
+        try:
+            await self.rate_limiter.acquire(reserved)
+        except asyncio.CancelledError:
+            breaker.release(permit)
+            raise
+        return permit
+
+    async def complete(self, prompt: str, max_tokens: Optional[int] = None) -> str:
+        """返回完整生成文本，max_tokens 为本次调用的生成令牌上限，默认 LLM_MAX_TOKENS"""
+        max_tokens = max_tokens or self.max_tokens
+        reserved = estimate_tokens(prompt) + max_tokens
+        start = time.perf_counter()
+        outcome = "error"
+        used = reserved
+        permit = await self._admit(reserved, self.breaker)
+        try:
+            content, usage = await self._complete(prompt, max_tokens)
+            if not content:
+                llm_failed_calls_total.inc(provider=self.name, reason="empty")
+                logger.error(f"{self.name}返回内容为空")
+                raise GenerationError("模型返回内容为空")
+            used = self._observe_usage(prompt, content, usage)
+            outcome = "success"
+            self.breaker.record_success(permit)
+            return content
+        except asyncio.CancelledError:
+            # 取消时底层HTTP请求随之中断，连接由httpx关闭
+            outcome = "cancelled"
+            llm_cancelled_calls_total.inc(provider=self.name)
+            self.breaker.release(permit)
+            raise
+        except Exception as e:
+            self.breaker.record_failure(permit, getattr(e, "failed_attempts", 1))
+            raise
+        finally:
+            self.rate_limiter.settle(reserved, used)
+            llm_request_duration_seconds.observe(
+                time.perf_counter() - start, provider=self.name, model=self.model, outcome=outcome
+            )
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """逐段返回生成文本"""
+        reserved = estimate_tokens(prompt) + self.max_tokens
+        start = time.perf_counter()
+        outcome = "error"
+        used = reserved
+        permit = await self._admit(reserved, self.breaker)
+        usage = {}
+        chunks = []
+        try:
+            async for text in self._stream(prompt, usage):
+                if not chunks:
+                    llm_first_token_seconds.observe(
+                        time.perf_counter() - start, provider=self.name, model=self.model
+                    )
+                chunks.append(text)
+                yield text
+            used = self._observe_usage(prompt, "".join(chunks), usage.get("tokens"))
+            outcome = "success"
+            self.breaker.record_success(permit)
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "cancelled"
+            llm_cancelled_calls_total.inc(provider=self.name)
+            self.breaker.release(permit)
+            raise
+        except Exception as e:
+            self.breaker.record_failure(permit, getattr(e, "failed_attempts", 1))
+            raise
+        finally:
+            self.rate_limiter.settle(reserved, used)
+            llm_request_duration_seconds.observe(
+                time.perf_counter() - start, provider=self.name, model=self.model, outcome=outcome
+            )
+
+    async def embed(self, texts: List[str], text_type: str = "document") -> List[List[float]]:
+        """文本向量化，按 EMBEDDING_BATCH_SIZE 分批请求；text_type 为 document 或 query"""
+        vectors = []
+        batch_size = max(1, settings.EMBEDDING_BATCH_SIZE)
+        for i in range(0, len(texts), batch_size):
+            batch = texts[i:i + batch_size]
+            reserved = sum(estimate_tokens(text) for text in batch)
+            start = time.perf_counter()
+            outcome = "error"
+            permit = await self._admit(reserved, self.embedding_breaker)
+            try:
+                result = await self._embed(batch, text_type)
+                outcome = "success"
+                self.embedding_breaker.record_success(permit)
+            except asyncio.CancelledError:
+                self.embedding_breaker.release(permit)
+                raise
+            except Exception as e:
+                self.embedding_breaker.record_failure(permit, getattr(e, "failed_attempts", 1))
+                raise
+            finally:
+                self.rate_limiter.settle(reserved, reserved)
+                llm_embedding_duration_seconds.observe(
+                    time.perf_counter() - start, provider=self.name, outcome=outcome
+                )
+            if len(result) != len(batch) or any(len(v) != settings.EMBEDDING_DIM for v in result):
+                llm_failed_calls_total.inc(provider=self.name, reason="embedding")
+                raise GenerationError(f"向量化结果数量或维度与配置不一致（EMBEDDING_DIM={settings.EMBEDDING_DIM}）")
+            vectors.extend(result)
+        return vectors
+
+    def _observe_usage(self, prompt: str, content: str, usage: Optional[Usage]) -> int:
+        """记录令牌用量，服务端未返回用量时按字数估算；返回总令牌数"""
+        prompt_tokens, completion_tokens = usage or (estimate_tokens(prompt), estimate_tokens(content))
+        llm_prompt_tokens.observe(prompt_tokens, provider=self.name, model=self.model)
+        llm_completion_tokens.observe(completion_tokens, provider=self.name, model=self.model)
+        return prompt_tokens + completion_tokens
+
+    async def _complete(self, prompt: str, max_tokens: int):
+        """返回 (生成文本, 令牌用量)，用量未知时为None"""
+        raise NotImplementedError
+
+    def _stream(self, prompt: str, usage: dict) -> AsyncIterator[str]:
+        """逐段返回生成文本，令牌用量写入 usage["tokens"]"""
+        raise NotImplementedError
+
+    async def _embed(self, texts: List[str], text_type: str) -> List[List[float]]:
+        raise NotImplementedError
+
+    async def _send_with_retry(
+        self, build_request: Callable[[], httpx.Request], stream: bool = False
+    ) -> httpx.Response:
+        """发送请求，遇到429/5xx或连接错误时按指数退避重试，优先遵循Retry-After（超过退避上限时不再重试）"""
+        client = get_http_client()
+        max_retries = settings.LLM_MAX_RETRIES
+
+        transport_failures = 0
+        for attempt in range(max_retries + 1):
+            last_attempt = attempt == max_retries
+            try:
+                response = await client.send(build_request(), stream=stream)
+            except httpx.TransportError as e:
+                transport_failures += 1
+                if last_attempt or not isinstance(e, _RETRYABLE_TRANSPORT_ERRORS):
+                    timed_out = isinstance(e, httpx.TimeoutException)
+                    llm_failed_calls_total.inc(provider=self.name, reason="timeout" if timed_out else "network")
+                    logger.error(f"{self.name}网络错误({type(e).__name__}): {str(e)}")
+                    error = GenerationError("模型服务响应超时" if timed_out else "无法连接模型服务")
+                    # 每次连接失败都计入熔断，服务不可达时几次调用即可熔断，而不必等每次调用的全部重试
+                    error.failed_attempts = transport_failures
+                    raise error from e
+                await self._wait_before_retry(attempt, "network")
+                continue
+
+            if response.status_code in _RETRYABLE_STATUS and not last_attempt:
+                if response.status_code == 429:
+                    llm_throttled_total.inc(provider=self.name, source="provider")
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if retry_after is not None and retry_after > settings.LLM_RETRY_BACKOFF_MAX:
+                    # 服务端要求的等待超过退避上限时不再等待，直接按失败处理，
+                    # 避免长时间占用限流预占额度和任务并发名额
+                    logger.warning(f"{self.name}要求{retry_after:.0f}秒后重试，超过退避上限，不再重试")
+                    return response
+                await response.aclose()
+                await self._wait_before_retry(attempt, str(response.status_code), retry_after)
+                continue
+
+            return response
+
+    async def _wait_before_retry(self, attempt: int, reason: str, retry_after: Optional[float] = None):
+        llm_retries_total.inc(provider=self.name, reason=reason)
+        if retry_after is None:
+            delay = backoff_delay(attempt, settings.LLM_RETRY_BACKOFF_BASE, settings.LLM_RETRY_BACKOFF_MAX)
+        else:
+            delay = min(retry_after, settings.LLM_RETRY_BACKOFF_MAX)
+        logger.warning(f"{self.name}调用失败({reason})，{delay:.1f}秒后第{attempt + 1}次重试")
+        await asyncio.sleep(delay)
+
+    async def _check_status(self, response: httpx.Response):
+        if response.status_code != 200:
+            body = await response.aread()
+            llm_failed_calls_total.inc(provider=self.name, reason=str(response.status_code))
+            logger.error(f"{self.name}接口错误: {body.decode('utf-8', 'replace')}")
+            raise GenerationError("模型服务返回错误")
+
+
+class DashScopeProvider(LLMProvider):
+    """阿里云通义千问（DashScope）"""
+
+    name = "dashscope"
+
+    def __init__(self):
+        super().__init__(
+            settings.QWEN_MODEL,
+            requests_per_minute=settings.QWEN_REQUESTS_PER_MINUTE,
+            tokens_per_minute=settings.QWEN_TOKENS_PER_MINUTE,
+            embedding_model=settings.QWEN_EMBEDDING_MODEL
+        )
+
+    def _headers(self, stream: bool = False) -> dict:
+        headers = {
+            "Authorization": f"Bearer {settings.QWEN_API_KEY}",
+            "Content-Type": "application/json"
+        }
+        if stream:
+            headers["Accept"] = "text/event-stream"
+            headers["X-DashScope-SSE"] = "enable"
+        return headers
+
+    def _payload(self, prompt: str, stream: bool = False, max_tokens: Optional[int] = None) -> dict:
+        parameters = {
+            "max_tokens": max_tokens or self.max_tokens,
+            "temperature": self.temperature,
+            "top_p": self.top_p
+        }
+        if stream:
+            # 增量输出：每个事件只包含新生成的片段
+            parameters["incremental_output"] = True
+        return {
+            "model": self.model,
+            "input": {"prompt": prompt},
+            "parameters": parameters
+        }
+
+    def _build_request(self, prompt: str, stream: bool = False, max_tokens: Optional[int] = None) -> httpx.Request:
+        return get_http_client().build_request(
+            "POST",
+            settings.QWEN_API_URL,
+            headers=self._headers(stream),
+            json=self._payload(prompt, stream, max_tokens),
+            extensions=request_extensions()
+        )
+
+    @staticmethod
+    def _usage_tokens(usage: Optional[dict]) -> Optional[Usage]:
+        if not usage:
+            return None
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+
+    async def _complete(self, prompt: str, max_tokens: int):
+        response = await self._send_with_retry(lambda: self._build_request(prompt, max_tokens=max_tokens))
+        await self._check_status(response)
+        result = response.json()
+        return result.get("output", {}).get("text", ""), self._usage_tokens(result.get("usage"))
+
+    async def _embed(self, texts: List[str], text_type: str) -> List[List[float]]:
+        def build_request():
+            return get_http_client().build_request(
+                "POST",
+                settings.QWEN_EMBEDDING_URL,
+                headers=self._headers(),
+                json={
+                    "model": self.embedding_model,
+                    "input": {"texts": texts},
+                    "parameters": {"text_type": text_type}
+                },
+                extensions=request_extensions()
+            )
+
+        response = await self._send_with_retry(build_request)
+        await self._check_status(response)
+        embeddings = response.json().get("output", {}).get("embeddings", [])
+        embeddings.sort(key=lambda item: item.get("text_index", 0))
+        return [item["embedding"] for item in embeddings]
+
+    async def _stream(self, prompt: str, usage: dict) -> AsyncIterator[str]:
+        response = None
+        try:
+            # 只在收到首个片段之前重试，已输出的内容无法撤回
+            response = await self._send_with_retry(lambda: self._build_request(prompt, stream=True), stream=True)
+            await self._check_status(response)
+
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line[5:])
+                if "code" in event and "output" not in event:
+                    llm_failed_calls_total.inc(provider=self.name, reason="stream")
+                    logger.error(f"{self.name}流式输出错误: {event}")
+                    raise GenerationError(event.get("message") or "模型服务返回错误")
+                usage["tokens"] = self._usage_tokens(event.get("usage")) or usage.get("tokens")
+                text = event.get("output", {}).get("text", "")
+                if text:
+                    yield text
+        finally:
+            if response is not None:
+                await response.aclose()
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """OpenAI兼容接口的本地模型服务（Ollama、vLLM、llama.cpp server等）"""
+
+    name = "local"
+
+    def __init__(self):
+        super().__init__(
+            settings.LOCAL_LLM_MODEL,
+            requests_per_minute=settings.LOCAL_LLM_REQUESTS_PER_MINUTE,
+            tokens_per_minute=settings.LOCAL_LLM_TOKENS_PER_MINUTE,
+            embedding_model=settings.LOCAL_EMBEDDING_MODEL
+        )
+
+    def _headers(self) -> dict:
+        headers = {"Content-Type": "application/json"}
+        if settings.LOCAL_LLM_API_KEY:
+            headers["Authorization"] = f"Bearer {settings.LOCAL_LLM_API_KEY}"
+        return headers
+
+    def _build_request(self, prompt: str, stream: bool = False, max_tokens: Optional[int] = None) -> httpx.Request:
+        return get_http_client().build_request(
+            "POST",
+            f"{settings.LOCAL_LLM_BASE_URL.rstrip('/')}/chat/completions",
+            headers=self._headers(),
+            json={
+                "model": self.model,
+                "messages": [{"role": "user", "content": prompt}],
+                "max_tokens": max_tokens or self.max_tokens,
+                "temperature": self.temperature,
+                "top_p": self.top_p,
+                "stream": stream
+            },
+            extensions=request_extensions()
+        )
+
+    @staticmethod
+    def _usage_tokens(usage: Optional[dict]) -> Optional[Usage]:
+        if not usage:
+            return None
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+    async def _complete(self, prompt: str, max_tokens: int):
+        response = await self._send_with_retry(lambda: self._build_request(prompt, max_tokens=max_tokens))
+        await self._check_status(response)
+        result = response.json()
+        choices = result.get("choices") or [{}]
+        content = (choices[0].get("message") or {}).get("content") or ""
+        return content, self._usage_tokens(result.get("usage"))
+
+    async def _embed(self, texts: List[str], text_type: str) -> List[List[float]]:
+        def build_request():
+            return get_http_client().build_request(
+                "POST",
+                f"{settings.LOCAL_LLM_BASE_URL.rstrip('/')}/embeddings",
+                headers=self._headers(),
+                json={"model": self.embedding_model, "input": texts},
+                extensions=request_extensions()
+            )
+
+        response = await self._send_with_retry(build_request)
+        await self._check_status(response)
+        data = sorted(response.json().get("data", []), key=lambda item: item.get("index", 0))
+        return [item["embedding"] for item in data]
+
+    async def _stream(self, prompt: str, usage: dict) -> AsyncIterator[str]:
+        response = None
+        try:
+            response = await self._send_with_retry(lambda: self._build_request(prompt, stream=True), stream=True)
+            await self._check_status(response)
+
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                event = json.loads(data)
+                usage["tokens"] = self._usage_tokens(event.get("usage")) or usage.get("tokens")
+                choices = event.get("choices") or [{}]
+                text = (choices[0].get("delta") or {}).get("content") or ""
+                if text:
+                    yield text
+        finally:
+            if response is not None:
+                await response.aclose()
+
+
+class StubProvider(LLMProvider):
+    """进程内确定性桩模型：不访问网络，相同提示词返回相同内容，用于压测和CI"""
+
+    name = "stub"
+
+    def __init__(self):
+        super().__init__("stub", embedding_model="stub")
+
+    def _render(self, prompt: str) -> str:
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        line = f"桩模型输出（{digest[:12]}）：本段内容由测试桩根据提示词确定性生成。"
+        repeat = max(1, settings.STUB_LLM_OUTPUT_CHARS // len(line))
+        return "\n\n".join([line] * repeat)
+
+    async def _complete(self, prompt: str, max_tokens: int):
+        if settings.STUB_LLM_LATENCY > 0:
+            await asyncio.sleep(settings.STUB_LLM_LATENCY)
+        return self._render(prompt), None
+
+    async def _embed(self, texts: List[str], text_type: str) -> List[List[float]]:
+        # 字符二元组特征哈希：不同进程结果一致，字面相近的文本向量也相近
+        dim = settings.EMBEDDING_DIM
+        vectors = []
+        for text in texts:
+            vector = [0.0] * dim
+            for i in range(len(text) - 1):
+                h = zlib.crc32(text[i:i + 2].encode("utf-8"))
+                vector[h % dim] += -1.0 if h >> 31 else 1.0
+            norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+            vectors.append([v / norm for v in vector])
+        return vectors
+
+    async def _stream(self, prompt: str, usage: dict) -> AsyncIterator[str]:
+        paragraphs = self._render(prompt).split("\n\n")
+        delay = settings.STUB_LLM_LATENCY / len(paragraphs)
+        for i, paragraph in enumerate(paragraphs):
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield paragraph if i == 0 else "\n\n" + paragraph
+
+
+_PROVIDER_CLASSES = {
+    "dashscope": DashScopeProvider,
+    "local": OpenAICompatibleProvider,
+    "stub": StubProvider,
+}
+_providers: Dict[str, LLMProvider] = {}
+
+
+def get_embedding_provider() -> LLMProvider:
+    """获取向量化使用的提供方，未配置 EMBEDDING_PROVIDER 时与生成共用"""
+    return get_provider(settings.EMBEDDING_PROVIDER)
+
+
+def circuit_states() -> Dict[str, dict]:
+    """已创建的各提供方熔断器状态"""
+    states = {}
+    for provider in _providers.values():
+        for breaker in (provider.breaker, provider.embedding_breaker):
+            states[breaker.name] = breaker.snapshot()
+    return states
+
+
+def get_provider(name: Optional[str] = None) -> LLMProvider:
+    """获取模型服务提供方，未指定时使用部署配置 LLM_PROVIDER"""
+    name = name or settings.LLM_PROVIDER
+    if name not in _PROVIDER_CLASSES:
+        raise ValueError(f"未知的模型服务提供方: {name}")
+    if name not in _providers:
+        _providers[name] = _PROVIDER_CLASSES[name]()
+    return _providers[name]
@@ -0,0 +1,98 @@
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Optional
+
+from ..config import settings
+from ..utils.metrics import registry
+
+login_throttled_total = registry.counter(
+    "login_throttled_total", "因登录过于频繁被拒绝的请求数", ("scope",)
+)
+
+
+class _SlidingWindow:
+    """按键记录时间窗口内的事件时间，超过上限时给出需要等待的秒数；最多跟踪 max_keys 个键，超出时淘汰最久未活动的"""
+
+    def __init__(self, limit: int, window: float, max_keys: int = 100000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._events: "OrderedDict[str, Deque[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _prune(self, key: str, now: float) -> Optional[Deque[float]]:
+        events = self._events.get(key)
+        if events is None:
+            return None
+        while events and events[0] <= now - self.window:
+            events.popleft()
+        if not events:
+            del self._events[key]
+            return None
+        return events
+
+    def retry_after(self, key: str) -> float:
+        """已达到上限时返回最早一次事件移出窗口前的秒数，否则返回0"""
+        if self.limit <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            events = self._prune(key, now)
+            if events is None or len(events) < self.limit:
+                return 0.0
+            return events[-self.limit] + self.window - now
+
+    def add(self, key: str):
+        if self.limit <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            events = self._prune(key, now)
+            if events is None:
+                events = self._events[key] = deque(maxlen=self.limit)
+            events.append(now)
+            self._events.move_to_end(key)
+            while len(self._events) > self.max_keys:
+                self._events.popitem(last=False)
+
+    def reset(self, key: str):
+        with self._lock:
+            self._events.pop(key, None)
+
+
+class LoginThrottle:
+    """登录限流：同一账号的连续失败次数和同一IP的登录次数分别限制，防止暴力破解，
+    也避免登录高峰时大量 bcrypt 计算占满线程池"""
+
+    def __init__(self, window: float, account_failures: int, ip_attempts: int):
+        self._accounts = _SlidingWindow(account_failures, window)
+        self._ips = _SlidingWindow(ip_attempts, window)
+
+    def check(self, username: str, ip: Optional[str]) -> Optional[int]:
+        """允许本次登录时记入IP的登录次数并返回None，否则返回建议的重试等待秒数"""
+        wait = self._accounts.retry_after(username.lower())
+        if wait > 0:
+            login_throttled_total.inc(scope="account")
+            return math.ceil(wait)
+        if ip:
+            wait = self._ips.retry_after(ip)
+            if wait > 0:
+                login_throttled_total.inc(scope="ip")
+                return math.ceil(wait)
+            self._ips.add(ip)
+        return None
+
+    def record_failure(self, username: str):
+        self._accounts.add(username.lower())
+
+    def record_success(self, username: str):
+        self._accounts.reset(username.lower())
+
+
+login_throttle = LoginThrottle(
+    window=settings.LOGIN_THROTTLE_WINDOW_SECONDS,
+    account_failures=settings.LOGIN_THROTTLE_ACCOUNT_FAILURES,
+    ip_attempts=settings.LOGIN_THROTTLE_IP_ATTEMPTS
+)
@@ -0,0 +1,245 @@
+import functools
+import logging
+import textwrap
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+from ..config import settings
+from ..models.task import Task
+from ..models.template import Template
+from ..utils.metrics import registry
+from ..utils.tokenizer import count_tokens, snap_to_boundary, truncate_tokens
+from .knowledge_base import RetrievedChunk
+
+logger = logging.getLogger(__name__)
+
+prompt_truncations_total = registry.counter(
+    "prompt_truncations_total", "提示词输入超出预算被截断的次数", ("field",)
+)
+
+# 报告的五个部分（按规范顺序）：标题及撰写要求
+REPORT_SECTIONS = [
+    ("一、实训目标", """（不少于 150 字）
+- 明确本次实训的教学目标和专业能力目标；
+- 描述学生通过实训应掌握的知识点、操作技能或综合素养（如设备使用、流程掌握、职业习惯等）；
+- 强调与课程标准、职业岗位能力之间的关系。"""),
+    ("二、实训内容", """（不少于 300 字）
+- 总结实训所涉及的主要知识模块、技术工具、实验材料或场景设置；
+- 可以包括：仪器设备、软件平台、工作流程、标准规范等；
+- 适当补充理论支撑内容，使报告更系统。"""),
+    ("三、实验/实训步骤", """（不少于 500 字，若适用请加入关键操作或技术过程描述）
+- 按照实际操作过程，分步骤描述实验/实训的详细过程；
+- 包括前期准备、操作流程、关键参数设定、注意事项等；
+- 如涉及仪器设置、软件使用、绘图建模、数据采集、护理流程等，需说明关键点或配图/代码段："""),
+    ("四、结果记录与分析", """（不少于 200 字）
+- 准确描述实训中产生的关键结果、测量数据、图纸、作品、成品、护理记录等；
+- 分析结果是否达标、存在的问题或改进空间；
+- 若出现问题，需结合原理或规范进行原因分析。"""),
+    ("五、个人心得与体会", """（不少于 200 字）
+- 总结本次实训对知识、技能、职业素养等方面的提升；
+- 可谈学习过程中的困难、反思与收获；
+- 也可对课程内容、教学组织或实训条件提出建议，体现批判性和专业成长。"""),
+]
+
+TRUNCATION_MARKER = "\n……（内容过长，中间部分已省略）……\n"
+
+# 部分生成失败时的占位文字
+SECTION_FAILED_TEXT = "（本部分生成失败，请重新生成或手动补充）"
+
+_REFERENCES_HEADER = "\n【参考资料】（来自实训手册、任务书和范例报告，请结合本次任务内容撰写，不要照抄）\n"
+
+# 静态部分在模块加载时组装一次。放在提示词开头，所有请求共用相同前缀，便于模型服务端复用前缀缓存
+_ROLE = textwrap.dedent("""\
+    你是一位专业的实训报告撰写专家，具备跨学科的写作能力，能够根据实训任务信息生成符合高等职业教育或应用型本科教学要求的标准化实训报告。
+
+    请根据以下实验任务信息，撰写一份完整、逻辑清晰、语言书面化、结构规范的实训报告。
+""")
+
+_FULL_PREFIX = _ROLE + "\n请严格按照以下五个部分进行撰写，每个部分不少于规定的字数，内容应具体真实、有条理，语言规范：\n\n---\n\n" + \
+    "\n\n".join(f"{title}{requirement}" for title, requirement in REPORT_SECTIONS) + "\n\n---\n"
+
+_OUTLINE = "；".join(title for title, _ in REPORT_SECTIONS)
+_SECTION_PREFIXES = [
+    _ROLE + f"\n完整报告包括：{_OUTLINE}。本次只需撰写其中的“{title}”部分，不要输出其他部分的内容。\n"
+    f"请以“{title}”作为标题开头，内容应具体真实、有条理，语言规范：\n\n{title}{requirement}\n\n---\n"
+    for title, requirement in REPORT_SECTIONS
+]
+
+# 多智能体生成：提纲、审阅阶段的静态前缀
+_OUTLINE_PREFIX = _ROLE + "\n本次只需为报告拟定提纲，不要撰写正文。请针对以下五个部分分别列出3至5条要点，" \
+    "每条要点一句话，紧扣实训任务内容，各部分之间不要重复：\n\n" + \
+    "\n".join(title for title, _ in REPORT_SECTIONS) + "\n\n---\n"
+
+_OUTLINE_HEADER = "\n【报告提纲】（撰写时围绕对应部分的要点展开）\n"
+
+_REVIEW_PREFIXES = [
+    "你是一位严谨的实训报告审阅专家。请审阅下面“" + title + "”部分的初稿：检查是否满足撰写要求和字数、"
+    "是否与报告提纲一致、是否存在事实或逻辑错误以及口语化表达，然后直接输出修改后的完整内容。"
+    f"以“{title}”作为标题开头，不要输出审阅意见或其他部分：\n\n{title}{requirement}\n\n---\n"
+    for title, requirement in REPORT_SECTIONS
+]
+
+_DRAFT_HEADER = "\n【待审阅初稿】\n"
+
+
+@dataclass
+class Prompt:
+    """组装好的提示词"""
+    text: str
+    tokens: int
+    truncated: bool = False
+    references: int = 0  # 注入的参考资料条数
+
+
+@functools.lru_cache(maxsize=None)
+def _static_tokens(text: str) -> int:
+    """静态前缀的令牌数只计算一次"""
+    return count_tokens(text)
+
+
+def _task_info(title: str, description: str, template_content: str) -> str:
+    info = f"\n【实训项目名称】\n{title}\n\n【实训任务描述】\n{description}\n"
+    if template_content:
+        info += f"\n【撰写模板】\n{template_content}\n"
+    return info
+
+
+def _format_references(references: Sequence[RetrievedChunk]) -> Tuple[str, int]:
+    """按相似度顺序拼接参考资料，超出 RAG_MAX_TOKENS 的部分舍弃；返回 (文本, 条数)"""
+    if not references:
+        return "", 0
+    budget = settings.RAG_MAX_TOKENS - _static_tokens(_REFERENCES_HEADER)
+    blocks = []
+    for chunk in references:
+        block = f"\n[{len(blocks) + 1}] {chunk.title}\n{chunk.content}\n"
+        tokens = count_tokens(block)
+        if tokens > budget:
+            break
+        blocks.append(block)
+        budget -= tokens
+    if not blocks:
+        return "", 0
+    return _REFERENCES_HEADER + "".join(blocks), len(blocks)
+
+
+def _shorten(text: str, max_tokens: int) -> str:
+    """保留开头和结尾、省略中间部分，截断处对齐到句子边界"""
+    available = max_tokens - _static_tokens(TRUNCATION_MARKER)
+    if available <= 0:
+        return ""
+    head_tokens = available * 2 // 3
+    head = snap_to_boundary(truncate_tokens(text, head_tokens))
+    tail = snap_to_boundary(truncate_tokens(text, available - head_tokens, from_end=True), from_end=True)
+    return head + TRUNCATION_MARKER + tail
+
+
+def _fit_inputs(description: str, template_content: str, budget: int) -> Tuple[str, str, bool]:
+    """把任务描述和模板内容压缩到预算内，返回 (描述, 模板内容, 是否截断)"""
+    description_tokens = count_tokens(description)
+    template_tokens = count_tokens(template_content)
+    if description_tokens + template_tokens <= budget:
+        return description, template_content, False
+
+    # 两者平分预算，一方用不完的额度让给另一方
+    description_budget = min(description_tokens, max(budget // 2, budget - template_tokens))
+    template_budget = budget - description_budget
+    if description_tokens > description_budget:
+        prompt_truncations_total.inc(field="description")
+        description = _shorten(description, description_budget)
+    if template_tokens > template_budget:
+        prompt_truncations_total.inc(field="template")
+        template_content = _shorten(template_content, template_budget)
+    logger.warning(
+        f"提示词输入超出预算({budget}令牌)已截断: 任务描述{description_tokens}令牌, 模板{template_tokens}令牌"
+    )
+    return description, template_content, True
+
+
+def _build(
+    task: Task,
+    template: Optional[Template],
+    prefixes: List[str],
+    references: Sequence[RetrievedChunk] = (),
+    reserve: int = 0
+) -> List[Prompt]:
+    """为每个静态前缀拼接任务信息和参考资料，任务描述和模板内容只压缩一次；reserve 为后续追加内容预留的令牌数"""
+    title = task.title
+    reference_text, reference_count = _format_references(references)
+    frame_tokens = count_tokens(_task_info(title, "", "（模板）" if template else "")) + count_tokens(reference_text)
+    budget = settings.PROMPT_MAX_TOKENS - max(_static_tokens(p) for p in prefixes) - frame_tokens - reserve
+    description, template_content, truncated = _fit_inputs(
+        task.description or "", template.content if template else "", max(0, budget)
+    )
+    info = _task_info(title, description, template_content) + reference_text
+    info_tokens = count_tokens(info)
+    return [
+        Prompt(prefix + info, _static_tokens(prefix) + info_tokens, truncated, reference_count)
+        for prefix in prefixes
+    ]
+
+
+def build_prompt(
+    task: Task, template: Optional[Template] = None, references: Sequence[RetrievedChunk] = ()
+) -> Prompt:
+    """构建整篇报告的提示词"""
+    return _build(task, template, [_FULL_PREFIX], references)[0]
+
+
+def build_section_prompts(
+    task: Task, template: Optional[Template] = None, references: Sequence[RetrievedChunk] = ()
+) -> List[Prompt]:
+    """构建五个部分各自的提示词"""
+    return _build(task, template, _SECTION_PREFIXES, references)
+
+
+def build_agent_prompts(
+    task: Task, template: Optional[Template] = None, references: Sequence[RetrievedChunk] = ()
+) -> List[Prompt]:
+    """构建多智能体生成的提纲提示词和五个部分的撰写提示词，撰写提示词为提纲预留 AGENT_OUTLINE_MAX_TOKENS"""
+    reserve = settings.AGENT_OUTLINE_MAX_TOKENS + _static_tokens(_OUTLINE_HEADER)
+    return _build(task, template, [_OUTLINE_PREFIX] + _SECTION_PREFIXES, references, reserve)
+
+
+def _clip(text: str, max_tokens: int, field: str) -> str:
+    if count_tokens(text) <= max_tokens:
+        return text
+    prompt_truncations_total.inc(field=field)
+    return _shorten(text, max_tokens)
+
+
+def with_outline(prompt: Prompt, outline: str) -> Prompt:
+    """在撰写提示词后追加提纲，提纲超出 AGENT_OUTLINE_MAX_TOKENS 时截断"""
+    if not outline:
+        return prompt
+    block = _OUTLINE_HEADER + _clip(outline.strip(), settings.AGENT_OUTLINE_MAX_TOKENS, "outline") + "\n"
+    return Prompt(prompt.text + block, prompt.tokens + count_tokens(block), prompt.truncated, prompt.references)
+
+
+def build_review_prompt(index: int, draft: str, outline: str = "") -> Prompt:
+    """构建第 index 部分的审阅提示词：撰写要求 + 提纲 + 初稿"""
+    prefix = _REVIEW_PREFIXES[index]
+    draft_block = _DRAFT_HEADER + draft.strip() + "\n"
+    budget = settings.PROMPT_MAX_TOKENS - _static_tokens(prefix) - count_tokens(draft_block)
+    outline_block = ""
+    if outline and budget > _static_tokens(_OUTLINE_HEADER):
+        outline_block = _OUTLINE_HEADER + _clip(
+            outline.strip(), min(settings.AGENT_OUTLINE_MAX_TOKENS, budget - _static_tokens(_OUTLINE_HEADER)), "outline"
+        ) + "\n"
+    text = prefix + outline_block + draft_block
+    return Prompt(text, _static_tokens(prefix) + count_tokens(outline_block) + count_tokens(draft_block))
+
+
+def build_prompts(
+    task: Task,
+    template: Optional[Template] = None,
+    mode: Optional[str] = None,
+    references: Sequence[RetrievedChunk] = ()
+) -> List[Prompt]:
+    """按生成模式构建提示词：single 一条，sections 每个部分一条，agents 为提纲加每个部分一条；
+    references 为检索到的参考资料"""
+    mode = mode or settings.REPORT_GENERATION_MODE
+    if mode == "sections":
+        return build_section_prompts(task, template, references)
+    if mode == "agents":
+        return build_agent_prompts(task, template, references)
+    return [build_prompt(task, template, references)]
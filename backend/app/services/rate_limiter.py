@@ -0,0 +1,92 @@
+import asyncio
+import datetime
+import email.utils
+import random
+import time
+from typing import Optional
+
+from ..utils.metrics import registry
+
+llm_throttled_total = registry.counter(
+    "llm_throttled_total", "模型调用被限流的次数", ("provider", "source")
+)
+
+
+class TokenBucket:
+    """令牌桶：按每分钟额度匀速补充，额度不足时异步等待"""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1) -> float:
+        """获取令牌，返回等待的秒数"""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        # 加锁保证先到先得，避免大请求被小请求持续插队
+        async with self._lock:
+            self._refill()
+            while self._tokens < amount:
+                delay = (amount - self._tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+                self._refill()
+            self._tokens -= amount
+        return waited
+
+    def refund(self, amount: float):
+        """归还预占但未实际使用的令牌"""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class RateLimiter:
+    """模型服务限流器：同时约束每分钟请求数和每分钟令牌数，0表示不限制"""
+
+    def __init__(self, provider: str, requests_per_minute: int, tokens_per_minute: int):
+        self.provider = provider
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+
+    async def acquire(self, tokens: int):
+        waited = 0.0
+        if self._requests is not None:
+            waited += await self._requests.acquire(1)
+        if self._tokens is not None:
+            waited += await self._tokens.acquire(tokens)
+        if waited > 0:
+            llm_throttled_total.inc(provider=self.provider, source="local")
+
+    def settle(self, reserved: int, used: int):
+        """按实际用量结算预占的令牌"""
+        if self._tokens is not None and used < reserved:
+            self._tokens.refund(reserved - used)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析Retry-After响应头（秒数或HTTP日期）"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    now = datetime.datetime.now(retry_at.tzinfo)
+    return max(0.0, (retry_at - now).total_seconds())
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """带随机抖动的指数退避（full jitter）"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+from typing import AsyncIterator, List, Optional
+
+from ..database import AsyncSessionLocal
+from .ai_service import generate_report_with_qwen, report_generation_cancelled_total
+from .hedging import set_route
+
+logger = logging.getLogger(__name__)
+
+
+async def _generate_for_user(
+    semaphore: asyncio.Semaphore,
+    task_id: int,
+    user_id: int,
+    template_id: Optional[int],
+    force_regenerate: bool,
+    mode: Optional[str],
+    provider: Optional[str]
+) -> dict:
+    async with semaphore:
+        # 并发任务各自使用独立的数据库会话
+        set_route("batch")
+        async with AsyncSessionLocal() as db:
+            report = await generate_report_with_qwen(
+                db=db,
+                task_id=task_id,
+                user_id=user_id,
+                template_id=template_id,
+                force_regenerate=force_regenerate,
+                mode=mode,
+                provider=provider
+            )
+
+    if report is None:
+        return {"user_id": user_id, "status": "failed", "report_id": None, "error": "报告生成失败"}
+    return {"user_id": user_id, "status": "done", "report_id": report.id, "error": None}
+
+
+async def generate_reports_for_users(
+    task_id: int,
+    user_ids: List[int],
+    template_id: Optional[int] = None,
+    concurrency: int = 8,
+    force_regenerate: bool = True,
+    mode: Optional[str] = None,
+    provider: Optional[str] = None
+) -> AsyncIterator[dict]:
+    """为多名学生并发生成报告，按完成顺序逐个返回结果"""
+    semaphore = asyncio.Semaphore(concurrency)
+    pending = [
+        asyncio.create_task(
+            _generate_for_user(semaphore, task_id, user_id, template_id, force_regenerate, mode, provider)
+        )
+        for user_id in user_ids
+    ]
+    logger.info(f"开始批量生成报告: 任务ID={task_id}, 学生数={len(user_ids)}, 并发数={concurrency}")
+
+    try:
+        for future in asyncio.as_completed(pending):
+            yield await future
+    finally:
+        # 提前结束（如客户端断开）时取消尚未完成的生成
+        unfinished = [task for task in pending if not task.done()]
+        for task in unfinished:
+            task.cancel()
+        if unfinished:
+            report_generation_cancelled_total.inc(len(unfinished), reason="client_disconnect")
+            logger.info(f"批量生成提前结束，已取消 {len(unfinished)} 名学生的生成")
@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import uuid
+import datetime
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from ..config import settings
+from ..database import AsyncSessionLocal
+from .ai_service import generate_report_with_qwen, report_generation_cancelled_total
+from .hedging import set_route
+from .request_coalescing import requests_coalesced_total
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+
+class QueueFullError(Exception):
+    """生成队列已满"""
+
+
+@dataclass
+class ReportJob:
+    """报告生成任务"""
+    user_id: int
+    task_id: int
+    template_id: Optional[int] = None
+    force_regenerate: bool = False
+    mode: Optional[str] = None
+    provider: Optional[str] = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = JOB_QUEUED
+    report_id: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime.datetime = field(default_factory=datetime.datetime.utcnow)
+    started_at: Optional[datetime.datetime] = None
+    finished_at: Optional[datetime.datetime] = None
+    # 客户端最近一次提交或查询进度的时间，用于判断任务是否已被放弃
+    last_seen_at: datetime.datetime = field(default_factory=datetime.datetime.utcnow)
+    # 运行中的协程，不属于数据字段，不参与序列化
+    _task = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+    @property
+    def failed(self) -> bool:
+        return self.status in (JOB_FAILED, JOB_CANCELLED)
+
+    @property
+    def coalesce_key(self) -> Tuple:
+        return (self.user_id, self.task_id, self.template_id, self.force_regenerate, self.mode, self.provider)
+
+
+class ReportJobManager:
+    """报告生成任务队列：接口立即返回任务ID，由固定数量的后台协程消费队列"""
+
+    def __init__(self, worker_count: int, max_queue_size: int, job_ttl: int, abandon_after: int = 0):
+        self.worker_count = worker_count
+        self.max_queue_size = max_queue_size
+        self.job_ttl = job_ttl
+        self.abandon_after = abandon_after
+        self._jobs: Dict[str, ReportJob] = {}
+        # 未完成的任务，相同参数的重复提交直接返回已有任务
+        self._inflight: Dict[Tuple, ReportJob] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._reaper: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """启动后台工作协程"""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"report-worker-{i}")
+            for i in range(self.worker_count)
+        ]
+        if self.abandon_after > 0:
+            self._reaper = asyncio.create_task(self._reap_abandoned(), name="report-job-reaper")
+        logger.info(f"报告生成队列已启动, 工作协程数: {self.worker_count}")
+
+    async def stop(self):
+        """停止后台工作协程，未完成的任务标记为失败"""
+        tasks = self._workers + ([self._reaper] if self._reaper else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._reaper = None
+
+        for job in self._jobs.values():
+            if not job.finished:
+                self._finish(job, JOB_FAILED, error="服务已停止")
+        logger.info("报告生成队列已停止")
+
+    def submit(
+        self,
+        user_id: int,
+        task_id: int,
+        template_id: Optional[int] = None,
+        force_regenerate: bool = False,
+        mode: Optional[str] = None,
+        provider: Optional[str] = None
+    ) -> ReportJob:
+        """提交生成任务，同一用户参数相同的任务未完成时返回已有任务"""
+        if self._queue is None:
+            raise RuntimeError("报告生成队列未启动")
+
+        self._prune()
+        job = ReportJob(
+            user_id=user_id,
+            task_id=task_id,
+            template_id=template_id,
+            force_regenerate=force_regenerate,
+            mode=mode,
+            provider=provider
+        )
+        if settings.REQUEST_COALESCING_ENABLED:
+            existing = self._inflight.get(job.coalesce_key)
+            if existing is not None and not existing.finished:
+                requests_coalesced_total.inc(kind="job")
+                existing.last_seen_at = datetime.datetime.utcnow()
+                logger.info(f"合并重复的报告生成请求到任务: {existing.id}")
+                return existing
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError("生成队列已满")
+
+        self._jobs[job.id] = job
+        self._inflight[job.coalesce_key] = job
+        logger.info(f"已提交报告生成任务: {job.id}, 队列长度: {self._queue.qsize()}")
+        return job
+
+    def get(self, job_id: str) -> Optional[ReportJob]:
+        """查询任务，同时记录客户端仍在等待结果"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job.last_seen_at = datetime.datetime.utcnow()
+        return job
+
+    def cancel(self, job: ReportJob, reason: str = "client_cancelled") -> bool:
+        """取消未完成的任务：排队中的直接标记取消，运行中的中断模型调用；返回是否取消"""
+        if job.finished:
+            return False
+        if job._task is not None and not job._task.cancel():
+            return False
+        self._finish(job, JOB_CANCELLED, error="报告生成已取消")
+        report_generation_cancelled_total.inc(reason=reason)
+        return True
+
+    def queue_size(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self._queue.get()
+            try:
+                # 排队期间已被取消的任务不再占用工作协程
+                if job.finished:
+                    continue
+                # 每个任务在独立的协程中运行，取消单个任务不影响工作协程
+                job._task = asyncio.create_task(self._run(job))
+                try:
+                    await asyncio.wait({job._task})
+                except asyncio.CancelledError:
+                    job._task.cancel()
+                    raise
+                if not job._task.cancelled():
+                    job._task.result()
+            except Exception as e:
+                logger.error(f"报告生成任务异常: {job.id}, {str(e)}", exc_info=True)
+                self._finish(job, JOB_FAILED, error="报告生成失败")
+            finally:
+                job._task = None
+                self._queue.task_done()
+
+    async def _reap_abandoned(self):
+        """定期取消长时间无人查询进度的任务，释放工作协程和模型调用额度"""
+        interval = max(1.0, min(self.abandon_after / 4, 15.0))
+        while True:
+            await asyncio.sleep(interval)
+            cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.abandon_after)
+            for job in list(self._jobs.values()):
+                if not job.finished and job.last_seen_at < cutoff:
+                    logger.info(f"报告生成任务长时间无人查询，已取消: {job.id}")
+                    self.cancel(job, reason="abandoned")
+
+    async def _run(self, job: ReportJob):
+        job.status = JOB_RUNNING
+        job.started_at = datetime.datetime.utcnow()
+
+        # 每个任务使用独立的数据库会话
+        set_route("generate")
+        async with AsyncSessionLocal() as db:
+            report = await generate_report_with_qwen(
+                db=db,
+                task_id=job.task_id,
+                user_id=job.user_id,
+                template_id=job.template_id,
+                force_regenerate=job.force_regenerate,
+                mode=job.mode,
+                provider=job.provider
+            )
+
+        if job.finished:
+            return
+        if report is None:
+            self._finish(job, JOB_FAILED, error="报告生成失败")
+        else:
+            job.report_id = report.id
+            self._finish(job, JOB_DONE)
+
+    def _finish(self, job: ReportJob, status: str, error: Optional[str] = None):
+        job.status = status
+        job.error = error
+        job.finished_at = datetime.datetime.utcnow()
+        if self._inflight.get(job.coalesce_key) is job:
+            del self._inflight[job.coalesce_key]
+        logger.info(f"报告生成任务结束: {job.id}, 状态: {status}")
+
+    def _prune(self):
+        """清理过期的已完成任务"""
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.job_ttl)
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+report_job_manager = ReportJobManager(
+    worker_count=settings.REPORT_WORKER_COUNT,
+    max_queue_size=settings.REPORT_QUEUE_MAXSIZE,
+    job_ttl=settings.REPORT_JOB_TTL_SECONDS,
+    abandon_after=settings.REPORT_JOB_ABANDON_SECONDS
+)
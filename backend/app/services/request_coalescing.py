@@ -0,0 +1,171 @@
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from ..config import settings
+from ..utils.lru import TTLCache
+from ..utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+requests_coalesced_total = registry.counter(
+    "requests_coalesced_total", "合并到进行中请求的重复请求数", ("kind",)
+)
+idempotent_replays_total = registry.counter(
+    "idempotent_replays_total", "按Idempotency-Key返回原结果的重试请求数", ("endpoint",)
+)
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+class IdempotencyConflictError(Exception):
+    """同一个Idempotency-Key用于了不同的请求内容"""
+
+
+def request_fingerprint(payload: Dict[str, Any]) -> str:
+    """请求内容的指纹，用于识别重复请求"""
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """相同键的并发调用只执行一次，所有调用方共享结果；全部调用方取消时才取消底层调用"""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._calls: Dict[str, Tuple[asyncio.Task, List[int]]] = {}
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            task = asyncio.ensure_future(func())
+            call = self._calls[key] = (task, [0])
+            task.add_done_callback(lambda _: self._calls.pop(key, None) if self._calls.get(key) is call else None)
+        else:
+            requests_coalesced_total.inc(kind=self.kind)
+        task, waiters = call
+        waiters[0] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if waiters[0] == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            waiters[0] -= 1
+
+
+class StreamFlight:
+    """进行中的流式生成：由后台协程产生事件，多个请求订阅同一份输出，后加入的请求先补发已有内容"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.events: List[Tuple[str, dict]] = []
+        self.finished = False
+        self.failed = False
+        self.subscribers = 0
+        self._changed = asyncio.Condition()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, producer: Callable[["StreamFlight"], Awaitable[None]]):
+        self._task = asyncio.create_task(self._produce(producer))
+
+    async def _produce(self, producer):
+        try:
+            await producer(self)
+        except asyncio.CancelledError:
+            await self.publish("error", {"detail": "报告生成已取消"})
+            await self.finish(failed=True)
+            raise
+        except Exception as e:
+            logger.error(f"流式生成异常: {str(e)}", exc_info=True)
+            await self.publish("error", {"detail": "报告生成失败"})
+            await self.finish(failed=True)
+        else:
+            await self.finish(failed=any(event == "error" for event, _ in self.events))
+
+    async def publish(self, event: str, payload: dict):
+        async with self._changed:
+            self.events.append((event, payload))
+            self._changed.notify_all()
+
+    async def finish(self, failed: bool = False):
+        async with self._changed:
+            if not self.finished:
+                self.finished = True
+                self.failed = failed
+            self._changed.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[Tuple[str, dict]]:
+        """从头读取事件直到生成结束；最后一个订阅者提前离开时取消生成"""
+        self.subscribers += 1
+        index = 0
+        try:
+            while True:
+                async with self._changed:
+                    await self._changed.wait_for(lambda: index < len(self.events) or self.finished)
+                    pending = self.events[index:]
+                    index = len(self.events)
+                    finished = self.finished
+                for event in pending:
+                    yield event
+                if finished and index == len(self.events):
+                    return
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and self._task is not None and not self._task.done():
+                self._task.cancel()
+
+
+class StreamFlightGroup:
+    """按键管理进行中的流式生成"""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._flights: Dict[str, StreamFlight] = {}
+
+    def join(self, key: str, producer: Callable[[StreamFlight], Awaitable[None]]) -> StreamFlight:
+        flight = self._flights.get(key)
+        if flight is not None and not flight.finished:
+            requests_coalesced_total.inc(kind=self.kind)
+            return flight
+        flight = self._flights[key] = StreamFlight(key)
+        flight.start(producer)
+        flight._task.add_done_callback(
+            lambda _: self._flights.pop(key, None) if self._flights.get(key) is flight else None
+        )
+        return flight
+
+
+class IdempotencyStore:
+    """Idempotency-Key 记录：窗口期内重试相同请求返回原结果，失败的结果不保留"""
+
+    def __init__(self, max_entries: int, ttl: int):
+        self._entries = TTLCache(max_entries, ttl)
+
+    @staticmethod
+    def _key(scope: str, user_id: int, key: str) -> str:
+        return f"{scope}:{user_id}:{key}"
+
+    def get(self, scope: str, user_id: int, key: str, fingerprint: str) -> Optional[Any]:
+        entry = self._entries.get(self._key(scope, user_id, key))
+        if entry is None:
+            return None
+        stored_fingerprint, result = entry
+        if stored_fingerprint != fingerprint:
+            raise IdempotencyConflictError("Idempotency-Key 已用于不同的请求")
+        if getattr(result, "failed", False):
+            return None
+        idempotent_replays_total.inc(endpoint=scope)
+        return result
+
+    def put(self, scope: str, user_id: int, key: str, fingerprint: str, result: Any):
+        self._entries.set(self._key(scope, user_id, key), (fingerprint, result))
+
+
+idempotency_store = IdempotencyStore(
+    max_entries=settings.IDEMPOTENCY_MAX_KEYS,
+    ttl=settings.IDEMPOTENCY_TTL_SECONDS
+)
@@ -0,0 +1,134 @@
+import csv
+import io
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+from pydantic import ValidationError
+from sqlalchemy import insert, or_, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..database import release_connection
+from ..models.user import User
+from ..schemas.user import RosterRow, RosterRowResult
+from ..utils.metrics import registry
+from ..utils.security import hash_passwords
+
+logger = logging.getLogger(__name__)
+
+roster_import_rows_total = registry.counter(
+    "roster_import_rows_total", "名单导入处理的行数", ("status",)
+)
+
+
+class RosterConflictError(Exception):
+    """检查之后、写入之前有同名用户注册，整批写入被数据库唯一约束拒绝"""
+
+
+def parse_roster(filename: str, data: bytes) -> List[Dict[str, Any]]:
+    """解析上传的名单，支持 .csv（首行为列名）和 .json（对象数组），空单元格视为未填写"""
+    name = (filename or "").lower()
+    text = data.decode("utf-8-sig")
+    if name.endswith(".csv"):
+        records = [
+            {key.strip(): (value.strip() or None) if isinstance(value, str) else value
+             for key, value in record.items() if key}
+            for record in csv.DictReader(io.StringIO(text))
+        ]
+    elif name.endswith(".json"):
+        records = json.loads(text)
+        if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+            raise ValueError("JSON名单必须是对象数组")
+    else:
+        raise ValueError("只支持.csv、.json格式文件")
+    if not records:
+        raise ValueError("名单为空")
+    if len(records) > settings.ROSTER_IMPORT_MAX_ROWS:
+        raise ValueError(f"名单最多{settings.ROSTER_IMPORT_MAX_ROWS}行")
+    return records
+
+
+def _validation_detail(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(loc) for loc in e['loc'])}: {e['msg']}" for e in error.errors())
+
+
+def _student_key(row: RosterRow) -> Optional[tuple]:
+    # 与注册接口一致：只有学生同时填写了学号和学校才检查学号是否重复
+    if row.role == "student" and row.student_id and row.school:
+        return (row.student_id, row.school)
+    return None
+
+
+async def import_roster(db: AsyncSession, records: List[Dict[str, Any]]) -> List[RosterRowResult]:
+    """批量创建用户：一条查询检查全部唯一性约束，并行哈希密码，一条 INSERT 写入，返回每一行的处理结果"""
+    results: List[RosterRowResult] = []
+    rows: Dict[int, RosterRow] = {}
+    for index, record in enumerate(records, start=1):
+        try:
+            rows[index] = RosterRow(**record)
+        except ValidationError as e:
+            username = record.get("username")
+            results.append(RosterRowResult(
+                row=index, username=str(username) if username else None, status="invalid", detail=_validation_detail(e)
+            ))
+
+    # 名单中所有用户名、邮箱、学号一次查出已存在的
+    usernames = {row.username for row in rows.values()}
+    emails = {row.email for row in rows.values()}
+    student_keys = {key for key in map(_student_key, rows.values()) if key}
+    conditions = [User.username.in_(usernames), User.email.in_(emails)]
+    if student_keys:
+        conditions.append(tuple_(User.student_id, User.school).in_(student_keys))
+    existing = (await db.execute(
+        select(User.username, User.email, User.student_id, User.school).where(or_(*conditions))
+    )).all() if rows else []
+    taken_usernames = {user.username for user in existing}
+    taken_emails = {user.email for user in existing}
+    taken_students = {(user.student_id, user.school) for user in existing}
+
+    accepted: Dict[int, RosterRow] = {}
+    for index, row in rows.items():
+        key = _student_key(row)
+        if row.username in taken_usernames:
+            detail = "用户名已被注册"
+        elif row.email in taken_emails:
+            detail = "邮箱已被注册"
+        elif key and key in taken_students:
+            detail = "该学号已被注册"
+        else:
+            detail = None
+        if detail:
+            results.append(RosterRowResult(row=index, username=row.username, status="duplicate", detail=detail))
+            continue
+        # 名单中后出现的重复行也按重复处理
+        taken_usernames.add(row.username)
+        taken_emails.add(row.email)
+        if key:
+            taken_students.add(key)
+        accepted[index] = row
+
+    # 唯一性检查的读事务在哈希之前结束，哈希期间不占用数据库连接；期间有同名用户注册时写入会被唯一约束拒绝
+    await release_connection(db)
+    if accepted:
+        hashed = await hash_passwords([row.password for row in accepted.values()])
+        values = [
+            {**row.dict(exclude={"password"}), "hashed_password": hashed_password}
+            for row, hashed_password in zip(accepted.values(), hashed)
+        ]
+        try:
+            await db.execute(insert(User), values)
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            raise RosterConflictError()
+        results.extend(
+            RosterRowResult(row=index, username=row.username, status="created") for index, row in accepted.items()
+        )
+
+    results.sort(key=lambda result: result.row)
+    for result in results:
+        roster_import_rows_total.inc(status=result.status)
+    logger.info(f"名单导入完成: 共{len(records)}行，创建{len(accepted)}个用户")
+    return results
@@ -0,0 +1,77 @@
+from typing import Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models.user import User
+from ..utils.lru import TTLCache
+from ..utils.metrics import registry
+
+auth_user_cache_hits_total = registry.counter(
+    "auth_user_cache_hits_total", "认证时用户记录缓存命中次数"
+)
+auth_user_cache_misses_total = registry.counter(
+    "auth_user_cache_misses_total", "认证时用户记录缓存未命中次数"
+)
+
+_COLUMNS = [column.key for column in User.__table__.columns]
+
+# 缓存的是字段值快照而不是ORM对象，每个请求各自构造，互不影响
+_users = TTLCache(settings.AUTH_USER_CACHE_MAX_ENTRIES, settings.AUTH_USER_CACHE_TTL_SECONDS)
+
+
+def _enabled() -> bool:
+    return settings.AUTH_USER_CACHE_TTL_SECONDS > 0
+
+
+def get_cached_user(username: str) -> Optional[User]:
+    """返回缓存的用户，构造为游离状态的对象，可以读取字段，也可以 merge 到会话中"""
+    if not _enabled():
+        return None
+    values = _users.get(username)
+    if values is None:
+        auth_user_cache_misses_total.inc()
+        return None
+    auth_user_cache_hits_total.inc()
+    user = User(**values)
+    make_transient_to_detached(user)
+    return user
+
+
+def cache_user(user: User):
+    if _enabled():
+        _users.set(user.username, {key: getattr(user, key) for key in _COLUMNS})
+
+
+def invalidate_user(username: str):
+    """用户被修改、停用或删除时调用，下一个请求重新查询"""
+    _users.delete(username)
+
+
+def _usernames(user: User) -> set:
+    # 用户名被修改时，旧用户名对应的缓存也要失效
+    history = inspect(user).attrs.username.history
+    return {user.username, *history.deleted}
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_users(session: Session, flush_context):
+    """记录本次事务中修改或删除的用户，提交后使其缓存失效"""
+    changed = [obj for obj in (*session.dirty, *session.deleted) if isinstance(obj, User)]
+    if changed:
+        pending = session.info.setdefault("user_cache_pending", set())
+        for user in changed:
+            pending.update(_usernames(user))
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _invalidate_users(session: Session):
+    for username in session.info.pop("user_cache_pending", ()):
+        invalidate_user(username)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_users(session: Session):
+    session.info.pop("user_cache_pending", None)
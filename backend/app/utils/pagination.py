@@ -0,0 +1,58 @@
+import base64
+import binascii
+import datetime
+import json
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import Select, and_, func, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer, with_expression
+
+# 下一页游标通过响应头返回，列表接口的响应体保持为数组；没有下一页时不返回该响应头
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+MAX_PAGE_SIZE = 500
+MAX_EXCERPT_LENGTH = 500
+
+
+def encode_cursor(created_at: datetime.datetime, id: int) -> str:
+    """把当前页最后一行的排序键编码为不透明的游标"""
+    raw = json.dumps([created_at.isoformat(), id])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, id = json.loads(raw)
+        return datetime.datetime.fromisoformat(created_at), int(id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+
+def summary_options(column, length_attr, excerpt_attr, excerpt: int) -> list:
+    """列表摘要的加载选项：正文列不加载，由数据库计算字符数，excerpt 大于0时截取开头作为摘要"""
+    options = [defer(column), with_expression(length_attr, func.length(column))]
+    if excerpt:
+        options.append(with_expression(excerpt_attr, func.substr(column, 1, excerpt)))
+    return options
+
+
+async def keyset_page(
+    db: AsyncSession, query: Select, model, cursor: Optional[str], limit: int, response: Response
+) -> List:
+    """按 (created_at DESC, id) 游标分页，与 (user_id, created_at DESC, id) 复合索引的顺序一致，
+    任意深度的翻页都只扫描一页的行；多取一行判断是否还有下一页"""
+    query = query.order_by(model.created_at.desc(), model.id.asc())
+    if cursor:
+        created_at, last_id = decode_cursor(cursor)
+        query = query.where(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id > last_id)
+        ))
+    items = list((await db.scalars(query.limit(limit + 1))).all())
+    if len(items) > limit:
+        items = items[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(items[-1].created_at, items[-1].id)
+    return items
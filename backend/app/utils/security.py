@@ -1,17 +1,44 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, Union, Any
+from typing import List, Optional, Tuple, Union, Any
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..config import settings
 from ..models.user import User
-from ..database import get_db
+from ..database import get_async_db
+from .metrics import registry
 
-# 密码上下文
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# 密码上下文：最小、最大成本都设为配置值，成本不一致的已有哈希在登录验证后重新生成
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.PASSWORD_BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.PASSWORD_BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.PASSWORD_BCRYPT_ROUNDS
+)
+
+# bcrypt 计算期间释放GIL，放在独立的有界线程池中执行，不与其他阻塞任务争用默认线程池
+_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
+
+# 批量导入名单时使用，与登录验证的线程池分开，导入大名单时登录不需要排队
+_bulk_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.ROSTER_IMPORT_HASH_WORKERS, thread_name_prefix="password-hash-bulk"
+)
+
+password_hash_duration_seconds = registry.histogram(
+    "password_hash_duration_seconds",
+    "密码哈希计算耗时（秒），包括在线程池中排队的时间",
+    ("operation",),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10)
+)
 
 # OAuth2认证
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
@@ -25,6 +52,25 @@ def get_password_hash(password: str) -> str:
     """哈希密码"""
     return pwd_context.hash(password)
 
+async def _run_hash(operation: str, fn, *args):
+    with password_hash_duration_seconds.time(operation=operation):
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, fn, *args)
+
+async def hash_password(password: str) -> str:
+    """在密码哈希线程池中哈希密码"""
+    return await _run_hash("hash", pwd_context.hash, password)
+
+async def hash_passwords(passwords: List[str]) -> List[str]:
+    """批量哈希密码，在批量哈希线程池中并行计算，结果与输入顺序一致"""
+    loop = asyncio.get_running_loop()
+    return list(await asyncio.gather(*(
+        loop.run_in_executor(_bulk_hash_executor, pwd_context.hash, password) for password in passwords
+    )))
+
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """在密码哈希线程池中验证密码；验证通过且哈希成本与配置不一致时，同时返回按新成本生成的哈希"""
+    return await _run_hash("verify", pwd_context.verify_and_update, plain_password, hashed_password)
+
 # JWT令牌函数
 def create_access_token(subject: Union[str, Any], expires_delta: Optional[timedelta] = None) -> str:
     """创建JWT访问令牌"""
@@ -39,7 +85,7 @@ def create_access_token(subject: Union[str, Any], expires_delta: Optional[timede
 
 # 用户认证
 async def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)
 ) -> User:
     """获取当前用户"""
     credentials_exception = HTTPException(
@@ -59,10 +105,14 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
     
-    # 查询用户
-    user = db.query(User).filter(User.username == username).first()
+    # 查询用户，优先使用短期缓存（services 包初始化时会导入本模块，在此处导入避免循环引用）
+    from ..services.user_cache import cache_user, get_cached_user
+    user = get_cached_user(username)
     if user is None:
-        raise credentials_exception
+        user = await db.scalar(select(User).where(User.username == username))
+        if user is None:
+            raise credentials_exception
+        cache_user(user)
     if not user.is_active:
         raise HTTPException(status_code=400, detail="账户已停用")
     
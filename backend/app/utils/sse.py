@@ -0,0 +1,15 @@
+import json
+from typing import Any
+
+
+def format_sse(event: str, data: Any) -> str:
+    """按Server-Sent Events格式编码一条事件"""
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+# SSE响应头：禁止缓存和反向代理缓冲，保证片段即时送达
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
@@ -0,0 +1,82 @@
+import logging
+import re
+from typing import Optional
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# 本地令牌计数：优先使用tiktoken，未安装或编码文件不可用时按字符估算
+
+_encoding = None
+_encoding_loaded = False
+
+# 中日韩字符及全角标点，通常一个字符对应一个令牌
+_CJK_RE = re.compile("[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(settings.PROMPT_TOKENIZER)
+        except Exception as e:
+            logger.warning(f"无法加载tiktoken编码 {settings.PROMPT_TOKENIZER}，改为按字符估算令牌数: {str(e)}")
+            _encoding = None
+    return _encoding
+
+
+def _char_cost(char: str) -> float:
+    if _CJK_RE.match(char):
+        return 1.0
+    # 英文、数字和空白约四个字符一个令牌
+    return 0.25
+
+
+def count_tokens(text: str) -> int:
+    """统计文本的令牌数"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_tokens(text: str, max_tokens: int, from_end: bool = False) -> str:
+    """截取不超过 max_tokens 个令牌的开头部分（from_end 为真时截取结尾部分）"""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        kept = tokens[-max_tokens:] if from_end else tokens[:max_tokens]
+        # 截断处可能落在多字节字符中间，丢弃无法解码的残片
+        return encoding.decode(kept, errors="ignore")
+
+    chars = reversed(text) if from_end else iter(text)
+    cost = 0.0
+    length = 0
+    for char in chars:
+        cost += _char_cost(char)
+        if cost > max_tokens:
+            break
+        length += 1
+    return text[len(text) - length:] if from_end else text[:length]
+
+
+def snap_to_boundary(text: str, from_end: bool = False, window: Optional[int] = None) -> str:
+    """把截断位置调整到最近的段落或句子边界，避免半句话"""
+    window = window or max(1, len(text) // 5)
+    if from_end:
+        head = text[:window]
+        found = [pos for pos in (head.find(sep) for sep in ("\n", "。", "；", ". ")) if pos >= 0]
+        return text[min(found) + 1:].lstrip() if found else text
+    tail_start = max(0, len(text) - window)
+    cut = max(text.rfind(sep, tail_start) for sep in ("\n", "。", "；", ". "))
+    return text[:cut + 1].rstrip() if cut >= 0 else text
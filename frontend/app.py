@@ -5,11 +5,17 @@ import time
 import datetime
 import random
 import os
+import json
+import uuid
 
 # API基础URL - 使用服务器实际IP地址
 SERVER_IP = os.environ.get("SERVER_IP", "localhost") # 替换为您的服务器IP
 API_BASE_URL = f"http://{SERVER_IP}:8000/api"
 
+# 报告生成任务轮询配置（秒）
+REPORT_JOB_POLL_INTERVAL = 2
+REPORT_JOB_TIMEOUT = 600
+
 # 设置页面配置
 st.set_page_config(
     page_title="AI实训报告生成系统",
@@ -116,13 +122,24 @@ def get_user_info():
         return response.json()
     return None
 
-def get_tasks(skip=0, limit=100):
-    """获取任务列表"""
-    response = make_request("GET", f"tasks?skip={skip}&limit={limit}")
+def get_tasks(cursor=None, limit=100, excerpt=0):
+    """获取任务列表（不含描述全文），按创建时间倒序；cursor 为上一页响应头 X-Next-Cursor 的值，
+    excerpt 大于0时返回描述开头的字数"""
+    params = {"limit": limit, "excerpt": excerpt}
+    if cursor:
+        params["cursor"] = cursor
+    response = make_request("GET", "tasks", params=params)
     if response and response.status_code == 200:
         return response.json()
     return []
 
+def get_task(task_id):
+    """获取任务详情（含全文）"""
+    response = make_request("GET", f"tasks/{task_id}")
+    if response and response.status_code == 200:
+        return response.json()
+    return None
+
 def create_task(title, description):
     """创建新任务"""
     data = {"title": title, "description": description}
@@ -131,13 +148,23 @@ def create_task(title, description):
         return response.json()
     return None
 
-def get_templates(skip=0, limit=100):
-    """获取模板列表"""
-    response = make_request("GET", f"templates?skip={skip}&limit={limit}")
+def get_templates(cursor=None, limit=100):
+    """获取模板列表（不含模板内容），按创建时间倒序；cursor 为上一页响应头 X-Next-Cursor 的值"""
+    params = {"limit": limit}
+    if cursor:
+        params["cursor"] = cursor
+    response = make_request("GET", "templates", params=params)
     if response and response.status_code == 200:
         return response.json()
     return []
 
+def get_template(template_id):
+    """获取模板详情（含全文）"""
+    response = make_request("GET", f"templates/{template_id}")
+    if response and response.status_code == 200:
+        return response.json()
+    return None
+
 def create_template(name, content):
     """创建新模板"""
     data = {"name": name, "content": content}
@@ -153,17 +180,78 @@ def generate_report(task_id, template_id=None):
         data["template_id"] = template_id
         
     response = make_request("POST", "reports/generate", data=data)
+    if not response or response.status_code != 202:
+        return None
+    
+    # 轮询生成任务，直到完成或超时
+    job = response.json()
+    deadline = time.time() + REPORT_JOB_TIMEOUT
+    while job["status"] in ("queued", "running") and time.time() < deadline:
+        time.sleep(REPORT_JOB_POLL_INTERVAL)
+        response = make_request("GET", f"reports/jobs/{job['id']}")
+        if not response or response.status_code != 200:
+            return None
+        job = response.json()
+    
+    if job["status"] in ("queued", "running"):
+        # 超时放弃时取消任务，避免后台继续占用模型调用额度
+        make_request("DELETE", f"reports/jobs/{job['id']}")
+        return None
+    if job["status"] != "done":
+        return None
+    
+    response = make_request("GET", f"reports/{job['report_id']}")
     if response and response.status_code == 200:
         return response.json()
     return None
 
-def get_reports(skip=0, limit=100):
-    """获取报告列表"""
-    response = make_request("GET", f"reports?skip={skip}&limit={limit}")
+def generate_report_stream(task_id, template_id=None, force_regenerate=False, idempotency_key=None):
+    """流式生成报告，逐个返回 (事件类型, 数据)"""
+    data = {"task_id": task_id, "force_regenerate": force_regenerate}
+    if template_id:
+        data["template_id"] = template_id
+    headers = {"Authorization": f"Bearer {st.session_state.token}"}
+    if idempotency_key:
+        headers["Idempotency-Key"] = idempotency_key
+    
+    try:
+        with requests.post(
+            f"{API_BASE_URL}/reports/generate/stream",
+            json=data,
+            headers=headers,
+            stream=True,
+            timeout=(10, 300)
+        ) as response:
+            if response.status_code != 200:
+                yield "error", {"detail": f"请求失败: {response.status_code}"}
+                return
+            
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:") and event:
+                    yield event, json.loads(line[5:])
+    except requests.exceptions.RequestException as e:
+        yield "error", {"detail": f"请求发生错误: {str(e)}"}
+
+def get_reports(cursor=None, limit=100):
+    """获取报告列表（不含正文），按创建时间倒序；cursor 为上一页响应头 X-Next-Cursor 的值"""
+    params = {"limit": limit}
+    if cursor:
+        params["cursor"] = cursor
+    response = make_request("GET", "reports", params=params)
     if response and response.status_code == 200:
         return response.json()
     return []
 
+def get_report(report_id):
+    """获取报告详情（含全文）"""
+    response = make_request("GET", f"reports/{report_id}")
+    if response and response.status_code == 200:
+        return response.json()
+    return None
+
 def update_report(report_id, content):
     """更新报告内容"""
     data = {"content": content}
@@ -417,7 +505,7 @@ def show_home_page(user_info):
     st.markdown("## 系统概览")
     
     # 获取任务和报告数量
-    tasks = get_tasks()
+    tasks = get_tasks(excerpt=100)
     reports = get_reports()
     templates = get_templates()
     
@@ -501,7 +589,7 @@ def show_home_page(user_info):
                     <div style="font-size: 16px; font-weight: bold;">{task["title"]}</div>
                     <div style="color: #757575; font-size: 12px; margin: 5px 0;">创建时间: {created_at}</div>
                     <div style="font-size: 14px; margin-top: 10px; white-space: nowrap; overflow: hidden; text-overflow: ellipsis;">
-                        {task["description"][:100]}{"..." if len(task["description"]) > 100 else ""}
+                        {task["excerpt"]}{"..." if task["description_length"] > 100 else ""}
                     </div>
                 </div>
                 """, unsafe_allow_html=True)
@@ -588,7 +676,7 @@ def show_tasks_page():
                                       format_func=lambda id: next((t["title"] for t in tasks if t["id"] == id), ""))
         
         if selected_task_id:
-            selected_task = next((t for t in tasks if t["id"] == selected_task_id), None)
+            selected_task = get_task(selected_task_id)
             if selected_task:
                 st.subheader(f"任务详情: {selected_task['title']}")
                 created_at = selected_task['created_at']
@@ -619,24 +707,43 @@ def show_tasks_page():
                     )
                 
                 with col2:
-                    if st.button("生成报告", use_container_width=True):
-                        with st.spinner("生成报告中，请稍候..."):
-                            # 添加进度条显示
-                            progress_bar = st.progress(0)
-                            for i in range(100):
-                                time.sleep(0.03)
-                                progress_bar.progress(i + 1)
-                                
-                            template_id = selected_template if selected_template != 0 else None
-                            result = generate_report(selected_task_id, template_id)
-                            
-                        if result:
-                            st.success("报告生成成功!")
-                            st.session_state.generated_report_id = result["id"]
-                            st.session_state.current_page = "reports"
-                            st.experimental_rerun()
-                        else:
-                            st.error("报告生成失败")
+                    force_regenerate = st.checkbox("忽略缓存重新生成", value=False)
+                    generate_clicked = st.button("生成报告", use_container_width=True)
+                
+                if generate_clicked:
+                    template_id = selected_template if selected_template != 0 else None
+                    
+                    # 成功之前重新点击复用同一个幂等键，网络中断后重试不会重复生成报告
+                    request_params = (selected_task_id, template_id, force_regenerate)
+                    if st.session_state.get("generate_request_params") != request_params:
+                        st.session_state.generate_request_params = request_params
+                        st.session_state.generate_idempotency_key = uuid.uuid4().hex
+                    
+                    # 流式显示模型输出
+                    preview = st.empty()
+                    preview.info("生成报告中，请稍候...")
+                    content = ""
+                    report_id = None
+                    error = None
+                    for event, payload in generate_report_stream(
+                        selected_task_id, template_id, force_regenerate, st.session_state.generate_idempotency_key
+                    ):
+                        if event == "delta":
+                            content += payload["text"]
+                            preview.markdown(content)
+                        elif event == "done":
+                            report_id = payload["report_id"]
+                        elif event == "error":
+                            error = payload["detail"]
+                    
+                    if report_id:
+                        st.success("报告生成成功!")
+                        del st.session_state.generate_request_params
+                        st.session_state.generated_report_id = report_id
+                        st.session_state.current_page = "reports"
+                        st.experimental_rerun()
+                    else:
+                        st.error(error or "报告生成失败")
 
 # def show_templates_page():
 #     """模板管理页面"""
@@ -891,7 +998,7 @@ def show_templates_page():
                                           format_func=lambda id: next((f"{t['name']} ({t['id']})" for t in templates if t["id"] == id), ""))
         
         if selected_template_id:
-            selected_template = next((t for t in templates if t["id"] == selected_template_id), None)
+            selected_template = get_template(selected_template_id)
             if selected_template:
                 st.markdown(f"""
                 <div style="background-color:#f0f0f0; padding:15px; border-radius:5px;">
@@ -973,7 +1080,7 @@ def show_reports_page():
                                         format_func=lambda id: next((r["title"] for r in reports if r["id"] == id), ""))
         
         if selected_report_id:
-            selected_report = next((r for r in reports if r["id"] == selected_report_id), None)
+            selected_report = get_report(selected_report_id)
             if selected_report:
                 st.subheader(f"报告详情: {selected_report['title']}")
                 created_at = selected_report['created_at']
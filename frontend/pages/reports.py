@@ -1,6 +1,6 @@
 import streamlit as st
 import pandas as pd
-from frontend.utils.api import get_reports, update_report
+from frontend.utils.api import get_report, get_reports, update_report
 import time
 
 
@@ -45,7 +45,7 @@ def show_reports_page():
                                         format_func=lambda id: next((r["title"] for r in reports if r["id"] == id), ""))
         
         if selected_report_id:
-            selected_report = next((r for r in reports if r["id"] == selected_report_id), None)
+            selected_report = get_report(selected_report_id)
             if selected_report:
                 st.subheader(f"报告详情: {selected_report['title']}")
                 created_at = selected_report['created_at'].split('T')[0] if 'T' in selected_report['created_at'] else selected_report['created_at']
@@ -1,6 +1,6 @@
 import streamlit as st
 import pandas as pd
-from frontend.utils.api import get_tasks, create_task, generate_report, get_templates
+from frontend.utils.api import get_task, get_tasks, create_task, generate_report, get_templates
 from typing import Dict, Any
 
 def show_tasks_page():
@@ -53,7 +53,7 @@ def show_tasks_page():
                                       format_func=lambda id: next((t["title"] for t in tasks if t["id"] == id), ""))
         
         if selected_task_id:
-            selected_task = next((t for t in tasks if t["id"] == selected_task_id), None)
+            selected_task = get_task(selected_task_id)
             if selected_task:
                 st.subheader(f"任务详情: {selected_task['title']}")
                 st.write(f"**创建时间**: {selected_task['created_at'].split('T')[0]}")
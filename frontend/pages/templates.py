@@ -1,6 +1,6 @@
 import streamlit as st
 import pandas as pd
-from frontend.utils.api import get_templates, create_template
+from frontend.utils.api import get_template, get_templates, create_template
 
 def show_templates_page():
     """模板管理页面"""
@@ -53,7 +53,7 @@ def show_templates_page():
                                           format_func=lambda id: next((t["name"] for t in templates if t["id"] == id), ""))
         
         if selected_template_id:
-            selected_template = next((t for t in templates if t["id"] == selected_template_id), None)
+            selected_template = get_template(selected_template_id)
             if selected_template:
                 st.subheader(f"模板详情: {selected_template['name']}")
                 st.write(f"**创建时间**: {selected_template['created_at'].split('T')[0]}")
@@ -1,11 +1,16 @@
 import requests
 import streamlit as st
 import json
+import time
 from typing import Any, Dict, List, Optional, Union
 
 # API基础URL
 API_BASE_URL = "http://localhost:8000/api"
 
+# 报告生成任务轮询配置（秒）
+REPORT_JOB_POLL_INTERVAL = 2
+REPORT_JOB_TIMEOUT = 600
+
 def make_request(
     method: str,
     endpoint: str,
@@ -133,13 +138,24 @@ def get_user_info() -> Optional[Dict[str, Any]]:
         return response.json()
     return None
 
-def get_tasks(skip: int = 0, limit: int = 100) -> List[Dict[str, Any]]:
-    """获取任务列表"""
-    response = make_request("GET", f"tasks?skip={skip}&limit={limit}")
+def get_tasks(cursor: Optional[str] = None, limit: int = 100, excerpt: int = 0) -> List[Dict[str, Any]]:
+    """获取任务列表（不含描述全文），按创建时间倒序；cursor 为上一页响应头 X-Next-Cursor 的值，
+    excerpt 大于0时返回描述开头的字数"""
+    params = {"limit": limit, "excerpt": excerpt}
+    if cursor:
+        params["cursor"] = cursor
+    response = make_request("GET", "tasks", params=params)
     if response and response.status_code == 200:
         return response.json()
     return []
 
+def get_task(task_id: int) -> Optional[Dict[str, Any]]:
+    """获取任务详情（含全文）"""
+    response = make_request("GET", f"tasks/{task_id}")
+    if response and response.status_code == 200:
+        return response.json()
+    return None
+
 def create_task(title: str, description: str) -> Optional[Dict[str, Any]]:
     """创建新任务"""
     data = {"title": title, "description": description}
@@ -148,13 +164,23 @@ def create_task(title: str, description: str) -> Optional[Dict[str, Any]]:
         return response.json()
     return None
 
-def get_templates(skip: int = 0, limit: int = 100) -> List[Dict[str, Any]]:
-    """获取模板列表"""
-    response = make_request("GET", f"templates?skip={skip}&limit={limit}")
+def get_templates(cursor: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+    """获取模板列表（不含模板内容），按创建时间倒序；cursor 为上一页响应头 X-Next-Cursor 的值"""
+    params = {"limit": limit}
+    if cursor:
+        params["cursor"] = cursor
+    response = make_request("GET", "templates", params=params)
     if response and response.status_code == 200:
         return response.json()
     return []
 
+def get_template(template_id: int) -> Optional[Dict[str, Any]]:
+    """获取模板详情（含全文）"""
+    response = make_request("GET", f"templates/{template_id}")
+    if response and response.status_code == 200:
+        return response.json()
+    return None
+
 def create_template(name: str, content: str) -> Optional[Dict[str, Any]]:
     """创建新模板"""
     data = {"name": name, "content": content}
@@ -170,17 +196,48 @@ def generate_report(task_id: int, template_id: Optional[int] = None) -> Optional
         data["template_id"] = template_id
         
     response = make_request("POST", "reports/generate", data=data)
+    if not response or response.status_code != 202:
+        return None
+    
+    # 轮询生成任务，直到完成或超时
+    job = response.json()
+    deadline = time.time() + REPORT_JOB_TIMEOUT
+    while job["status"] in ("queued", "running") and time.time() < deadline:
+        time.sleep(REPORT_JOB_POLL_INTERVAL)
+        response = make_request("GET", f"reports/jobs/{job['id']}")
+        if not response or response.status_code != 200:
+            return None
+        job = response.json()
+    
+    if job["status"] in ("queued", "running"):
+        # 超时放弃时取消任务，避免后台继续占用模型调用额度
+        make_request("DELETE", f"reports/jobs/{job['id']}")
+        return None
+    if job["status"] != "done":
+        return None
+    
+    response = make_request("GET", f"reports/{job['report_id']}")
     if response and response.status_code == 200:
         return response.json()
     return None
 
-def get_reports(skip: int = 0, limit: int = 100) -> List[Dict[str, Any]]:
-    """获取报告列表"""
-    response = make_request("GET", f"reports?skip={skip}&limit={limit}")
+def get_reports(cursor: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+    """获取报告列表（不含正文），按创建时间倒序；cursor 为上一页响应头 X-Next-Cursor 的值"""
+    params = {"limit": limit}
+    if cursor:
+        params["cursor"] = cursor
+    response = make_request("GET", "reports", params=params)
     if response and response.status_code == 200:
         return response.json()
     return []
 
+def get_report(report_id: int) -> Optional[Dict[str, Any]]:
+    """获取报告详情（含全文）"""
+    response = make_request("GET", f"reports/{report_id}")
+    if response and response.status_code == 200:
+        return response.json()
+    return None
+
 def update_report(report_id: int, content: str) -> Optional[Dict[str, Any]]:
     """更新报告内容"""
     data = {"content": content}
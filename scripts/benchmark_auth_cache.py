@@ -0,0 +1,72 @@
+# scripts/benchmark_auth_cache.py
+
+import sys
+import os
+import argparse
+import asyncio
+import time
+import uuid
+
+# 添加项目根目录到路径
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import httpx
+
+from app.config import settings
+from app.database import async_engine
+from app.main import app
+from app.services import user_cache  # 按配置的TTL创建缓存，之后只切换开关
+from app.utils.metrics import registry
+
+
+async def run(client: httpx.AsyncClient, headers: dict, requests: int, concurrency: int) -> float:
+    """并发请求 /users/me，返回每秒请求数"""
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            response = await client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return requests / (time.perf_counter() - started)
+
+
+def db_queries() -> int:
+    return sum(
+        int(float(line.rsplit(" ", 1)[1]))
+        for line in registry.render().splitlines()
+        if line.startswith('db_query_duration_seconds_count{operation="select"}')
+    )
+
+
+async def main(args):
+    ttl = settings.AUTH_USER_CACHE_TTL_SECONDS
+    if ttl <= 0:
+        print("AUTH_USER_CACHE_TTL_SECONDS 为0，未启用用户缓存")
+        return
+    username = f"bench_{uuid.uuid4().hex[:8]}"
+    async with httpx.AsyncClient(app=app, base_url="http://benchmark") as client:
+        await client.post(f"{settings.API_V1_STR}/auth/register", json={
+            "username": username, "email": f"{username}@example.com", "password": "benchmark", "role": "student"
+        })
+        response = await client.post(
+            f"{settings.API_V1_STR}/auth/login", data={"username": username, "password": "benchmark"}
+        )
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        for name, cache_ttl in (("无缓存", 0), ("有缓存", ttl)):
+            settings.AUTH_USER_CACHE_TTL_SECONDS = cache_ttl
+            await run(client, headers, args.concurrency, args.concurrency)  # 预热
+            queries = db_queries()
+            rps = await run(client, headers, args.requests, args.concurrency)
+            print(f"{name}: {rps:.0f} 请求/秒，查询语句 {db_queries() - queries} 条")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对比启用、不启用用户缓存时认证请求的吞吐量")
+    parser.add_argument("--requests", type=int, default=2000, help="每轮请求数")
+    parser.add_argument("--concurrency", type=int, default=20, help="并发数")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,91 @@
+# scripts/benchmark_db_concurrency.py
+
+import sys
+import os
+import argparse
+import asyncio
+import statistics
+import time
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+
+from backend.app.database import AsyncSessionLocal, SessionLocal, async_engine, engine
+
+
+def slow_query(dialect: str, seconds: float):
+    """模拟慢查询：PostgreSQL 用 pg_sleep，SQLite 用递归计数占用相近的时间"""
+    if dialect == "postgresql":
+        return text("SELECT pg_sleep(:seconds)").bindparams(seconds=seconds)
+    return text(
+        "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < :n) SELECT count(*) FROM c"
+    ).bindparams(n=int(seconds * 5_000_000))
+
+
+async def sync_request(statement):
+    """改造前的写法：async 接口里直接使用同步会话，查询期间阻塞事件循环"""
+    db = SessionLocal()
+    try:
+        db.execute(statement)
+    finally:
+        db.close()
+
+
+async def async_request(statement):
+    async with AsyncSessionLocal() as db:
+        await db.execute(statement)
+
+
+async def heartbeat(stop: asyncio.Event, interval: float, lags: list):
+    """每隔 interval 秒醒来一次，记录实际延迟，反映事件循环被阻塞的程度"""
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - expected)
+
+
+async def run(name: str, request, statement, concurrency: int, rounds: int):
+    latencies = []
+    lags = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(heartbeat(stop, 0.01, lags))
+
+    async def timed(issued: float):
+        # 从请求发出时计时，包含被其他请求阻塞的排队时间
+        await request(statement)
+        latencies.append(time.perf_counter() - issued)
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        issued = time.perf_counter()
+        await asyncio.gather(*(timed(issued) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+
+    latencies.sort()
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    print(
+        f"{name:>5}: 总耗时 {elapsed:.2f}s, 请求耗时中位数 {statistics.median(latencies) * 1000:.0f}ms, "
+        f"p95 {p95 * 1000:.0f}ms, 事件循环最大延迟 {max(lags, default=0) * 1000:.0f}ms"
+    )
+
+
+async def main(args):
+    statement = slow_query(engine.dialect.name, args.query_seconds)
+    # 预热连接池
+    await async_request(text("SELECT 1"))
+    await sync_request(text("SELECT 1"))
+    await run("sync", sync_request, statement, args.concurrency, args.rounds)
+    await run("async", async_request, statement, args.concurrency, args.rounds)
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对比同步会话和异步会话在并发请求下的延迟")
+    parser.add_argument("--concurrency", type=int, default=20, help="每轮并发请求数")
+    parser.add_argument("--rounds", type=int, default=5, help="轮数")
+    parser.add_argument("--query-seconds", type=float, default=0.05, help="每次模拟查询的耗时（秒）")
+    asyncio.run(main(parser.parse_args()))
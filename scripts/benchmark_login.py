@@ -0,0 +1,87 @@
+# scripts/benchmark_login.py
+
+import sys
+import os
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+# 添加项目根目录到路径
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+# 压测从同一IP发起，关闭IP限流
+os.environ.setdefault("LOGIN_THROTTLE_IP_ATTEMPTS", "0")
+
+import httpx
+
+from app.config import settings
+from app.database import async_engine
+from app.main import app
+from app.utils import security
+
+
+async def _inline_hash(operation, fn, *args):
+    """改动前的做法：直接在事件循环中计算"""
+    return fn(*args)
+
+
+async def measure_lag(stop: asyncio.Event, samples: list):
+    """每10毫秒唤醒一次，记录实际唤醒时间比预期晚了多少"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.01)
+        samples.append(time.perf_counter() - started - 0.01)
+
+
+async def run(client: httpx.AsyncClient, usernames: list, password: str):
+    """所有用户同时登录，返回登录耗时和事件循环延迟"""
+    latencies, lags = [], []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_lag(stop, lags))
+
+    async def login(username):
+        started = time.perf_counter()
+        response = await client.post(
+            f"{settings.API_V1_STR}/auth/login", data={"username": username, "password": password}
+        )
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(login(username) for username in usernames))
+    stop.set()
+    await lag_task
+    return latencies, lags
+
+
+def p99(values: list) -> float:
+    return statistics.quantiles(values, n=100)[98] if len(values) > 1 else values[0]
+
+
+async def main(args):
+    password = "benchmark"
+    prefix = f"bench_{uuid.uuid4().hex[:6]}"
+    usernames = [f"{prefix}_{i}" for i in range(args.users)]
+    async with httpx.AsyncClient(app=app, base_url="http://benchmark") as client:
+        for username in usernames:
+            await client.post(f"{settings.API_V1_STR}/auth/register", json={
+                "username": username, "email": f"{username}@example.com", "password": password, "role": "student"
+            })
+
+        run_hash = security._run_hash
+        for name, runner in (("事件循环内计算", _inline_hash), ("密码哈希线程池", run_hash)):
+            security._run_hash = runner
+            latencies, lags = await run(client, usernames, password)
+            print(
+                f"{name}: 登录 p50 {statistics.median(latencies) * 1000:.0f}ms / p99 {p99(latencies) * 1000:.0f}ms，"
+                f"事件循环最大延迟 {max(lags, default=0) * 1000:.0f}ms"
+            )
+        security._run_hash = run_hash
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对比并发登录时在事件循环内、在线程池中计算 bcrypt 的登录耗时和事件循环延迟")
+    parser.add_argument("--users", type=int, default=40, help="同时登录的用户数")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,30 @@
+# scripts/build_report_signatures.py
+
+import sys
+import os
+import argparse
+import logging
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.app.database import Base, engine, SessionLocal
+from backend.app.services.duplicate_detection import rebuild_signatures
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="为已有报告计算查重签名")
+    parser.add_argument("--all", action="store_true", help="重建全部报告的签名（修改查重配置后使用）")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        rebuild_signatures(db, only_missing=not args.all)
+    finally:
+        db.close()
@@ -0,0 +1,75 @@
+# scripts/ingest_knowledge.py
+
+import sys
+import os
+import argparse
+import asyncio
+import logging
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.app.database import Base, engine, SessionLocal
+from backend.app.models.task import Task
+from backend.app.models.report import Report
+from backend.app.services.http_client import init_http_client, close_http_client
+from backend.app.services.knowledge_base import (
+    KnowledgeDocument, extract_text, ingest_many, task_document, report_document, ensure_vector_index
+)
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = (".docx", ".txt", ".md")
+
+# 每批入库的来源数，同一批的切片合并向量化
+BATCH_SIZE = 50
+
+async def ingest_all(manual_dir=None, include_tasks=False, report_ids=()):
+    """批量增量入库：目录下的实训手册、全部任务书、指定的范例报告，内容未变化的切片不会重新向量化"""
+    init_http_client()
+    db = SessionLocal()
+    total = 0
+    try:
+        documents = []
+        if manual_dir:
+            for name in sorted(os.listdir(manual_dir)):
+                if not name.lower().endswith(SUPPORTED_EXTENSIONS):
+                    continue
+                with open(os.path.join(manual_dir, name), "rb") as f:
+                    content = extract_text(name, f.read())
+                documents.append(KnowledgeDocument("manual", name, os.path.splitext(name)[0], content))
+
+        if include_tasks:
+            documents.extend(task_document(task) for task in db.query(Task).order_by(Task.id).all())
+
+        for report_id in report_ids:
+            report = db.query(Report).filter(Report.id == report_id).first()
+            if report is None:
+                logger.warning(f"报告不存在: {report_id}")
+                continue
+            documents.append(report_document(report))
+
+        for i in range(0, len(documents), BATCH_SIZE):
+            total += await ingest_many(db, documents[i:i + BATCH_SIZE])
+    finally:
+        db.close()
+        await close_http_client()
+
+    logger.info(f"入库完成，新写入切片: {total}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="知识库入库")
+    parser.add_argument("--manuals", help="实训手册目录（.docx/.txt/.md）")
+    parser.add_argument("--tasks", action="store_true", help="全部任务书入库")
+    parser.add_argument("--reports", type=int, nargs="*", default=[], help="作为范例入库的报告ID")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    ensure_vector_index()
+    asyncio.run(ingest_all(args.manuals, args.tasks, args.reports))
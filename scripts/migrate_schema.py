@@ -0,0 +1,52 @@
+# scripts/migrate_schema.py
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import inspect, text
+from backend.app.database import engine
+
+# 已有数据库需要补充的字段：(表名, 字段名, 字段定义)。新表由应用启动时的 create_all 创建
+NEW_COLUMNS = [
+    ("reports", "prompt_tokens", "INTEGER"),
+    ("reports", "prompt_truncated", "BOOLEAN DEFAULT FALSE"),
+    ("knowledge_chunks", "content_hash", "VARCHAR(64)"),
+]
+
+# 需要补充的索引
+NEW_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_knowledge_chunks_content_hash ON knowledge_chunks (content_hash)",
+    "CREATE INDEX IF NOT EXISTS ix_tasks_user_created ON tasks (user_id, created_at DESC, id)",
+    "CREATE INDEX IF NOT EXISTS ix_reports_user_created ON reports (user_id, created_at DESC, id)",
+    "CREATE INDEX IF NOT EXISTS ix_templates_user_created ON templates (user_id, created_at DESC, id)",
+]
+
+def migrate_schema():
+    """为已有数据库补充新增字段和索引，可重复执行"""
+    try:
+        inspector = inspect(engine)
+        tables = set(inspector.get_table_names())
+        with engine.begin() as conn:
+            for table, column, definition in NEW_COLUMNS:
+                # 表尚不存在时由应用启动时的 create_all 按最新结构创建
+                if table not in tables:
+                    continue
+                existing = {c["name"] for c in inspector.get_columns(table)}
+                if column in existing:
+                    continue
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+                print(f"已添加字段 {table}.{column}")
+
+            for statement in NEW_INDEXES:
+                table = statement.split(" ON ")[1].split()[0]
+                if table in tables:
+                    conn.execute(text(statement))
+
+        print("数据库结构迁移完成")
+
+    except Exception as e:
+        print(f"迁移失败: {str(e)}")
+
+if __name__ == "__main__":
+    migrate_schema()